@@ -0,0 +1,355 @@
+"""
+End-to-End Benchmark
+Drives complete complaint scenarios (intake chat -> report -> form selection ->
+form filling) through the FastAPI app with a scripted replay model, then runs
+micro-benchmarks of the heavy helpers. Results are written as JSON so runs can
+be compared over time.
+
+Nothing here calls Gemini or Supabase: the model is a ReplayProvider built from
+a script, and its recorded latencies are scaled by --speed (0 = no model time,
+so only our own overhead is measured).
+
+Usage (from backend/):
+    python benchmarks/e2e.py
+    python benchmarks/e2e.py --scenarios 20 --speed 0.1 --output results.json
+    python benchmarks/e2e.py --compare baseline.json
+    python benchmarks/e2e.py --artifacts url       # PDFs as downloads instead of base64
+"""
+
+import argparse
+import ast
+import io
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+FORM = "CLC Unjust Dismissal"
+
+INTAKE_QUESTIONS = [
+    "Hi. How can I help you? What happened at work?",
+    "What's your name?",
+    "What company were you working at and what is/was your job title?",
+    "Where is the company located?",
+    "When did this happen?",
+]
+
+REPORT = """START_REPORT
+Name: Jordan Lee
+Employer: Northern Freight Ltd., Kamloops BC, dispatcher, employed since March 2019.
+On June 3 the employee was dismissed without notice after raising unpaid overtime
+with their supervisor. No written reasons were given and final pay was withheld
+for two weeks. The employee is not a manager and is not in a union.
+END_REPORT"""
+
+
+def _percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        "runs": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def build_script(field_names, latency):
+    """
+    Scripted model replies for one scenario: an intake chat that ends in a
+    report, a form selection reply, and a form chat that fills a few fields
+    per turn before saying FORM_COMPLETE.
+    """
+    intake_turns = [{"text": q, "latency": latency} for q in INTAKE_QUESTIONS]
+    intake_turns.append({"text": REPORT, "latency": latency * 2})
+
+    form_turns = []
+    for start in range(0, len(field_names), 5):
+        patch = {name: f"Answer {i}" for i, name in enumerate(field_names[start:start + 5], start)}
+        form_turns.append({
+            "text": f"Thanks. START_PATCH {json.dumps(patch)} END_PATCH What else can you tell me?",
+            "latency": latency,
+        })
+    form_turns.append({"text": "That is everything I need. FORM_COMPLETE", "latency": latency})
+
+    return {
+        # Chats are handed out in creation order: the intake chat, then the form chat
+        "chats": [{"turns": intake_turns}, {"turns": form_turns}],
+        "generations": [{
+            "text": f"The {FORM} form fits your situation best. Would you like me to fill it out for you?",
+            "latency": latency * 3,
+        }],
+    }
+
+
+def make_exhibits(directory):
+    """A photo-sized PNG and a two-page PDF to upload with every scenario."""
+    from PIL import Image
+    from services.file_handler import render_text_pdf
+
+    photo = os.path.join(directory, "photo.png")
+    Image.effect_noise((2400, 1800), 64).convert("RGB").save(photo)
+
+    letter = os.path.join(directory, "termination_letter.pdf")
+    with open(letter, "wb") as f:
+        f.write(render_text_pdf("We regret to inform you that your employment has ended.\n" * 120,
+                                title="Termination Letter"))
+    return [photo, letter]
+
+
+def run_scenario(client, index, exhibits, form_turns, artifacts="base64"):
+    """
+    One complaint from the first message to the filled form.
+
+    Args:
+        artifacts: How the finished PDFs are returned, see ChatRequest.artifacts
+
+    Returns:
+        Tuple of ({step: milliseconds}, {artifact filename: size in bytes})
+    """
+    session_id = f"bench-{index}"
+    steps = {}
+
+    def step(name, fn):
+        response, ms = _timed(fn)
+        response.raise_for_status()
+        steps[name] = steps.get(name, 0) + ms
+        return response.json()
+
+    for _ in INTAKE_QUESTIONS:
+        step("intake", lambda: client.post("/chat", json={"message": "My employer fired me.", "session_id": session_id}))
+    reply = step("intake_report", lambda: client.post("/chat", json={"message": "That is all.", "session_id": session_id}))
+    assert reply["is_report"], "the scripted intake did not end in a report"
+
+    for path in exhibits:
+        with open(path, "rb") as f:
+            content = f.read()
+        name = f"{index}_{os.path.basename(path)}"
+        step("upload", lambda: client.post("/upload", files={"file": (name, content)},
+                                               data={"session_id": session_id}))
+
+    step("confirm_report", lambda: client.post("/confirm-report", data={"confirmed": "true"}))
+    # A different report every scenario, so form selection is never a cache hit
+    step("form_select", lambda: client.post("/after-report?wait=true",
+                                            json={"message": f"{reply['reply']}\nCase {index}",
+                                                  "session_id": session_id}))
+
+    step("form_fill", lambda: client.post("/chat", json={"message": "yes", "session_id": session_id}))
+    for _ in range(form_turns - 2):
+        step("form_fill", lambda: client.post("/chat", json={"message": "Here is more detail.",
+                                                                  "session_id": session_id}))
+    finish = {"message": "Done.", "session_id": session_id, "artifacts": artifacts}
+    if artifacts == "multipart":
+        response, ms = _timed(lambda: client.post("/chat", json=finish))
+        response.raise_for_status()
+        steps["finalize"] = ms
+        sizes = {}
+        for part in response.content.split(b"\r\n--")[1:-1]:
+            headers, _, body = part.partition(b"\r\n\r\n")
+            filename = re.search(rb'filename="([^"]+)"', headers)
+            if filename:
+                sizes[filename.group(1).decode()] = len(body)
+    else:
+        final = step("finalize", lambda: client.post("/chat", json=finish))
+        if artifacts == "url":
+            sizes = {}
+            for pdf in final["pdfs"]:
+                response, ms = _timed(lambda: client.get(pdf["url"]))
+                response.raise_for_status()
+                steps["download"] = steps.get("download", 0) + ms
+                sizes[pdf["filename"]] = len(response.content)
+        else:
+            import base64
+            sizes = {pdf["filename"]: len(base64.b64decode(pdf["pdf_base64"])) for pdf in final["pdfs"]}
+    assert "filled_form.pdf" in sizes, "the scenario did not finish the form"
+    return steps, sizes
+
+
+def run_e2e(scenarios, speed, latency, artifacts="base64"):
+    import main
+    from fastapi.testclient import TestClient
+    from services import gemini_client
+    from services.llm_provider import ReplayProvider
+    from services.metrics import STAGE_SECONDS
+    from services.form_engine import load_template
+
+    fields = load_template(f"{FORM}.pdf").fields
+    field_names = [name for name, info in fields.items() if info.get("/FT") == "/Tx"][:20]
+    script = build_script(field_names, latency)
+    gemini_client.provider = ReplayProvider(script, speed=speed)
+    form_turns = len(script["chats"][1]["turns"])
+
+    upload_dir = tempfile.mkdtemp(prefix="e2e_uploads_")
+    main.UPLOAD_DIR = upload_dir
+    exhibits = make_exhibits(tempfile.mkdtemp(prefix="e2e_exhibits_"))
+
+    step_samples = {}
+    sizes = {}
+    with TestClient(main.app) as client:
+        start = time.perf_counter()
+        for i in range(scenarios):
+            steps, sizes = run_scenario(client, i, exhibits, form_turns, artifacts)
+            for name, ms in steps.items():
+                step_samples.setdefault(name, []).append(ms)
+        elapsed = time.perf_counter() - start
+
+    scenario_ms = [sum(step_samples[name][i] for name in step_samples) for i in range(scenarios)]
+    return {
+        "scenarios": scenarios,
+        "replay_speed": speed,
+        "model_latency_s": latency,
+        "artifacts": artifacts,
+        "throughput_per_s": round(scenarios / elapsed, 3),
+        "scenario": _percentiles(scenario_ms),
+        "steps": {name: _percentiles(samples) for name, samples in step_samples.items()},
+        "server_stages": STAGE_SECONDS.summary(),
+        "artifact_bytes": sizes,
+    }
+
+
+def _load_chunk_text():
+    # database/ingest.py connects to Supabase at import time, so take the
+    # function's source out of the file instead of importing the module
+    path = os.path.join(REPO_DIR, "database", "ingest.py")
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    node = next(n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name == "chunk_text")
+    namespace = {"re": re}
+    exec(compile(ast.Module(body=[node], type_ignores=[]), path, "exec"), namespace)
+    return namespace["chunk_text"]
+
+
+def run_micro(runs):
+    import main
+    from services.file_handler import combine_pdfs, text_to_pdf
+    from services.pdf_form_handler_class import PDFFormFiller
+
+    work_dir = tempfile.mkdtemp(prefix="e2e_micro_")
+    exhibits = make_exhibits(work_dir)
+    long_text = ("The employer did not pay overtime for the hours worked in May. " * 40 + "\n\n") * 50
+    filler = PDFFormFiller(f"{FORM}.pdf")
+    form_data = {name: f"Value {i}" for i, name in enumerate(filler.fields)}
+    chunk_text = _load_chunk_text()
+
+    def forms_context_cold():
+        main.load_forms_context.cache_clear()
+        return main.load_forms_context()
+
+    benchmarks = {
+        "chunk_text": lambda: chunk_text(long_text),
+        "combine_pdfs": lambda: combine_pdfs(exhibits, io.BytesIO()),
+        "text_to_pdf": lambda: text_to_pdf(long_text, os.path.join(work_dir, "text.pdf"), title="Report"),
+        "fill_form": lambda: filler.fill_form(form_data, io.BytesIO()),
+        "load_forms_context": forms_context_cold,
+    }
+
+    results = {}
+    for name, fn in benchmarks.items():
+        fn()  # warm up imports and caches that only the first call pays for
+        results[name] = _percentiles([_timed(fn)[1] for _ in range(runs)])
+    results["chunk_text"]["input_chars"] = len(long_text)
+    return results
+
+
+def compare(current, baseline_path):
+    """Print how the mean timings moved against an earlier results file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    rows = [("scenario", baseline["e2e"]["scenario"], current["e2e"]["scenario"])]
+    rows += [(f"step {name}", baseline["e2e"]["steps"].get(name), stats)
+             for name, stats in current["e2e"]["steps"].items()]
+    rows += [(f"micro {name}", baseline["micro"].get(name), stats)
+             for name, stats in current["micro"].items()]
+
+    print(f"\nCompared with {baseline_path} ({baseline.get('git_commit')})")
+    for label, before, after in rows:
+        if not before:
+            continue
+        change = (after["mean_ms"] - before["mean_ms"]) / before["mean_ms"] * 100 if before["mean_ms"] else 0
+        print(f"  {label:28} {before['mean_ms']:10.2f} -> {after['mean_ms']:10.2f} ms  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the complaint pipeline")
+    parser.add_argument("--scenarios", type=int, default=5, help="complete scenarios to run")
+    parser.add_argument("--speed", type=float, default=0.0, help="scale for scripted model latency, 0 skips it")
+    parser.add_argument("--latency", type=float, default=0.5, help="scripted seconds per model reply")
+    parser.add_argument("--micro-runs", type=int, default=10, help="runs per micro-benchmark")
+    parser.add_argument("--artifacts", choices=["base64", "url", "multipart"], default="base64",
+                        help="how the finished PDFs are returned")
+    parser.add_argument("--output", default="benchmarks/e2e_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Plain prints would swamp the timings, the benchmark reports its own numbers
+    os.environ.setdefault("LOG_MODE", "off")
+    # Measure the default durable store, in a throwaway database
+    os.environ.setdefault("SESSION_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="e2e_sessions_"), "sessions.db"))
+    os.environ.setdefault("ARTIFACT_DIR", tempfile.mkdtemp(prefix="e2e_artifacts_"))
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "e2e": run_e2e(args.scenarios, args.speed, args.latency, args.artifacts),
+        "micro": run_micro(args.micro_runs),
+    }
+    results["peak_rss_mb"] = _peak_rss_mb()
+
+    e2e = results["e2e"]
+    print(f"{e2e['scenarios']} scenarios, {e2e['throughput_per_s']} scenarios/s, "
+          f"p50 {e2e['scenario']['p50_ms']:.1f} ms, p95 {e2e['scenario']['p95_ms']:.1f} ms")
+    for name, stats in e2e["steps"].items():
+        print(f"  {name:16} mean {stats['mean_ms']:9.2f} ms   p95 {stats['p95_ms']:9.2f} ms")
+    print("Artifacts: " + ", ".join(f"{name} {size / 1024:.1f} KB" for name, size in e2e["artifact_bytes"].items()))
+    print("Micro-benchmarks:")
+    for name, stats in results["micro"].items():
+        print(f"  {name:20} mean {stats['mean_ms']:9.2f} ms   p50 {stats['p50_ms']:9.2f} ms")
+    print(f"Peak RSS: {results['peak_rss_mb']['self']} MB (workers {results['peak_rss_mb']['children']} MB)")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
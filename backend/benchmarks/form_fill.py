@@ -0,0 +1,89 @@
+"""
+Form Filling Benchmark
+Times repeated fills of the bundled forms with services/form_engine.py
+against the previous fill path, which parsed the PDF on every call and gave
+pypdf every value for every page.
+
+Usage (from backend/):
+    python benchmarks/form_fill.py
+    python benchmarks/form_fill.py --fills 10
+"""
+
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ.setdefault("LOG_MODE", "off")
+
+from pypdf import PdfReader, PdfWriter
+
+from services.form_engine import load_template
+
+FORMS = [
+    "BC Employers Standards Act Complaint Form",
+    "BC HRT Individual Complaint",
+    "CHRC Individual",
+    "CIRB Part II Reprisal Complaint Form",
+    "CIRB Part III Reprisal Complaint Form",
+    "CLC Monetary and Non-Monetary",
+    "CLC Trucking Monetary and Non-Monetary",
+    "CLC Unjust Dismissal",
+]
+
+
+def _previous_fill(pdf_path, values):
+    """The fill path both form handlers used before the engine."""
+    reader = PdfReader(pdf_path)
+    writer = PdfWriter()
+    writer.clone_reader_document_root(reader)
+    for page in writer.pages:
+        try:
+            writer.update_page_form_field_values(page, values)
+        except Exception:
+            pass
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _engine_fill(pdf_path, values):
+    return load_template(pdf_path).fill(values, optimize=False, flatten=False)
+
+
+def _median_ms(fn, fills):
+    times = []
+    for _ in range(fills):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repeated form fills, previous path vs form engine")
+    parser.add_argument("--fills", type=int, default=5, help="fills per form, the median is shown")
+    args = parser.parse_args()
+    # pypdf warns about every page without fields
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+
+    print(f"  {'':42s} {'previous':>10s} {'engine':>10s} {'speedup':>8s}")
+    for form in FORMS:
+        pdf_path = f"{form}.pdf"
+        values = {name: "Sample" for name, info in load_template(pdf_path).fields.items()
+                  if info.get("/FT") == "/Tx"}
+        _engine_fill(pdf_path, values)  # the first fill parses the template, later ones reuse it
+
+        previous = _median_ms(lambda: _previous_fill(pdf_path, values), args.fills)
+        engine = _median_ms(lambda: _engine_fill(pdf_path, values), args.fills)
+        print(f"  {form[:42]:42s} {previous:7.1f} ms {engine:7.1f} ms {previous / engine:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
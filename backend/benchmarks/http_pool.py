@@ -0,0 +1,134 @@
+"""
+HTTP Pool Benchmark
+Runs sustained load against two local TLS stand-ins for Supabase and Gemini and
+counts TLS handshakes, comparing the shared pool with a fresh client per request.
+With the pool, handshakes should stay flat however many requests are sent.
+
+Usage (from backend/):
+    python benchmarks/http_pool.py
+    python benchmarks/http_pool.py --rounds 5 --requests 200 --threads 8
+"""
+
+import argparse
+import datetime
+import ipaddress
+import os
+import ssl
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.http_pool import PoolStats, create_http_client
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _self_signed_cert(directory: str):
+    """Write a throwaway certificate for 127.0.0.1 and return (cert_path, key_path)."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def _start_server(cert_path: str, key_path: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _run_round(send, urls, requests: int, threads: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda i: send(urls[i % len(urls)]), range(requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count TLS handshakes with and without the shared pool")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="requests per round")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert_path, key_path = _self_signed_cert(directory)
+        servers = [_start_server(cert_path, key_path) for _ in range(2)]
+        urls = [f"https://127.0.0.1:{server.server_address[1]}/rpc" for server in servers]
+        verify = ssl.create_default_context(cafile=cert_path)
+
+        print("Shared pool (stand-ins for Supabase and Gemini):")
+        stats = PoolStats()
+        client = create_http_client(verify=verify, stats=stats)
+        for round_number in range(1, args.rounds + 1):
+            seconds = _run_round(lambda url: client.post(url, json={}), urls, args.requests, args.threads)
+            snapshot = stats.snapshot()
+            print(f"  round {round_number}: {snapshot['requests']:5d} requests, "
+                  f"{snapshot['tls_handshakes']:3d} handshakes total, "
+                  f"{snapshot['saturated_waits']:4d} saturated waits, "
+                  f"{args.requests / seconds:7.1f} req/s")
+        client.close()
+
+        print("\nFresh client per request:")
+        fresh_stats = PoolStats()
+
+        def send_fresh(url):
+            with create_http_client(verify=verify, stats=fresh_stats) as fresh:
+                fresh.post(url, json={})
+
+        for round_number in range(1, args.rounds + 1):
+            seconds = _run_round(send_fresh, urls, args.requests, args.threads)
+            snapshot = fresh_stats.snapshot()
+            print(f"  round {round_number}: {snapshot['requests']:5d} requests, "
+                  f"{snapshot['tls_handshakes']:5d} handshakes total, "
+                  f"{args.requests / seconds:7.1f} req/s")
+
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Import Time Benchmark
+Measures how long `import main` takes in a fresh interpreter, using
+`python -X importtime`, and lists the slowest top-level imports.
+
+Usage (from backend/):
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --top 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module: str = "main"):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        Tuple of (cumulative microseconds for the module, {top-level package: cumulative microseconds})
+    """
+    # Credentials are removed on purpose: importing the app must not need them
+    env = {k: v for k, v in os.environ.items() if k not in ("GEMINI_API_KEY", "SUPABASE_URL", "SUPABASE_KEY")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    # Lines look like "import time:  self_us | cumulative_us |   name", nesting shown by indent
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, raw_name = line[len("import time:"):].split("|")
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        entries.append((depth, raw_name.strip(), int(cumulative_us)))
+
+    # Children are listed before their parent, so walk back from the module's own line
+    module_index = max(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == module)
+    total = entries[module_index][2]
+    packages = {}
+    for depth, name, cumulative_us in reversed(entries[:module_index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            packages[name] = cumulative_us
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend's import time")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    totals = []
+    packages = {}
+    for _ in range(args.runs):
+        total, run_packages = measure_import(args.module)
+        totals.append(total)
+        packages = run_packages
+
+    print(f"import {args.module}: median {statistics.median(totals) / 1000:.1f} ms "
+          f"(min {min(totals) / 1000:.1f} ms, max {max(totals) / 1000:.1f} ms, {args.runs} runs)")
+    print(f"\nSlowest imports (last run, cumulative):")
+    for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+PDF Flattening Benchmark
+Compares interactive and flattened (services/pdf_flatten.py) output of the
+eight bundled forms: file size, server fill time, and the time a viewer
+takes to open and render every page, measured with PyMuPDF as a stand-in for
+the browser viewer.
+
+Usage (from backend/):
+    python benchmarks/pdf_flatten.py
+    python benchmarks/pdf_flatten.py --repeat 5 --dpi 96
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ.setdefault("LOG_MODE", "off")
+
+from services.form_index import get_form_metadata, load_form_index
+from services.pdf_form_handler_class import PDFFormFiller
+
+FORMS = [
+    "BC Employers Standards Act Complaint Form",
+    "BC HRT Individual Complaint",
+    "CHRC Individual",
+    "CIRB Part II Reprisal Complaint Form",
+    "CIRB Part III Reprisal Complaint Form",
+    "CLC Monetary and Non-Monetary",
+    "CLC Trucking Monetary and Non-Monetary",
+    "CLC Unjust Dismissal",
+]
+
+
+def _sample_data(filler):
+    """Every text field filled and every checkbox or radio button turned on."""
+    data = {}
+    for name, info in get_form_metadata(filler.pdf_path)["fields"].items():
+        if info["kind"] == "text":
+            data[name] = "Sample"
+        elif info["kind"] in ("checkbox", "radio"):
+            states = [state for state in info["states"] if state != "/Off"]
+            if states:
+                data[name] = states[0]
+    return data
+
+
+def _fill(filler, data, flatten):
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    if not filler.fill_form(data, buffer, flatten=flatten):
+        raise RuntimeError(f"Filling {filler.pdf_path} failed")
+    return buffer.getvalue(), (time.perf_counter() - start) * 1000
+
+
+def _render(pdf_bytes, dpi):
+    import fitz
+
+    start = time.perf_counter()
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as document:
+        for page in document:
+            page.get_pixmap(dpi=dpi)
+    return (time.perf_counter() - start) * 1000
+
+
+def _measure(filler, data, flatten, repeat, dpi):
+    runs = [_fill(filler, data, flatten) for _ in range(repeat)]
+    pdf_bytes = runs[-1][0]
+    fill_ms = statistics.median(ms for _, ms in runs)
+    render_ms = statistics.median(_render(pdf_bytes, dpi) for _ in range(repeat))
+    return len(pdf_bytes), fill_ms, render_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interactive vs flattened filled forms")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the median is shown")
+    parser.add_argument("--dpi", type=int, default=96, help="render resolution")
+    args = parser.parse_args()
+    load_form_index([f"{form}.pdf" for form in FORMS])
+
+    print(f"  {'':42s} {'interactive':>31s}   {'flattened':>31s}")
+    print(f"  {'':42s} {'size':>9s} {'fill':>10s} {'render':>10s}   {'size':>9s} {'fill':>10s} {'render':>10s}")
+    for form in FORMS:
+        filler = PDFFormFiller(f"{form}.pdf")
+        data = _sample_data(filler)
+        _fill(filler, data, False)  # warm up the shared parsed template
+
+        interactive = _measure(filler, data, False, args.repeat, args.dpi)
+        flattened = _measure(filler, data, True, args.repeat, args.dpi)
+        print("  {:42s} {:6.0f} KB {:7.1f} ms {:7.1f} ms   {:6.0f} KB {:7.1f} ms {:7.1f} ms".format(
+            form[:42],
+            interactive[0] / 1024, interactive[1], interactive[2],
+            flattened[0] / 1024, flattened[1], flattened[2],
+        ))
+
+
+if __name__ == "__main__":
+    main()
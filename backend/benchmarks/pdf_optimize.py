@@ -0,0 +1,116 @@
+"""
+PDF Optimization Benchmark
+Compares output size and time with and without services/pdf_optimizer.py for
+the eight bundled forms and for synthetic exhibit bundles.
+
+Usage (from backend/):
+    python benchmarks/pdf_optimize.py
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+from services import exhibit_images
+from services.file_handler import combine_pdfs, render_text_pdf
+from services.pdf_form_handler_class import PDFFormFiller
+
+FORMS = [
+    "BC Employers Standards Act Complaint Form",
+    "BC HRT Individual Complaint",
+    "CHRC Individual",
+    "CIRB Part II Reprisal Complaint Form",
+    "CIRB Part III Reprisal Complaint Form",
+    "CLC Monetary and Non-Monetary",
+    "CLC Trucking Monetary and Non-Monetary",
+    "CLC Unjust Dismissal",
+]
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _fill(filler, data, optimize):
+    buffer = io.BytesIO()
+    if not filler.fill_form(data, buffer, optimize=optimize):
+        raise RuntimeError(f"Filling {filler.pdf_path} failed")
+    return buffer.getvalue()
+
+
+def _combine(files, optimize):
+    buffer = io.BytesIO()
+    combine_pdfs(files, buffer, optimize=optimize)
+    return buffer.getvalue()
+
+
+def _synthetic_exhibits(directory):
+    """A few exhibit sets: text letters, photos, and a duplicate upload."""
+    from PIL import Image
+    import numpy as np
+
+    letters = []
+    for n in range(8):
+        path = os.path.join(directory, f"letter_{n}.pdf")
+        with open(path, "wb") as f:
+            f.write(render_text_pdf(f"Letter {n}\n" + "Your employment is terminated effective today. " * 200))
+        letters.append(path)
+
+    rng = np.random.default_rng(0)
+    photos = []
+    for n in range(3):
+        path = os.path.join(directory, f"pay_stub_{n}.jpg")
+        pixels = (np.linspace(0, 255, 2000)[None, :, None] + rng.integers(0, 30, (1500, 2000, 3))).clip(0, 255)
+        Image.fromarray(pixels.astype("uint8")).save(path, quality=90)
+        photos.append(path)
+
+    duplicate = os.path.join(directory, "letter_0 (copy).pdf")
+    shutil.copy(letters[0], duplicate)
+
+    return {
+        "8 text letters": letters,
+        "3 photos": photos,
+        "letters + photos + duplicate": letters + photos + [duplicate],
+    }
+
+
+def _report(name, plain, optimized):
+    (plain_bytes, plain_ms), (optimized_bytes, optimized_ms) = plain, optimized
+    saved = 100 * (1 - len(optimized_bytes) / max(len(plain_bytes), 1))
+    print(f"  {name:45s} {len(plain_bytes) / 1024:9.1f} KB {plain_ms:8.1f} ms   "
+          f"{len(optimized_bytes) / 1024:9.1f} KB {optimized_ms:8.1f} ms   {saved:5.1f}% smaller")
+
+
+def main():
+    header = f"  {'':45s} {'plain':>12s} {'':>11s}   {'optimized':>12s} {'':>11s}"
+    print("Filled forms:")
+    print(header)
+    for form in FORMS:
+        filler = PDFFormFiller(f"{form}.pdf")
+        data = {name: "Sample" for name, info in filler.fields.items() if info["type"] == "/Tx"}
+        _fill(filler, data, False)  # warm up the shared parsed template
+        _report(form, _timed(lambda: _fill(filler, data, False)), _timed(lambda: _fill(filler, data, True)))
+
+    print("\nExhibit bundles:")
+    print(header)
+    with tempfile.TemporaryDirectory() as directory:
+        for name, files in _synthetic_exhibits(directory).items():
+            # Convert images first so both runs measure only bundling
+            for path in files:
+                if exhibit_images.is_image(path):
+                    exhibit_images.get_pdf_bytes(path)
+            _report(name, _timed(lambda: _combine(files, False)), _timed(lambda: _combine(files, True)))
+    exhibit_images.shutdown()
+
+
+if __name__ == "__main__":
+    main()
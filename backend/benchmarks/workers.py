@@ -0,0 +1,152 @@
+"""
+Worker Memory Benchmark
+Starts the API with several workers, once forked from a preloaded parent
+(serve.py) and once spawned by uvicorn (`uvicorn main:app --workers N`), and
+reports the memory of each worker: USS (pages only it uses) and PSS (its
+share of the pages it uses). A bare interpreter is measured as the baseline.
+
+Both modes parse the forms at startup, so the workers hold the same data.
+
+Needs Linux (/proc/<pid>/smaps_rollup).
+
+Usage (from backend/):
+    python benchmarks/workers.py
+    python benchmarks/workers.py --workers 4 --output workers.json
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def memory_mb(pid: int) -> dict:
+    """RSS, PSS and USS of a process in MB, from /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    uss = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return {
+        "rss": round(values.get("Rss", 0) / 1024, 1),
+        "pss": round(values.get("Pss", 0) / 1024, 1),
+        "uss": round(uss / 1024, 1),
+    }
+
+
+def _children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def _descendants(pid: int) -> list:
+    found = []
+    for child in _children(pid):
+        found.append(child)
+        found.extend(_descendants(child))
+    return found
+
+
+def measure(command: list, port: int, workers: int, requests: int, timeout: float = 120) -> dict:
+    """
+    Start a server, wait until every worker is up, send some requests, and
+    measure the parent and each worker.
+    """
+    env = dict(os.environ, PRELOAD_FORMS="1", LOG_MODE="off")
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{' '.join(command)} exited with status {process.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{' '.join(command)} did not start within {timeout}s")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.2)
+        for _ in range(requests):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/forms", timeout=30).read()
+        # Every worker has to finish its startup, not just the one that answered
+        previous = None
+        while time.monotonic() < deadline:
+            total = sum(memory_mb(pid)["rss"] for pid in _descendants(process.pid))
+            if previous is not None and abs(total - previous) < 1:
+                break
+            previous = total
+            time.sleep(1)
+        ready_seconds = time.perf_counter() - start
+
+        pids = [pid for pid in _descendants(process.pid) if memory_mb(pid)["rss"] > 50]
+        worker_memory = [memory_mb(pid) for pid in pids][-workers:]
+        return {
+            "ready_s": round(ready_seconds, 2),
+            "parent": memory_mb(process.pid),
+            "workers": worker_memory,
+            "workers_total_pss": round(sum(memory["pss"] for memory in worker_memory), 1),
+        }
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="Requests sent before measuring")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    baseline = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    time.sleep(0.5)
+    results = {"workers": args.workers, "baseline_interpreter": memory_mb(baseline.pid)}
+    baseline.kill()
+
+    port = _free_port()
+    results["fork"] = measure([sys.executable, "serve.py", "--port", str(port), "--workers", str(args.workers)],
+                              port, args.workers, args.requests)
+    port = _free_port()
+    results["spawn"] = measure([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                                "--workers", str(args.workers)],
+                               port, args.workers, args.requests)
+
+    print(f"Baseline interpreter: USS {results['baseline_interpreter']['uss']} MB")
+    for mode in ("fork", "spawn"):
+        result = results[mode]
+        print(f"\n{mode}: ready in {result['ready_s']}s, parent USS {result['parent']['uss']} MB")
+        for i, memory in enumerate(result["workers"]):
+            print(f"  worker {i}: RSS {memory['rss']:7.1f} MB  PSS {memory['pss']:7.1f} MB  USS {memory['uss']:7.1f} MB")
+        print(f"  total worker PSS: {result['workers_total_pss']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
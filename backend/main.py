@@ -1,29 +1,82 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, PlainTextResponse, StreamingResponse
 from typing import List, Optional
 from model.request_models import ChatRequest
-from services.gemini_client import get_chat, uris, get_form_chat, create_form_chat_client
+from services.gemini_client import uris, generate, get_embedding
 from services.supabase_client import search_similar
-from services.file_handler import combine_pdfs, text_to_pdf
+from services.file_handler import combine_pdfs, render_text_pdf
+from services import exhibit_images
+from services.log import log
+from services.metrics import REQUEST_SECONDS, span, record_usage, render_metrics
 import os
-from google.genai import types
-from services.pdf_form_handler_class import PDFFormFiller
-from reportlab.pdfgen import canvas
+from services import form_engine, form_index
+from services.corpus_snapshot import load_snapshot
+from services.artifacts import find_artifact, multipart_body, valid_artifact_id
+from services.exhibit_index import index_file, format_snippets
+from services.prompts import EXHIBIT_SNIPPETS, FORM_SELECTION
+from services.avenues import extract_facts, load_avenues, precheck, shortlist_context
+from services.sessions import sessions, valid_session_id, DEFAULT_SESSION, SessionConflictError
+from services.jobs import job_queue, QueueFullError
+from services.admission import llm_context, INTERACTIVE, BACKGROUND, AdmissionTimeout
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import asyncio
 import io
 import base64
-import pandas as pd
 import json
+import re
+import time
+import uuid
+
+
+FORMS = [
+    "BC Employers Standards Act Complaint Form",
+    "BC HRT Individual Complaint",
+    "CHRC Individual",
+    "CIRB Part II Reprisal Complaint Form",
+    "CIRB Part III Reprisal Complaint Form",
+    "CLC Monetary and Non-Monetary",
+    "CLC Trucking Monetary and Non-Monetary",
+    "CLC Unjust Dismissal"
+]
+
+# Parse the forms at startup instead of on their first fill (serve.py always does)
+PRELOAD_FORMS = os.getenv("PRELOAD_FORMS", "0") == "1"
+
+async def preload(parse_forms: bool = False):
+    """
+    Load the read-only data in parallel: the avenue matrix and its rules, the
+    form field index and any corpus snapshot. serve.py runs this once before
+    forking its workers, so in the workers it finds everything loaded.
 
-
-app = FastAPI()
+    Args:
+        parse_forms: Also parse the forms for filling. It takes a few seconds,
+            so by default each form is parsed on its first fill instead.
+    """
+    form_files = [f"{form}.pdf" for form in FORMS]
+    tasks = [
+        asyncio.to_thread(load_forms_context),
+        asyncio.to_thread(load_avenues),
+        asyncio.to_thread(load_snapshot),
+        asyncio.to_thread(form_index.load_form_index, form_files),
+    ]
+    if parse_forms:
+        tasks.append(asyncio.to_thread(form_engine.preload_templates, form_files))
+    await asyncio.gather(*tasks)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await preload(parse_forms=PRELOAD_FORMS)
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    exhibit_images.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-uploaded_files = []
-
-chat_with_file = False
-filler = None
-form_tobesaved = None
 
 # CORS middleware
 app.add_middleware(
@@ -34,13 +87,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The route template, not the URL, so ids in the path do not add series
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, path=route.path if route else "unmatched")
+    return response
+
+@app.exception_handler(SessionConflictError)
+async def session_conflict(request: Request, exc: SessionConflictError):
+    # Another worker saved the session during this request, whose changes are dropped
+    return JSONResponse(status_code=409, content={"detail": "The session changed during this request, please try again"})
+
 @app.get("/")
 def health_check():
     """Health check endpoint."""
     return {"status": "ok", "message": "B.C. Employment Rights Assistant API"}
-import pandas as pd
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Stage timings, request timings and token counts in the Prometheus text
+    format. Under serve.py each worker process keeps its own, so this reports
+    whichever worker answered; scrape each worker or run one.
+    """
+    return render_metrics()
+
+@app.get("/forms")
+def list_forms():
+    """Pages, field counts by kind and sections of every bundled form, from the form index."""
+    return form_index.summary()
+
+@lru_cache(maxsize=1)
 def load_forms_context():
+    # pandas is slow to import, and this only runs once
+    import pandas as pd
+
     # Read the uploaded CSV file using the exact filename
     df = pd.read_csv("AvenueMatrix.csv")
     
@@ -74,28 +158,118 @@ def load_forms_context():
                 
             context += "-" * 80 + "\n\n"
     
-    print(context)
+    log("Loaded forms context ({chars} chars)", chars=len(context))
     return context
 
 
 
+def _session_id(session_id: Optional[str]) -> str:
+    session_id = session_id or DEFAULT_SESSION
+    if not valid_session_id(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session_id")
+    return session_id
+
 @app.post("/chat")
 def ask_ai(request: ChatRequest):
-    global chat_with_file
-    user_message = request.message
+    with sessions.open(_session_id(request.session_id)) as session, llm_context(session.id, INTERACTIVE):
+        try:
+            reply = _chat_turn(session, request.message)
+        except AdmissionTimeout:
+            raise HTTPException(status_code=503, detail="The assistant is busy, please try again shortly")
+    return _artifact_response(reply, request.artifacts, session.id)
+
+def _artifact_response(reply, mode: str, session_id: str):
+    """
+    Attach the reply's PDFs in the way the client asked for.
+
+    Args:
+        reply: The chat reply, with "pdfs" as Session.artifact_file() dicts
+        mode: "base64" embeds the files in the JSON, "url" links to GET /artifacts,
+            "multipart" sends the JSON and the files as parts of one multipart/mixed response
+        session_id: The session the files belong to
+    """
+    files = reply["pdfs"]
+    if mode == "multipart" and files:
+        boundary = uuid.uuid4().hex
+        reply["pdfs"] = [{"filename": f["filename"], "artifact_id": f["artifact_id"], "size": f["size"]} for f in files]
+        return StreamingResponse(multipart_body(reply, files, boundary),
+                                 media_type=f"multipart/mixed; boundary={boundary}")
+
+    if mode == "url":
+        reply["pdfs"] = [
+            {
+                "filename": f["filename"],
+                "artifact_id": f["artifact_id"],
+                "size": f["size"],
+                "url": f"/artifacts/{session_id}/{f['artifact_id']}",
+            }
+            for f in files
+        ]
+        return reply
+
+    with span("base64_encode"):
+        pdfs_data = []
+        for f in files:
+            with open(f["path"], "rb") as pdf_file:
+                pdfs_data.append({
+                    "filename": f["filename"],
+                    "pdf_base64": base64.b64encode(pdf_file.read()).decode("utf-8")
+                })
+    reply["pdfs"] = pdfs_data
+    return reply
+
+@app.get("/artifacts/{session_id}/{artifact_id}")
+def download_artifact(session_id: str, artifact_id: str):
+    """
+    Send a generated PDF straight from disk. The id is the file's content hash,
+    so the response can be cached for good.
+    """
+    session_id = _session_id(session_id)
+    if not valid_artifact_id(artifact_id):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+    path = find_artifact(session_id, artifact_id)
+    if path is None:
+        # Generated on another worker, write it here from the session store
+        with sessions.open(session_id, save=False) as session:
+            name = next((n for n, i in session.artifact_ids.items() if i == artifact_id), None)
+            artifact = session.artifact_file(name) if name else None
+        if artifact is None:
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        path = artifact["path"]
+
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename=os.path.basename(path),
+        content_disposition_type="inline",
+        headers={"Cache-Control": "private, max-age=31536000, immutable"},
+    )
+
+def _chat_turn(session, user_message: str):
     response = None
 
     if user_message.lower().startswith("yes"):
-        chat_with_file = True
+        session.chat_with_file = True
+
 
+    prompt = _exhibit_prompt(session, user_message)
 
-    if chat_with_file:
-        response = get_form_chat().send_message(user_message)
+    if session.chat_with_file:
+        with span("form_chat.send_message"):
+            response = session.send_form(user_message, prompt)
     else:
-        response = get_chat().send_message(user_message)
+        with span("intake_chat.send_message"):
+            response = session.send_intake(user_message, prompt)
+    record_usage(response.usage_metadata)
     
     
     response_text = response.text.replace("**", "")
+
+    form_complete = False
+    filler = session.filler
+    if session.chat_with_file and filler is not None:
+        response_text, form_complete = _apply_form_updates(filler, response_text)
     
     # Check if response is a report
     is_report = response_text.__contains__("START_REPORT")
@@ -106,33 +280,26 @@ def ask_ai(request: ChatRequest):
         response_text = response_text.replace("END_REPORT", "").strip()
 
     if user_message.lower().startswith("yes"):
-        chat_with_file = True
+        session.chat_with_file = True
     
     pdf_files = ["files.pdf", "Report.pdf", "filled_form.pdf"]
     pdfs_data = []
 
-    if response_text.startswith("```json"):
-
-        for path in pdf_files:
-            if not os.path.exists(path):
-                print(f"⚠️ File not found: {path}")
+    if form_complete:
+        # Every answer has already been merged into the draft, so this only renders it
+        with span("render_draft"):
+            try:
+                session.put_artifact("filled_form.pdf", filler.render_draft())
+            except RuntimeError as e:
+                raise HTTPException(status_code=500, detail=str(e))
+
+        for filename in pdf_files:
+            artifact = session.artifact_file(filename)
+            if artifact is None:
+                log("⚠️ File not generated: {filename}", level="warning", filename=filename)
                 continue  # skip missing file
+            pdfs_data.append(artifact)
 
-            try:
-                with open(path, "rb") as f:
-                    pdf_bytes = f.read()
-                    pdf_base64 = base64.b64encode(pdf_bytes).decode("utf-8")
-                    pdfs_data.append({
-                        "filename": os.path.basename(path),
-                        "pdf_base64": pdf_base64
-                    })
-            except Exception as e:
-                print(f"❌ Error reading {path}: {e}")
-                continue
-
-
-        filler.fill_form(json.loads(response_text[7:-3]), "filled_form.pdf")
-        print(response_text[7:-3])
         return {
             "reply": "Alright! I have filled out the form to the best of my ability and sent it back to you. Please ensure to review it before submitting, since I am an AI and prone to mistakes. Hope your situation gets better soon! Please let me know if you still have any questions.",
             "is_report": is_report,
@@ -147,6 +314,78 @@ def ask_ai(request: ChatRequest):
         "filename": "response.pdf",
     }
 
+def _exhibit_prompt(session, user_message: str) -> Optional[str]:
+    """
+    Put the parts of the user's uploads that relate to their message in front
+    of it. Only sent with this turn, the chat history keeps the plain message.
+
+    Returns:
+        The message to send to the model, or None if no upload is relevant
+    """
+    index = session.exhibit_index
+    if not len(index):
+        return None
+
+    with span("exhibit_snippets"):
+        snippets = index.search(get_embedding(user_message))
+    if not snippets:
+        return None
+    return EXHIBIT_SNIPPETS.render(snippets=format_snippets(snippets), message=user_message).text
+
+def _apply_form_updates(filler, response_text: str):
+    """
+    Merge the field updates in a form chat reply into the filler's draft.
+
+    Args:
+        filler: The session's PDFFormFiller
+        response_text: The form chat reply
+
+    Returns:
+        Tuple of (reply with the update blocks removed, whether the form is complete)
+    """
+    # Older replies send the whole template as one JSON document at the end
+    if response_text.startswith("```json"):
+        filler.update_draft(json.loads(response_text[7:-3]))
+        return "", True
+
+    for patch_text in re.findall(r"START_PATCH(.*?)END_PATCH", response_text, re.DOTALL):
+        patch_text = patch_text.strip().removeprefix("```json").removesuffix("```").strip()
+        try:
+            updated = filler.update_draft(json.loads(patch_text))
+            log("Updated {count} form field(s)", count=len(updated))
+        except (json.JSONDecodeError, AttributeError) as e:
+            log("⚠️ Could not read form patch: {error}", level="warning", error=e)
+
+    form_complete = "FORM_COMPLETE" in response_text
+    response_text = re.sub(r"START_PATCH.*?END_PATCH", "", response_text, flags=re.DOTALL)
+    response_text = response_text.replace("FORM_COMPLETE", "").strip()
+    return response_text, form_complete
+
+@app.get("/form-preview")
+def form_preview(session_id: str = DEFAULT_SESSION, flatten: bool = True):
+    """
+    Render the form as it is filled so far.
+
+    Args:
+        session_id: The session whose form to render
+        flatten: Return a print-ready PDF with the values drawn into the pages,
+            which browser viewers show as is. False returns the fillable form.
+
+    Returns:
+        The partially filled form as a PDF
+    """
+    with sessions.open(_session_id(session_id), save=False) as session:
+        filler = session.filler
+        if filler is None:
+            raise HTTPException(status_code=404, detail="No form has been selected yet")
+
+        with span("render_draft"):
+            try:
+                pdf_bytes = filler.render_draft(flatten=flatten)
+            except RuntimeError as e:
+                raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=pdf_bytes, media_type="application/pdf")
+
 # @app.post("/chat-form")
 # def ask_ai_form(request: ChatRequest):
 #     user_message = request.message
@@ -159,12 +398,73 @@ def ask_ai(request: ChatRequest):
 #     }
 
 @app.post("/after-report")
-def after_report(report: ChatRequest):
-    after_report_text = _process_report(report.message)
+async def after_report(report: ChatRequest, wait: bool = False):
+    """
+    Queue the confirmed report for finalisation: render it, bundle the
+    exhibits, pick a form and start the form chat.
 
-    return {
-        "reply": after_report_text
-    }
+    Args:
+        report: The confirmed report and its session
+        wait: Hold the request until the job is done and reply as before
+
+    Returns:
+        dict: The job id to follow at /jobs/{job_id}, or the reply if wait is set
+    """
+    payload = {"session_id": _session_id(report.session_id), "report": report.message}
+    try:
+        job = job_queue.submit("finalize_report", payload)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Too many reports are being processed, please try again shortly")
+
+    if not wait:
+        return {"job_id": job.id, "status": job.status}
+
+    job = await job_queue.wait(job.id)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    return job.result
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Status, latest progress and result of a background job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events for a background job: started, progress with a stage
+    name, then done with the result or failed with the error.
+    """
+    if await asyncio.to_thread(job_queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    async def stream():
+        async for event in job_queue.events(job_id):
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _finalize_report(payload, progress):
+    with sessions.open(payload["session_id"]) as session, llm_context(session.id, BACKGROUND), \
+            span("process_report"):
+        return {"reply": _process_report(session, payload["report"], progress)}
+
+def _index_exhibit(payload, progress):
+    # Embedding is the slow part, so it runs before the session is locked
+    with llm_context(payload["session_id"], BACKGROUND):
+        chunks = index_file(payload["path"])
+    progress("indexed", chunks=len(chunks))
+    if chunks:
+        # Copies, since adding takes the embeddings out of the chunks
+        sessions.update(payload["session_id"],
+                        lambda session: session.add_exhibit_chunks([dict(chunk) for chunk in chunks]))
+    return {"chunks": len(chunks)}
+
+job_queue.register("finalize_report", _finalize_report)
+job_queue.register("index_exhibit", _index_exhibit)
 
 """
     API call: /upload
@@ -183,15 +483,37 @@ def after_report(report: ChatRequest):
     }
 """
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
+async def upload_file(file: UploadFile = File(...), session_id: str = Form(DEFAULT_SESSION)):
+    session_id = _session_id(session_id)
+    session_dir = os.path.join(UPLOAD_DIR, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+    file_path = os.path.join(session_dir, file.filename)
 
     # Save the file
     with open(file_path, "wb") as f:
         f.write(await file.read())
 
-    uploaded_files.append(file_path)
-    return {"message": "File uploaded successfully", "file_path": file_path}
+    await asyncio.to_thread(_add_upload, session_id, file_path)
+
+    # Convert images and documents now, so the exhibit bundle is ready by report time
+    if exhibit_images.is_convertible(file_path):
+        await asyncio.to_thread(exhibit_images.submit, file_path)
+
+    # Index the file's text for the chat in the background
+    index_job = None
+    try:
+        index_job = job_queue.submit("index_exhibit", {"session_id": session_id, "path": file_path})
+    except QueueFullError:
+        log("⚠ Job queue full, {file} will not be indexed", level="warning", file=file_path)
+
+    return {
+        "message": "File uploaded successfully",
+        "file_path": file_path,
+        "index_job_id": index_job.id if index_job else None,
+    }
+
+def _add_upload(session_id: str, file_path: str):
+    sessions.update(session_id, lambda session: session.uploaded_files.append(file_path))
 
 @app.post("/confirm-report")
 async def confirm_report(
@@ -218,14 +540,23 @@ async def confirm_report(
         }
 
 
-def _process_report(report_text: str):
+def _form_choices(forms: List[str]) -> str:
+    """Form names as a list in a sentence, e.g. "A, B, or C"."""
+    if len(forms) <= 2:
+        return " or ".join(forms)
+    return f"{', '.join(forms[:-1])}, or {forms[-1]}"
+
+
+def _process_report(session, report_text: str, progress=None):
     """
     Process generated reports by searching for similar documents.
     
     Args:
+        session: The session the report belongs to
         report_text: The generated report text
+        progress: Optional progress(stage) callback from the job queue
     """
-    # similar_docs = search_similar(report_text)
+    # similar_docs = search_similar(report_text, session.retrieval)
 
     # print("\n" + "="*50)
     # print("GENERATED REPORT")
@@ -245,36 +576,43 @@ def _process_report(report_text: str):
     # if similar_docs:
     #     contents = [doc.get('content', '') for doc in similar_docs if doc.get('content')]
     #     similar_content = "\n\n".join(contents)
-    global filler
-    global form_tobesaved
-
-    text_to_pdf(report_text, "Report.pdf", title="Complaint Report")
-    combine_pdfs(uploaded_files)
-    msg =  load_forms_context()
-    msg += f"Based on the report you just generated, which one of these forms that i am giving you now make the most sense to fill out? Is it the BC Employers Standards Act Complaint Form, BC HRT Individual Complaint, CHRC Individual, CIRB Part II Reprisal Complaint Form, CIRB Part III Reprisal Complaint Form, CLC Monetary and Non-Monetary, CLC Trucking Monetary and Non-Monetary, or CLC Unjust Dismissal? You have to choose from one of these. Only choose one. Tell me the name of the form from the ones i just specified, what the form is about, how it relates to my problem, and ask me if I would like it get filled out by you. Don't ask me if you need additional information for now, I will provide that later. If i say something like yes or continue or anything like that, then "
-    response = get_chat().send_message([
-        types.Part(text=msg),
+    from google.genai import types
+
+    progress = progress or (lambda stage, **details: None)
+
+    progress("render_report")
+    with span("render_report"):
+        session.put_artifact("Report.pdf", render_text_pdf(report_text, title="Complaint Report"))
+    progress("combine_exhibits", files=len(session.uploaded_files))
+    with span("combine_pdfs", files=len(session.uploaded_files)):
+        exhibits = io.BytesIO()
+        combine_pdfs(session.uploaded_files, exhibits)
+        session.put_artifact("files.pdf", exhibits.getvalue())
+    progress("precheck")
+    with span("precheck"):
+        matches = precheck(extract_facts(report_text))
+    # Only the forms of the eligible avenues are offered, unless none were found
+    forms = [form for form in FORMS if any(form in match.avenue.forms for match in matches)]
+    if forms:
+        forms_context = shortlist_context(matches)
+        log("📋 Precheck shortlisted {forms}", forms=", ".join(forms),
+            avenues=[match.to_dict() for match in matches])
+    else:
+        forms, forms_context = FORMS, load_forms_context()
+    prompt = FORM_SELECTION.render(forms_context=forms_context, report=report_text, forms=_form_choices(forms))
+    progress("select_form", forms=len(forms))
+    # Form selection only depends on the report, the avenue matrix and the forms,
+    # so it is a one-off call that identical reports can answer from the cache
+    response = generate([
+        types.Part(text=prompt.text),
         *[types.Part(file_data=types.FileData(file_uri=uri)) for uri in uris]  
     ])
 
-    forms = [
-        "BC Employers Standards Act Complaint Form",
-        "BC HRT Individual Complaint",
-        "CHRC Individual",
-        "CIRB Part II Reprisal Complaint Form",
-        "CIRB Part III Reprisal Complaint Form",
-        "CLC Monetary and Non-Monetary",
-        "CLC Trucking Monetary and Non-Monetary",
-        "CLC Unjust Dismissal"
-    ]
-
     response_lower = response.text.lower()
-    found_form = next((form for form in forms if form.lower() in response_lower), None)
-
-    form_tobesaved = f"{found_form}.pdf"
-    filler = PDFFormFiller(form_tobesaved)
-    template = filler.get_form_template()
+    found_form = next((form for form in FORMS if form.lower() in response_lower), None)
 
-    create_form_chat_client(report_text, template) 
+    progress("start_form", form=found_form)
+    with span("create_form_chat"):
+        session.start_form(report_text, found_form)
 
     return response.text
\ No newline at end of file
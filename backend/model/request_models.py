@@ -1,4 +1,8 @@
 from pydantic import BaseModel
+from typing import Literal, Optional
 
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None
+    # How generated PDFs are returned: base64 in the JSON reply, download URLs, or multipart/mixed parts
+    artifacts: Literal["base64", "url", "multipart"] = "base64"
@@ -0,0 +1,132 @@
+"""
+Serve
+Runs the API in several worker processes that share one copy of the
+read-only data. The parent loads the avenue matrix, the form field index,
+the parsed forms and any corpus snapshot, then forks the workers, which
+start with all of it in memory and share its pages with the parent instead
+of each loading its own. Each extra worker then costs about as much memory
+as the requests it is serving.
+
+`uvicorn main:app --workers N` still works, but it starts every worker from
+scratch, so each one loads and parses its own copy.
+
+The sockets, embeddings and form files are shared across processes either
+way: the corpus snapshot and the forms are memory-mapped (see
+services/corpus_snapshot.py and services/form_engine.py).
+
+Any worker can serve any request as long as sessions and job records are in a
+shared store (SESSION_STORE=sqlite, the default, or redis); with
+SESSION_STORE=memory run a single worker. /metrics stays per worker.
+
+Usage (from backend/):
+    python serve.py --workers 4 --port 8000
+
+Needs fork, so Linux or macOS. WEB_CONCURRENCY sets the default worker count.
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import sys
+import time
+
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+import main
+from services.log import log
+
+# A worker that dies sooner than this after starting is restarted after a pause
+MIN_WORKER_SECONDS = 1.0
+
+
+def _run_worker(config: uvicorn.Config, sock):
+    """Body of a forked worker. Never returns."""
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_DFL)
+    status = 0
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        log("❌ Worker {pid} failed: {error}", level="error", pid=os.getpid(), error=e)
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def _fork_worker(config: uvicorn.Config, sock) -> int:
+    pid = os.fork()
+    if pid == 0:
+        _run_worker(config, sock)
+    return pid
+
+
+def serve(host: str, port: int, workers: int):
+    """
+    Preload, bind the socket and keep `workers` forked workers running until
+    SIGINT or SIGTERM, which is passed on to the workers.
+    """
+    start = time.perf_counter()
+    asyncio.run(main.preload(parse_forms=True))
+    log("📦 Preloaded shared data in {seconds:.2f}s", seconds=time.perf_counter() - start)
+
+    config = uvicorn.Config(main.app, host=host, port=port)
+    # Import the protocol and event loop modules here rather than in every worker
+    config.load()
+    sock = config.bind_socket()
+
+    # Keep the collector off the preloaded objects, so it does not write to
+    # (and copy) their pages in every worker
+    gc.freeze()
+
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Per-worker pools (see services/exhibit_images.py) size themselves by this
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    for _ in range(workers):
+        children[_fork_worker(config, sock)] = time.monotonic()
+    log("🚀 Serving on http://{host}:{port} with {workers} workers", host=host, port=port, workers=workers)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        log("⚠ Worker {pid} exited with status {status}, restarting", level="warning",
+            pid=pid, status=os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < MIN_WORKER_SECONDS:
+            time.sleep(MIN_WORKER_SECONDS)
+        if not stopping:
+            children[_fork_worker(config, sock)] = time.monotonic()
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API in forked workers that share preloaded data.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
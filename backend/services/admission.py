@@ -0,0 +1,241 @@
+"""
+Admission Control
+Keeps model calls inside our Gemini quota. Every call takes a token from a
+global token bucket. When tokens run out, callers queue by priority, so
+interactive chat turns go before background report finalisation. Within a
+priority, sessions take turns, so one busy session cannot starve the others.
+Calls rejected with a rate limit error are retried with jittered backoff.
+
+Configure with environment variables:
+    LLM_REQUESTS_PER_MINUTE=0   sustained call rate, 0 admits every call at once
+    LLM_BURST=10                calls that may start together after a quiet period
+    LLM_MAX_RETRIES=4           retries of a rate limited call
+    LLM_RETRY_BASE_DELAY=1.0    first backoff in seconds, doubled per retry
+    LLM_ADMISSION_TIMEOUT=120   longest wait for a token before giving up
+
+Usage:
+    with llm_context(session_id, INTERACTIVE):
+        chat.send_message(message)      # through AdmittedProvider
+"""
+
+import contextvars
+import itertools
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from services.llm_provider import ChatSession, LLMProvider
+from services.log import log
+from services.metrics import Counter, Histogram, register, register_collector
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+WAIT_SECONDS = register(Histogram("llm_admission_wait_seconds", "Time model calls waited for admission"))
+RETRIES = register(Counter("llm_retries_total", "Model calls retried after a rate limit error"))
+
+_context = contextvars.ContextVar("llm_context", default=("anonymous", INTERACTIVE))
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a call waited longer than the admission timeout."""
+
+
+@contextmanager
+def llm_context(session_id: str, priority: int = INTERACTIVE):
+    """Attribute the model calls made inside the block to a session and priority."""
+    token = _context.set((session_id, priority))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class AdmissionController:
+    """
+    Token bucket with per-priority, per-session fair queueing.
+
+    Args:
+        rate: Tokens added per second, 0 for no limit
+        burst: Most tokens the bucket holds
+        timeout: Longest a caller waits for a token
+    """
+
+    def __init__(self, rate: float, burst: int, timeout: float = 120):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.timeout = timeout
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        # priority -> session -> deque of waiting tickets. Session order is the turn order.
+        self._waiting: Dict[int, "OrderedDict[str, deque]"] = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}
+        self._tickets = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _next_ticket(self) -> Optional[int]:
+        """The ticket that gets the next token: best priority, then the session whose turn it is."""
+        for priority in sorted(self._waiting):
+            sessions = self._waiting[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _remove(self, priority: int, session_id: str, ticket: int, served: bool):
+        sessions = self._waiting[priority]
+        queue = sessions[session_id]
+        queue.remove(ticket)
+        if not queue:
+            del sessions[session_id]
+        elif served:
+            # Served sessions go to the back of the line
+            sessions.move_to_end(session_id)
+
+    def queue_depth(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                PRIORITY_NAMES[priority]: sum(len(q) for q in sessions.values())
+                for priority, sessions in self._waiting.items()
+            }
+
+    def acquire(self, session_id: str, priority: int = INTERACTIVE) -> float:
+        """
+        Wait for a token.
+
+        Returns:
+            Seconds spent waiting
+        """
+        if not self.rate:
+            return 0.0
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        ticket = next(self._tickets)
+        with self._cond:
+            self._waiting[priority].setdefault(session_id, deque()).append(ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self._next_ticket() == ticket and self._tokens >= 1:
+                        self._tokens -= 1
+                        self._remove(priority, session_id, ticket, served=True)
+                        self._cond.notify_all()
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._remove(priority, session_id, ticket, served=False)
+                        self._cond.notify_all()
+                        raise AdmissionTimeout(f"No model capacity after {self.timeout:.0f}s")
+                    # Sleep until the next token is due, or until someone ahead is served
+                    until_token = (1 - self._tokens) / self.rate if self._tokens < 1 else remaining
+                    self._cond.wait(min(remaining, max(until_token, 0.001)))
+            except BaseException:
+                if ticket in self._waiting[priority].get(session_id, ()):
+                    self._remove(priority, session_id, ticket, served=False)
+                    self._cond.notify_all()
+                raise
+
+        waited = time.monotonic() - start
+        WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES[priority])
+        return waited
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an error from the model client means "slow down"."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code in (429, 503) or "RESOURCE_EXHAUSTED" in str(error)
+
+
+class _AdmittedChat(ChatSession):
+    def __init__(self, provider: "AdmittedProvider", chat):
+        self._provider = provider
+        self._chat = chat
+
+    def send_message(self, message):
+        return self._provider.call(lambda: self._chat.send_message(message))
+
+    def send_message_stream(self, message):
+        # A stream that already produced text cannot be retried, so only admit it
+        self._provider.admit()
+        yield from self._chat.send_message_stream(message)
+
+
+class AdmittedProvider(LLMProvider):
+    """
+    Wraps another provider so every call is admitted by an AdmissionController
+    and retried on rate limit errors.
+    """
+
+    def __init__(self, inner: LLMProvider, controller: AdmissionController,
+                 max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.inner = inner
+        self.controller = controller
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def admit(self):
+        session_id, priority = _context.get()
+        self.controller.acquire(session_id, priority)
+
+    def call(self, fn: Callable):
+        """Run fn once admitted, retrying rate limit errors with full-jitter backoff."""
+        for attempt in itertools.count():
+            self.admit()
+            try:
+                return fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                RETRIES.inc()
+                log("⚠ Model rate limited, retrying in {delay:.1f}s: {error}", level="warning", delay=delay, error=e)
+                time.sleep(delay)
+
+    def create_chat(self, model: str, history: Optional[list] = None):
+        # Creating a chat is local, only its messages reach the model
+        return _AdmittedChat(self, self.inner.create_chat(model, history))
+
+    def generate(self, model: str, contents, config=None):
+        return self.call(lambda: self.inner.generate(model, contents, config))
+
+    def embed(self, text: str, model: str, dimensions: int) -> List[float]:
+        return self.call(lambda: self.inner.embed(text, model, dimensions))
+
+    def upload_file(self, path: str) -> str:
+        return self.call(lambda: self.inner.upload_file(path))
+
+
+def create_admission_controller() -> AdmissionController:
+    """Build the controller configured by the LLM_* environment variables."""
+    return AdmissionController(
+        rate=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")) / 60,
+        burst=int(os.getenv("LLM_BURST", "10")),
+        timeout=float(os.getenv("LLM_ADMISSION_TIMEOUT", "120")),
+    )
+
+
+def admitted(provider: LLMProvider) -> AdmittedProvider:
+    """Wrap a provider with the configured admission control and retries."""
+    controller = create_admission_controller()
+    register_collector(lambda: [
+        "# HELP llm_admission_queue_depth Model calls waiting for admission",
+        "# TYPE llm_admission_queue_depth gauge",
+        *[f'llm_admission_queue_depth{{priority="{name}"}} {depth}'
+          for name, depth in controller.queue_depth().items()],
+    ])
+    return AdmittedProvider(
+        provider,
+        controller,
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+        base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0")),
+    )
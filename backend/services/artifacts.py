@@ -0,0 +1,95 @@
+"""
+Artifacts
+Generated PDFs on disk, so they can be sent as files instead of base64 inside
+the chat reply. Each artifact is stored once under its content hash:
+
+    artifacts/<session_id>/<artifact_id>/<file name>
+
+The id changes whenever the content does, so a URL for an artifact can be
+cached forever. The session store keeps its own copy, and a worker that does
+not have the file yet writes it from there (see Session.artifact_file).
+
+Set ARTIFACT_DIR to move the directory (default artifacts).
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+CHUNK_SIZE = 256 * 1024
+
+ARTIFACT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def artifact_id(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def valid_artifact_id(value: str) -> bool:
+    return bool(ARTIFACT_ID_PATTERN.match(value))
+
+
+def write_artifact(session_id: str, name: str, data: bytes) -> str:
+    """
+    Write an artifact to disk, unless the same content is already there.
+
+    Args:
+        session_id: The session it belongs to
+        name: File name it is downloaded as
+        data: The file contents
+
+    Returns:
+        Path of the file
+    """
+    directory = os.path.join(ARTIFACT_DIR, session_id, artifact_id(data))
+    path = os.path.join(directory, os.path.basename(name))
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename, so a download never sees half a file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    return path
+
+
+def find_artifact(session_id: str, artifact_id: str) -> Optional[str]:
+    """Path of an artifact written on this host, or None."""
+    directory = os.path.join(ARTIFACT_DIR, session_id, artifact_id)
+    try:
+        names = [name for name in os.listdir(directory) if not name.endswith(".tmp")]
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, names[0]) if names else None
+
+
+def remove_artifact(session_id: str, artifact_id: str):
+    shutil.rmtree(os.path.join(ARTIFACT_DIR, session_id, artifact_id), ignore_errors=True)
+
+
+def multipart_body(reply: Dict, files: List[Dict], boundary: str) -> Iterator[bytes]:
+    """
+    A multipart/mixed body: the JSON reply first, then each file as its own
+    part, read from disk a chunk at a time.
+
+    Args:
+        reply: The JSON part
+        files: Dicts with "filename" and "path"
+        boundary: The multipart boundary
+    """
+    yield (f"--{boundary}\r\nContent-Type: application/json\r\n\r\n"
+           f"{json.dumps(reply)}\r\n").encode("utf-8")
+    for file in files:
+        yield (f"--{boundary}\r\nContent-Type: application/pdf\r\n"
+               f"Content-Length: {os.path.getsize(file['path'])}\r\n"
+               f"Content-Disposition: attachment; filename=\"{file['filename']}\"\r\n\r\n").encode("utf-8")
+        with open(file["path"], "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode("utf-8")
@@ -0,0 +1,407 @@
+"""
+Avenues
+The avenue matrix (AvenueMatrix.csv) as rules, so the avenues a situation
+is eligible for and their filing deadlines are worked out locally instead
+of by the model re-reading the whole matrix for every report.
+
+Each row becomes an Avenue: its jurisdiction (the federal table, then the
+provincial one), the issue types it covers and any qualifiers in the issue
+text ("not Trucking", "no human rights issue", ...), the "Unless" exclusions
+and its time limit. extract_facts pulls what the rules need out of a report
+with keyword and date patterns, and precheck matches the two:
+
+    facts = extract_facts(report_text)
+    for match in precheck(facts):
+        print(match.avenue.name, match.deadline, match.status)
+
+Facts that are not found do not rule anything out. When nothing matches,
+callers fall back to the full matrix.
+"""
+
+import calendar
+import csv
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Optional, Set
+
+from services.log import log
+
+AVENUE_MATRIX = "AvenueMatrix.csv"
+
+FEDERAL = "federal"
+PROVINCIAL = "provincial"
+
+# Form files named in the matrix that are bundled under another name
+FORM_ALIASES = {"CIRB Unjust Dismissal": "CLC Unjust Dismissal"}
+
+# Issue types, from the issue column of the matrix and from reports
+ISSUE_PATTERNS = {
+    "human_rights": re.compile(r"human rights|discriminat|harass|racis|sexis|because of my (race|religion|gender|sex|age|disability|pregnancy|ethnicity|sexual orientation)|pregnan", re.I),
+    "ohs_reprisal": re.compile(r"ohs reprisal|(reprisal|retaliat|punish)\w*[^.]{0,80}(safety|unsafe|dangerous|injur)|(safety|unsafe|dangerous|injur)\w*[^.]{0,80}(reprisal|retaliat|punish)|(after|because|for) \w*\s?(complain|report|rais|refus)\w*[^.]{0,60}(safety|unsafe|dangerous|injur)", re.I),
+    "es_reprisal": re.compile(r"reprisal \(employment standards\)|(reprisal|retaliat|punish)\w*[^.]{0,80}(wage|overtime|hours|vacation|pay)|(wage|overtime|hours|vacation|pay)\w*[^.]{0,80}(reprisal|retaliat|punish)|(after|because|for) \w*\s?(complain|ask|rais)\w*[^.]{0,60}(wage|overtime|hours|vacation|pay)", re.I),
+    "employment_standards": re.compile(r"^employment standards|unpaid|owed|overtime|vacation pay|minimum wage|hours of work|statutory holiday|final pay|paycheque|wages", re.I),
+    "unjust_dismissal": re.compile(r"unjust dismissal|\bfired\b|terminat|dismiss|let go|laid off", re.I),
+}
+
+_TIME_LIMIT = re.compile(r">\s*(\d+)\s*(day|month|year)s?", re.I)
+_MIN_MONTHS = re.compile(r"employed\s*([<>])\s*(\d+)\s*months?", re.I)
+_WITHIN_DAYS = re.compile(r"<\s*(\d+)\s*days", re.I)
+
+_MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+_MONTHS["sept"] = 9
+_MONTH_NAMES = "|".join(sorted(_MONTHS, key=len, reverse=True))
+_DATE_PATTERNS = [
+    # May 7, 2025 / May 7th 2025
+    (re.compile(rf"\b({_MONTH_NAMES})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", re.I), ("month", "day", "year")),
+    # 7 May 2025
+    (re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTH_NAMES})\.?,?\s+(\d{{4}})\b", re.I), ("day", "month", "year")),
+    # 2025-05-07
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), ("year", "month", "day")),
+    # May 2025
+    (re.compile(rf"\b({_MONTH_NAMES})\.?,?\s+(\d{{4}})\b", re.I), ("month", "year")),
+    # June 3 / 3 June, in the year before the reference date
+    (re.compile(rf"\b({_MONTH_NAMES})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?!,?\s*\d)", re.I), ("month", "day")),
+    (re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTH_NAMES})\b\.?(?!,?\s*\d)", re.I), ("day", "month")),
+]
+_START_CONTEXT = re.compile(r"start|began|hired|joined|since", re.I)
+# Only the clause a date is in counts as its context
+_CLAUSE_BREAK = re.compile(r"[.;:!?,\n]")
+
+_FEDERAL_HINTS = re.compile(r"federally regulated|federal jurisdiction|canada labour code|\b(bank|airline|airport|railway|telecom|telecommunications|broadcast\w*|canada post|postal|shipping|port authority|first nation band|crown corporation)\b", re.I)
+_PROVINCIAL_HINTS = re.compile(r"provincially regulated|provincial jurisdiction|employment standards act|\b(restaurant|retail|store|construction|hotel|school|hospital|warehouse|daycare|salon)\b", re.I)
+_TRUCKING = re.compile(r"\btruck(ing|er|s|\b)|\bhauling\b", re.I)
+_NOT_EMPLOYEE = re.compile(r"independent contractor|not an employee|self-employed", re.I)
+_REFUSED_UNSAFE = re.compile(r"refus\w*[^.]{0,40}(unsafe|dangerous)|right to refuse", re.I)
+_REINSTATEMENT = re.compile(r"reinstat|my job back", re.I)
+_SEVERANCE = re.compile(r"severance", re.I)
+_PAY_IN_LIEU = re.compile(r"pay in lieu|termination pay", re.I)
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+class TimeLimit:
+    """How long after the incident a complaint can be filed, e.g. "> 90 days"."""
+
+    def __init__(self, amount: int, unit: str):
+        self.amount = amount
+        self.unit = unit.lower()
+
+    def deadline(self, incident: date) -> date:
+        if self.unit == "day":
+            return date.fromordinal(incident.toordinal() + self.amount)
+        return _add_months(incident, self.amount * (12 if self.unit == "year" else 1))
+
+    def __str__(self):
+        return f"{self.amount} {self.unit}{'s' if self.amount != 1 else ''}"
+
+    @staticmethod
+    def parse(text: str) -> Optional["TimeLimit"]:
+        match = _TIME_LIMIT.search(text or "")
+        return TimeLimit(int(match.group(1)), match.group(2)) if match else None
+
+
+class Avenue:
+    """One row of the avenue matrix."""
+
+    def __init__(self, jurisdiction: str, row: Dict[str, str]):
+        self.jurisdiction = jurisdiction
+        self.issue = row["Federal Jurisdiction"]
+        self.name = row["Avenue"]
+        self.forms = [self._form_name(name) for name in self._split(row.get("Form Names"))]
+        self.submit_urls = self._split(row.get("Where Form Should be Submitted"))
+        self.info_urls = self._split(row.get("Readme: Additional Information for Complainants"))
+        self.late_policy = row.get("Time Exemptions") or None
+
+        issue = self.issue.lower()
+        self.issues: Set[str] = {kind for kind, pattern in ISSUE_PATTERNS.items()
+                                 if kind != "employment_standards" and pattern.search(self.issue)}
+        if issue.startswith("employment standards"):
+            self.issues.add("employment_standards")
+        # Qualifiers in the issue text: fact -> required value
+        self.conditions: Dict[str, object] = {}
+        if "no human rights" in issue:
+            self.issues.discard("human_rights")
+            self.conditions["human_rights"] = False
+        if "trucking" in issue:
+            self.conditions["trucking"] = "not trucking" not in issue
+        if "refusal of unsafe work" in issue:
+            self.conditions["refused_unsafe_work"] = "without" not in issue
+        if "only wants" in issue:
+            self.conditions["remedy"] = "severance" if "severance" in issue else "pay_in_lieu"
+        if re.search(r"\bemployee\b", issue):
+            self.conditions["employee"] = True
+
+        unless = [row.get(column) or "" for column in ("Unless", "or Unless", "or Unless It Happened")]
+        self.excludes_non_employees = any("not employee" in text.lower() for text in unless)
+        self.excludes_esa_exempt = any("excluded from esa" in text.lower() for text in unless)
+        self.min_months = None
+        for text in unless + [self.issue]:
+            match = _MIN_MONTHS.search(text)
+            if match:
+                self.min_months = int(match.group(2))
+        self.time_limit = next(filter(None, (TimeLimit.parse(text) for text in unless)), None)
+        within = _WITHIN_DAYS.search(self.issue)
+        if self.time_limit is None and within:
+            self.time_limit = TimeLimit(int(within.group(1)), "day")
+
+    @staticmethod
+    def _split(text: Optional[str]) -> List[str]:
+        return [part.strip() for part in (text or "").split(" AND ") if part.strip()]
+
+    @staticmethod
+    def _form_name(file_name: str) -> str:
+        name = file_name[:-4] if file_name.lower().endswith(".pdf") else file_name
+        return FORM_ALIASES.get(name, name)
+
+
+class Facts:
+    """What a report says about the situation. None means not known."""
+
+    def __init__(self,
+                 jurisdiction: Optional[str] = None,
+                 issues: Optional[Set[str]] = None,
+                 incident_date: Optional[date] = None,
+                 start_date: Optional[date] = None,
+                 employee: Optional[bool] = None,
+                 excluded_from_esa: Optional[bool] = None,
+                 trucking: Optional[bool] = None,
+                 refused_unsafe_work: Optional[bool] = None,
+                 remedy: Optional[str] = None):
+        self.jurisdiction = jurisdiction
+        self.issues = issues or set()
+        self.incident_date = incident_date
+        self.start_date = start_date
+        self.employee = employee
+        self.excluded_from_esa = excluded_from_esa
+        self.trucking = trucking
+        self.refused_unsafe_work = refused_unsafe_work
+        self.remedy = remedy
+
+    @property
+    def employed_months(self) -> Optional[int]:
+        if self.start_date is None or self.incident_date is None:
+            return None
+        months = (self.incident_date.year - self.start_date.year) * 12 + self.incident_date.month - self.start_date.month
+        return months - (self.incident_date.day < self.start_date.day)
+
+    def value(self, fact: str):
+        if fact == "human_rights":
+            return True if "human_rights" in self.issues else None
+        return getattr(self, fact)
+
+    def to_dict(self) -> Dict:
+        return {
+            "jurisdiction": self.jurisdiction,
+            "issues": sorted(self.issues),
+            "incident_date": self.incident_date.isoformat() if self.incident_date else None,
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "employed_months": self.employed_months,
+            "employee": self.employee,
+            "excluded_from_esa": self.excluded_from_esa,
+            "trucking": self.trucking,
+            "refused_unsafe_work": self.refused_unsafe_work,
+            "remedy": self.remedy,
+        }
+
+
+class Match:
+    """An avenue a situation is eligible for, with its filing deadline."""
+
+    def __init__(self, avenue: Avenue, facts: Facts, today: date):
+        self.avenue = avenue
+        self.deadline = None
+        self.days_left = None
+        if avenue.time_limit and facts.incident_date:
+            self.deadline = avenue.time_limit.deadline(facts.incident_date)
+            self.days_left = self.deadline.toordinal() - today.toordinal()
+
+    @property
+    def status(self) -> str:
+        """open, late, or unknown when the incident date or the time limit is not known."""
+        if self.days_left is None:
+            return "unknown"
+        return "open" if self.days_left >= 0 else "late"
+
+    def to_dict(self) -> Dict:
+        return {
+            "avenue": self.avenue.name.strip(),
+            "issue": self.avenue.issue.strip(),
+            "jurisdiction": self.avenue.jurisdiction,
+            "forms": self.avenue.forms,
+            "time_limit": str(self.avenue.time_limit) if self.avenue.time_limit else None,
+            "deadline": self.deadline.isoformat() if self.deadline else None,
+            "days_left": self.days_left,
+            "status": self.status,
+            "late_policy": self.avenue.late_policy,
+        }
+
+
+@lru_cache(maxsize=1)
+def load_avenues(path: str = AVENUE_MATRIX) -> List[Avenue]:
+    """
+    Parse the avenue matrix. The provincial table follows the federal one in
+    the same file, under a repeated header row.
+    """
+    avenues = []
+    jurisdiction = FEDERAL
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            row = {(key or "").strip(): (value or "").strip() for key, value in row.items()}
+            issue = row.get("Federal Jurisdiction", "")
+            if issue == "Provincial Jurisdiction":
+                jurisdiction = PROVINCIAL
+                continue
+            if not issue or not row.get("Avenue"):
+                continue
+            avenues.append(Avenue(jurisdiction, row))
+    log("Loaded {count} avenue rules", count=len(avenues))
+    return avenues
+
+
+def _find_dates(text: str, today: date) -> List[tuple]:
+    """
+    (position, date) of every date in a text. Dates with only a month and year
+    get the 1st, and dates without a year get the latest year that puts them
+    on or before today.
+    """
+    found = {}
+    for pattern, parts in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            if any(start <= match.start() < end for start, end in found):
+                continue
+            values = dict(zip(parts, match.groups()))
+            month = values["month"]
+            month = _MONTHS.get(month.lower().rstrip(".")) if not month.isdigit() else int(month)
+            try:
+                if "year" in values:
+                    day = date(int(values["year"]), month, int(values.get("day", 1)))
+                else:
+                    day = date(today.year, month, int(values["day"]))
+                    if day > today:
+                        day = date(today.year - 1, month, day.day)
+            except (TypeError, ValueError):
+                continue
+            found[(match.start(), match.end())] = day
+    return sorted((start, day) for (start, _), day in found.items())
+
+
+def extract_facts(report_text: str, today: Optional[date] = None) -> Facts:
+    """
+    Pull the facts the avenue rules use out of a report, with keyword and date
+    patterns. The start date is the earliest date mentioned near "started",
+    "hired" and the like, and the incident date the latest other date that is
+    not in the future. Without such a date the incident date, and so every
+    deadline, stays unknown.
+
+    Args:
+        report_text: The generated report
+        today: Reference date, defaults to today
+
+    Returns:
+        The facts found
+    """
+    today = today or date.today()
+    facts = Facts(issues={kind for kind, pattern in ISSUE_PATTERNS.items() if pattern.search(report_text)})
+
+    federal = bool(_FEDERAL_HINTS.search(report_text))
+    provincial = bool(_PROVINCIAL_HINTS.search(report_text))
+    if federal != provincial:
+        facts.jurisdiction = FEDERAL if federal else PROVINCIAL
+
+    if _TRUCKING.search(report_text):
+        facts.trucking = True
+    if _NOT_EMPLOYEE.search(report_text):
+        facts.employee = False
+    if re.search(r"excluded from the (esa|employment standards act)", report_text, re.I):
+        facts.excluded_from_esa = True
+    if _REFUSED_UNSAFE.search(report_text):
+        facts.refused_unsafe_work = True
+
+    if _REINSTATEMENT.search(report_text):
+        facts.remedy = "reinstatement"
+    elif _SEVERANCE.search(report_text):
+        facts.remedy = "severance"
+    elif _PAY_IN_LIEU.search(report_text):
+        facts.remedy = "pay_in_lieu"
+
+    starts, incidents = [], []
+    for position, day in _find_dates(report_text, today):
+        if day > today:
+            continue
+        clause = _CLAUSE_BREAK.split(report_text[max(0, position - 60):position])[-1]
+        if _START_CONTEXT.search(clause):
+            starts.append(day)
+        else:
+            incidents.append(day)
+    if incidents:
+        facts.incident_date = max(incidents)
+    if starts and (facts.incident_date is None or min(starts) < facts.incident_date):
+        facts.start_date = min(starts)
+    return facts
+
+
+def _eligible(avenue: Avenue, facts: Facts) -> bool:
+    if facts.jurisdiction and avenue.jurisdiction != facts.jurisdiction:
+        return False
+    if not avenue.issues or not avenue.issues <= facts.issues:
+        return False
+    for fact, required in avenue.conditions.items():
+        value = facts.value(fact)
+        if value is not None and value != required:
+            return False
+    if avenue.excludes_non_employees and facts.employee is False:
+        return False
+    if avenue.excludes_esa_exempt and facts.excluded_from_esa:
+        return False
+    months = facts.employed_months
+    if avenue.min_months is not None and months is not None and months < avenue.min_months:
+        return False
+    return True
+
+
+def precheck(facts: Facts, today: Optional[date] = None, path: str = AVENUE_MATRIX) -> List[Match]:
+    """
+    The avenues a situation is eligible for, with their deadlines, in matrix order.
+
+    Args:
+        facts: From extract_facts
+        today: Reference date for the days left, defaults to today
+        path: The avenue matrix
+
+    Returns:
+        The matches, empty when no issue type was recognised
+    """
+    today = today or date.today()
+    return [Match(avenue, facts, today) for avenue in load_avenues(path) if _eligible(avenue, facts)]
+
+
+def shortlist_context(matches: List[Match]) -> str:
+    """
+    The matched avenues in the format of the full avenue context, with the
+    computed deadline of each.
+    """
+    context = "Here is information about the legal forms that fit this situation, with filing deadlines already worked out:\n\n"
+    for match in matches:
+        avenue = match.avenue
+        context += f"Issue Type: {avenue.issue}\n"
+        context += f"Avenue: {avenue.name}\n"
+        context += f"Form Names: {' AND '.join(avenue.forms) or 'None'}\n"
+        context += f"Submission URL: {' AND '.join(avenue.submit_urls)}\n"
+        context += f"Additional Info: {' AND '.join(avenue.info_urls)}\n"
+        if avenue.time_limit:
+            context += f"Time Limit: {avenue.time_limit} from the incident\n"
+        if match.status == "open":
+            context += f"Filing Deadline: {match.deadline.isoformat()} ({match.days_left} days left)\n"
+        elif match.status == "late":
+            context += f"Filing Deadline: passed on {match.deadline.isoformat()}\n"
+        if avenue.late_policy:
+            context += f"Late Complaint Policy: {avenue.late_policy}\n"
+        context += "-" * 80 + "\n\n"
+    return context
@@ -0,0 +1,188 @@
+"""
+Corpus Snapshot
+Offline copy of the bc_laws table for retrieval without the network and for
+reproducible benchmarks. A snapshot is a directory:
+
+    bc_laws-<version>/
+        manifest.json     row count, embedding size, file list and version
+        rows.parquet      id, title, chunk_index, content
+        embeddings.npy    float32 matrix, one normalised row per chunk
+
+The version is a hash of the rows and embeddings, so the same corpus always
+gets the same name. Both data files are memory-mapped when loaded.
+
+Create snapshots with database/snapshot.py. Set RETRIEVAL_SNAPSHOT to a
+snapshot directory to have search_similar use it instead of Supabase.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+FORMAT_VERSION = 1
+ROWS_FILE = "rows.parquet"
+EMBEDDINGS_FILE = "embeddings.npy"
+MANIFEST_FILE = "manifest.json"
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def content_version(rows: List[Dict], embeddings) -> str:
+    """
+    Hash of a corpus, independent of how the files happen to be encoded.
+
+    Args:
+        rows: Dicts with id, title, chunk_index and content
+        embeddings: float32 matrix aligned with rows
+    """
+    hasher = hashlib.sha256()
+    for row in rows:
+        hasher.update(json.dumps([row["id"], row["title"], row["chunk_index"], row["content"]],
+                                 ensure_ascii=False).encode("utf-8"))
+    hasher.update(embeddings.tobytes())
+    return hasher.hexdigest()[:16]
+
+
+def write_snapshot(rows: List[Dict], embeddings, out_dir: str, table: str = "bc_laws") -> str:
+    """
+    Write a snapshot directory.
+
+    Args:
+        rows: Dicts with id, title, chunk_index and content
+        embeddings: Matrix aligned with rows, stored as float32
+        out_dir: Parent directory. The snapshot goes in a subdirectory named after its version.
+        table: Source table name, recorded in the manifest
+
+    Returns:
+        Path of the snapshot directory
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if len(rows) != len(embeddings):
+        raise ValueError(f"{len(rows)} rows but {len(embeddings)} embeddings")
+
+    version = content_version(rows, embeddings)
+    path = os.path.join(out_dir, f"{table}-{version}")
+    os.makedirs(path, exist_ok=True)
+
+    table_data = pa.table({
+        "id": pa.array([row["id"] for row in rows], pa.int64()),
+        "title": pa.array([row["title"] for row in rows], pa.string()),
+        "chunk_index": pa.array([row["chunk_index"] for row in rows], pa.int32()),
+        "content": pa.array([row["content"] for row in rows], pa.string()),
+    })
+    # Titles repeat for every chunk of a document, dictionary encoding stores them once
+    pq.write_table(table_data, os.path.join(path, ROWS_FILE), compression="zstd", use_dictionary=["title"])
+    np.save(os.path.join(path, EMBEDDINGS_FILE), embeddings)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "table": table,
+        "version": version,
+        "rows": len(rows),
+        "dimensions": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "files": {name: _file_hash(os.path.join(path, name)) for name in (ROWS_FILE, EMBEDDINGS_FILE)},
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def _file_hash(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class CorpusSnapshot:
+    """A loaded snapshot. Rows and embeddings stay memory-mapped."""
+
+    def __init__(self, path: str, verify: bool = False):
+        import numpy as np
+        import pyarrow.parquet as pq
+
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format: {self.manifest.get('format_version')}")
+        if verify:
+            self.verify()
+
+        self.rows = pq.read_table(os.path.join(path, ROWS_FILE), memory_map=True)
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        self._content = self.rows.column("content")
+        self._title = self.rows.column("title")
+        self._id = self.rows.column("id")
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    def __len__(self):
+        return self.rows.num_rows
+
+    def verify(self):
+        """Check the data files against the hashes in the manifest."""
+        for name, expected in self.manifest["files"].items():
+            if _file_hash(os.path.join(self.path, name)) != expected:
+                raise ValueError(f"{name} in {self.path} does not match its manifest")
+
+    def to_rows(self) -> List[Dict]:
+        return self.rows.to_pylist()
+
+    def search(self, query_embedding: List[float], match_count: int = 5) -> List[Dict]:
+        """
+        Closest chunks by cosine similarity, shaped like match_documents rows.
+
+        Args:
+            query_embedding: Normalised query embedding
+            match_count: Number of rows to return
+        """
+        import numpy as np
+
+        if not len(self):
+            return []
+        scores = self.embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        count = min(match_count, len(scores))
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "id": self._id[i].as_py(),
+                "title": self._title[i].as_py(),
+                "content": self._content[i].as_py(),
+                "similarity": float(scores[i]),
+            }
+            for i in top.tolist()
+        ]
+
+
+def load_snapshot(path: Optional[str] = None) -> Optional[CorpusSnapshot]:
+    """
+    Load a snapshot once per process.
+
+    Args:
+        path: Snapshot directory, defaults to RETRIEVAL_SNAPSHOT
+
+    Returns:
+        The CorpusSnapshot, or None when no snapshot is configured
+    """
+    path = path or os.getenv("RETRIEVAL_SNAPSHOT")
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    with _snapshots_lock:
+        if path not in _snapshots:
+            _snapshots[path] = CorpusSnapshot(path)
+        return _snapshots[path]
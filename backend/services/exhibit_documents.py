@@ -0,0 +1,76 @@
+"""
+Exhibit Documents
+Turns uploaded text files and Word documents into PDF pages for the exhibit
+bundle, in pure Python. Runs in the exhibit conversion pool next to the image
+conversions (see services/exhibit_images.py).
+
+Old binary .doc files cannot be read without Word or LibreOffice and are
+still skipped.
+"""
+
+import re
+import zipfile
+from typing import List
+from xml.etree import ElementTree
+
+DOCUMENT_EXTENSIONS = ("txt", "docx")
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def read_text_file(path: str) -> str:
+    """Read a text file, falling back to Windows-1252 for files that are not UTF-8."""
+    with open(path, "rb") as f:
+        data = f.read()
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("latin-1")
+
+
+def read_docx_paragraphs(path: str) -> List[str]:
+    """
+    Extract the paragraphs of a .docx file, in document order. Table cells come
+    out as one paragraph each.
+    """
+    with zipfile.ZipFile(path) as docx:
+        root = ElementTree.fromstring(docx.read("word/document.xml"))
+
+    paragraphs = []
+    for paragraph in root.iter(f"{_WORD_NS}p"):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == f"{_WORD_NS}t":
+                parts.append(node.text or "")
+            elif node.tag == f"{_WORD_NS}tab":
+                parts.append("    ")
+            elif node.tag in (f"{_WORD_NS}br", f"{_WORD_NS}cr"):
+                parts.append("\n")
+        paragraphs.extend("".join(parts).split("\n"))
+    return paragraphs
+
+
+def document_to_pdf_bytes(path: str) -> bytes:
+    """
+    Render a .txt or .docx file as PDF pages.
+
+    Args:
+        path: Path to the document
+
+    Returns:
+        The PDF as bytes
+    """
+    from services.file_handler import render_text_pdf
+
+    ext = path.lower().split('.')[-1]
+    if ext == "docx":
+        lines = read_docx_paragraphs(path)
+    elif ext == "txt":
+        # Tabs, form feeds and other control characters have no glyph in the PDF font
+        lines = [re.sub(r"[\x00-\x1f]", " ", line.replace("\t", "    "))
+                 for line in read_text_file(path).splitlines()]
+    else:
+        raise ValueError(f"Unsupported document type: {path}")
+    return render_text_pdf(lines or [""])
@@ -0,0 +1,167 @@
+"""
+Exhibit Images
+Turns uploaded photos and scans into small single-page PDFs. Images are
+downsampled to fit a letter page at a target DPI and re-encoded as JPEG,
+in a process pool, as soon as they are uploaded. The same pool renders
+text and Word exhibits (see services/exhibit_documents.py). The most recent
+results are cached by file content, so a file uploaded twice is converted once.
+
+Configure with environment variables:
+    EXHIBIT_IMAGE_DPI=150       resolution of the page image
+    EXHIBIT_JPEG_QUALITY=75     JPEG quality, 1-95
+    EXHIBIT_WORKERS=4           worker processes in each API worker (defaults
+                                to the CPU count shared out over WEB_CONCURRENCY)
+    EXHIBIT_CACHE_SIZE=64       converted files kept in memory
+"""
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from services.exhibit_documents import DOCUMENT_EXTENSIONS, document_to_pdf_bytes
+
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png")
+CONVERTIBLE_EXTENSIONS = IMAGE_EXTENSIONS + DOCUMENT_EXTENSIONS
+
+# Letter size in inches
+PAGE_WIDTH_IN = 8.5
+PAGE_HEIGHT_IN = 11
+
+DPI = int(os.getenv("EXHIBIT_IMAGE_DPI", "150"))
+JPEG_QUALITY = int(os.getenv("EXHIBIT_JPEG_QUALITY", "75"))
+CACHE_SIZE = int(os.getenv("EXHIBIT_CACHE_SIZE", "64"))
+DIGEST_CACHE_SIZE = 4096
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# sha256 of the file -> Future of the PDF bytes, least recently used first
+_conversions: "OrderedDict[str, Future]" = OrderedDict()
+_conversions_lock = threading.Lock()
+
+# (path, mtime, size) -> sha256, so a file is hashed once however often it is submitted
+_digests: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+def is_image(path: str) -> bool:
+    return path.lower().split('.')[-1] in IMAGE_EXTENSIONS
+
+
+def is_convertible(path: str) -> bool:
+    """Whether submit() can turn this file into PDF pages."""
+    return path.lower().split('.')[-1] in CONVERTIBLE_EXTENSIONS
+
+
+def image_to_pdf_bytes(path: str, dpi: int = DPI, quality: int = JPEG_QUALITY) -> bytes:
+    """
+    Convert an image to a one-page PDF that fits a letter page.
+
+    Args:
+        path: Path to a JPG or PNG file
+        dpi: Resolution of the page image. Larger images are downsampled to it.
+        quality: JPEG quality used to re-encode the image
+
+    Returns:
+        The PDF as bytes
+    """
+    from PIL import Image, ImageOps
+
+    def page_box(width, height):
+        # Landscape images go on a landscape page
+        if width > height:
+            return int(PAGE_HEIGHT_IN * dpi), int(PAGE_WIDTH_IN * dpi)
+        return int(PAGE_WIDTH_IN * dpi), int(PAGE_HEIGHT_IN * dpi)
+
+    with Image.open(path) as original:
+        # draft() lets the JPEG decoder skip detail we are about to throw away
+        original.draft("RGB", page_box(*original.size))
+
+        # Phone photos are often stored sideways with an EXIF rotation flag
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+        max_width, max_height = page_box(*image.size)
+        if image.width > max_width or image.height > max_height:
+            image.thumbnail((max_width, max_height), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, "PDF", resolution=dpi, quality=quality, optimize=True)
+        return buffer.getvalue()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # serve.py forks WEB_CONCURRENCY API workers, each with its own pool
+                api_workers = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+                workers = int(os.getenv("EXHIBIT_WORKERS", "0")) or max((os.cpu_count() or 1) // api_workers, 1)
+                _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def _cache_key(path: str) -> str:
+    stat = os.stat(path)
+    file_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _conversions_lock:
+        digest = _digests.get(file_key)
+        if digest is not None:
+            _digests.move_to_end(file_key)
+            return digest
+
+    hasher = hashlib.sha256()
+    # The extension picks the converter, so it is part of the key
+    hasher.update(path.lower().split('.')[-1].encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    digest = hasher.hexdigest()
+    with _conversions_lock:
+        _digests[file_key] = digest
+        while len(_digests) > DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    return digest
+
+
+def submit(path: str) -> Future:
+    """
+    Start converting an image or document in the background. Converting a file
+    with the same content again reuses the first result while it is cached.
+    Reads and hashes the file the first time, so call it from a thread in async code.
+
+    Returns:
+        Future resolving to the PDF bytes
+    """
+    convert = image_to_pdf_bytes if is_image(path) else document_to_pdf_bytes
+    key = _cache_key(path)
+    with _conversions_lock:
+        future = _conversions.get(key)
+        if future is None:
+            future = _get_executor().submit(convert, path)
+            _conversions[key] = future
+            while len(_conversions) > CACHE_SIZE:
+                # An evicted conversion that is still running finishes for whoever holds its future
+                _conversions.popitem(last=False)
+        else:
+            _conversions.move_to_end(key)
+    return future
+
+
+def get_pdf_bytes(path: str) -> bytes:
+    """Converted PDF bytes for a file, waiting for a conversion that is still running."""
+    return submit(path).result()
+
+
+def shutdown():
+    """Stop the worker processes."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+    with _conversions_lock:
+        _conversions.clear()
+        _digests.clear()
@@ -0,0 +1,182 @@
+"""
+Exhibit Index
+Text of the user's uploaded evidence, extracted once per upload, chunked and
+embedded into a small per-session vector index. Chat turns pull the few
+snippets relevant to the message into the prompt, so the model can quote
+dates and amounts from a termination letter without the user retyping them.
+
+Text comes from the PDF text layer, from .txt and .docx files, and from
+images through Tesseract OCR when pytesseract is installed and EXHIBIT_OCR=1.
+
+Configure with environment variables:
+    EXHIBIT_OCR=0                    1 runs OCR on image exhibits
+    EXHIBIT_CHUNK_CHARS=800          characters per indexed chunk
+    EXHIBIT_MAX_CHUNKS=50            chunks indexed per file, to bound embedding calls
+    EXHIBIT_SNIPPETS=3               snippets added to a chat turn
+    EXHIBIT_SNIPPET_MIN_SCORE=0.55   cosine similarity a snippet needs to be added
+"""
+
+import io
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from services.log import log
+
+OCR_ENABLED = os.getenv("EXHIBIT_OCR", "0") == "1"
+CHUNK_CHARS = int(os.getenv("EXHIBIT_CHUNK_CHARS", "800"))
+MAX_CHUNKS = int(os.getenv("EXHIBIT_MAX_CHUNKS", "50"))
+SNIPPETS = int(os.getenv("EXHIBIT_SNIPPETS", "3"))
+SNIPPET_MIN_SCORE = float(os.getenv("EXHIBIT_SNIPPET_MIN_SCORE", "0.55"))
+
+
+def _ocr(path: str) -> str:
+    try:
+        import pytesseract
+        from PIL import Image
+    except ImportError:
+        log("⚠ EXHIBIT_OCR=1 but pytesseract is not installed, skipping {file}", level="warning", file=path)
+        return ""
+    with Image.open(path) as image:
+        return pytesseract.image_to_string(image)
+
+
+def extract_pages(path: str) -> List[str]:
+    """
+    Text of an exhibit, one string per page.
+
+    Args:
+        path: Path to an uploaded file
+
+    Returns:
+        Page texts. Files without extractable text give an empty list.
+    """
+    from services import exhibit_images
+    from services.exhibit_documents import read_docx_paragraphs, read_text_file
+
+    ext = path.lower().split('.')[-1]
+    if ext == "pdf":
+        from pypdf import PdfReader
+        return [page.extract_text() or "" for page in PdfReader(path).pages]
+    if ext == "txt":
+        return [read_text_file(path)]
+    if ext == "docx":
+        return ["\n".join(read_docx_paragraphs(path))]
+    if exhibit_images.is_image(path) and OCR_ENABLED:
+        return [_ocr(path)]
+    return []
+
+
+def chunk_pages(pages: List[str], size: int = CHUNK_CHARS) -> List[Dict]:
+    """
+    Split page texts into chunks of about `size` characters along paragraph lines.
+
+    Returns:
+        List of {"page": 1-based page number, "text": chunk}
+    """
+    chunks = []
+    for page_number, text in enumerate(pages, start=1):
+        current = ""
+        for paragraph in text.split("\n"):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            # Paragraphs longer than a chunk are cut at the size limit
+            while len(paragraph) > size:
+                if current:
+                    chunks.append({"page": page_number, "text": current})
+                    current = ""
+                chunks.append({"page": page_number, "text": paragraph[:size]})
+                paragraph = paragraph[size:]
+            if len(current) + len(paragraph) + 1 > size and current:
+                chunks.append({"page": page_number, "text": current})
+                current = ""
+            current = f"{current}\n{paragraph}" if current else paragraph
+        if current:
+            chunks.append({"page": page_number, "text": current})
+    return chunks
+
+
+def index_file(path: str) -> List[Dict]:
+    """
+    Extract, chunk and embed one exhibit. Runs outside any session lock, since
+    the embedding calls are the slow part.
+
+    Returns:
+        Chunks with "file", "page", "text" and "embedding"
+    """
+    from services.gemini_client import get_embedding
+
+    chunks = chunk_pages(extract_pages(path))[:MAX_CHUNKS]
+    name = os.path.basename(path)
+    for chunk in chunks:
+        chunk["file"] = name
+        # Uncached, so exhibit chunks do not push other replies out of the response cache
+        chunk["embedding"] = get_embedding(chunk["text"], use_cache=False)
+    return chunks
+
+
+class ExhibitIndex:
+    """A session's indexed exhibit chunks, searchable by embedding."""
+
+    def __init__(self, chunks: Optional[List[Dict]] = None, embeddings=None):
+        import numpy as np
+
+        self.chunks = chunks or []
+        self.embeddings = embeddings if embeddings is not None else np.zeros((0, 0), dtype=np.float32)
+        self.files = sorted({chunk["file"] for chunk in self.chunks})
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def add(self, chunks: List[Dict]):
+        """Add chunks from index_file(). Re-indexing a file replaces its old chunks."""
+        import numpy as np
+
+        if not chunks:
+            return
+        with self._lock:
+            files = {chunk["file"] for chunk in chunks}
+            keep = [i for i, chunk in enumerate(self.chunks) if chunk["file"] not in files]
+            new_embeddings = np.asarray([chunk.pop("embedding") for chunk in chunks], dtype=np.float32)
+            old_embeddings = self.embeddings[keep] if keep else np.zeros((0, new_embeddings.shape[1]), np.float32)
+            self.chunks = [self.chunks[i] for i in keep] + chunks
+            self.embeddings = np.vstack([old_embeddings, new_embeddings])
+            self.files = sorted({chunk["file"] for chunk in self.chunks})
+
+    def search(self, query_embedding: List[float], k: int = SNIPPETS,
+               min_score: float = SNIPPET_MIN_SCORE) -> List[Dict]:
+        """
+        The chunks most similar to a query.
+
+        Returns:
+            Chunks with a "score", best first
+        """
+        import numpy as np
+
+        if not self.chunks:
+            return []
+        scores = self.embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        best = np.argsort(-scores)[:k]
+        return [{**self.chunks[i], "score": float(scores[i])} for i in best.tolist() if scores[i] >= min_score]
+
+    def to_bytes(self) -> bytes:
+        import numpy as np
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, embeddings=self.embeddings, chunks=np.array(json.dumps(self.chunks)))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ExhibitIndex":
+        import numpy as np
+
+        with np.load(io.BytesIO(data)) as stored:
+            return cls(json.loads(str(stored["chunks"])), stored["embeddings"])
+
+
+def format_snippets(snippets: List[Dict]) -> str:
+    """Snippets as prompt text, each labelled with its file and page."""
+    return "\n\n".join(f"[{s['file']}, page {s['page']}]\n{s['text']}" for s in snippets)
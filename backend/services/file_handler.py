@@ -1,38 +1,75 @@
+import io
 import os
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Image
-from PyPDF2 import PdfReader, PdfWriter
-from PIL import Image
-from textwrap import wrap
+from functools import lru_cache
+from services import exhibit_images
+from services.log import log
 
-i = 1
+# reportlab and pypdf are imported inside the functions that use them,
+# which keeps them off the app's import path
 
-def create_title_page(title, path="temp_title.pdf"):
-    """Create a PDF page with the title centered."""
+def create_title_page(title, path=None):
+    """Create a PDF page with the title centered. Returns a buffer if no path is given."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    if path is None:
+        path = io.BytesIO()
     c = canvas.Canvas(path, pagesize=letter)
     width, height = letter
     c.setFont("Helvetica-Bold", 24)
     c.drawCentredString(width / 2, height / 2, title)
     c.showPage()
     c.save()
+    if not isinstance(path, str):
+        path.seek(0)
     return path
 
-def combine_pdfs(file_list):
-    global i
+def create_title_pages(titles):
+    """Create one PDF with a centered title page per title, all sharing one font object."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    for title in titles:
+        c.setFont("Helvetica-Bold", 24)
+        c.drawCentredString(width / 2, height / 2, title)
+        c.showPage()
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+def combine_pdfs(file_list, output_pdf="files.pdf", optimize=None):
+    """
+    Combine the uploaded exhibits into one PDF, each behind a title page.
+
+    Args:
+        file_list: Paths of the uploaded files
+        output_pdf: Path to write to, or a writable binary stream
+        optimize: Compress and deduplicate the output. Defaults to PDF_OPTIMIZE.
+    """
+    from pypdf import PdfReader, PdfWriter
+    from services.pdf_optimizer import OPTIMIZE_BY_DEFAULT, optimize_writer
+
     pdf_writer = PdfWriter()
 
+    # Make sure every image and document is converting in parallel before walking the list
     for file in file_list:
-        ext = file.lower().split('.')[-1]
+        if exhibit_images.is_convertible(file):
+            exhibit_images.submit(file)
+
+    titles = []
+    for number, file in enumerate(file_list, start=1):
         # Remove the file extension for the title
-        title = 'Exhibit {}'.format(i) + ": " + os.path.splitext(os.path.basename(file))[0]
-        i += 1
+        titles.append('Exhibit {}'.format(number) + ": " + os.path.splitext(os.path.basename(file))[0])
+    title_pages = PdfReader(create_title_pages(titles)).pages if titles else []
+
+    for file, title_page in zip(file_list, title_pages):
+        ext = file.lower().split('.')[-1]
 
-        # 1. Add title page
-        title_pdf_path = create_title_page(title)
-        title_reader = PdfReader(title_pdf_path)
-        pdf_writer.add_page(title_reader.pages[0])
-        os.remove(title_pdf_path)
+        # 1. Add title page, built in memory
+        pdf_writer.add_page(title_page)
 
         # 2. Add the actual file
         if ext == "pdf":
@@ -40,28 +77,112 @@ def combine_pdfs(file_list):
             for page in pdf_reader.pages:
                 pdf_writer.add_page(page)
 
-        elif ext in ["jpg", "jpeg", "png"]:
-            image = Image.open(file).convert("RGB")
-            temp_path = "temp_image.pdf"
-            image.save(temp_path)
-            pdf_reader = PdfReader(temp_path)
-            pdf_writer.add_page(pdf_reader.pages[0])
-            os.remove(temp_path)
+        elif exhibit_images.is_convertible(file):
+            # Usually already converted in the background when the file was uploaded
+            pdf_reader = PdfReader(io.BytesIO(exhibit_images.get_pdf_bytes(file)))
+            for page in pdf_reader.pages:
+                pdf_writer.add_page(page)
 
         else:
-            print(f"Skipping unsupported file: {file}")
+            log("Skipping unsupported file: {file}", level="warning", file=file)
+
+    if optimize if optimize is not None else OPTIMIZE_BY_DEFAULT:
+        optimize_writer(pdf_writer)
+
+    if isinstance(output_pdf, str):
+        with open(output_pdf, "wb") as out_file:
+            pdf_writer.write(out_file)
+        log("Combined PDF with title pages saved to {path}", path=output_pdf)
+    else:
+        pdf_writer.write(output_pdf)
+
+@lru_cache(maxsize=None)
+def _font_metrics(font_name):
+    """Width of every Latin-1 glyph at size 1, looked up once per font."""
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    return [stringWidth(chr(c), font_name, 1) for c in range(256)]
+
+def text_width(text, font_name="Helvetica", font_size=12):
+    """Width of text in points, using the cached font metrics."""
+    widths = _font_metrics(font_name)
+    total = 0.0
+    for ch in text:
+        code = ord(ch)
+        if code < 256:
+            total += widths[code]
+        else:
+            from reportlab.pdfbase.pdfmetrics import stringWidth
+            total += stringWidth(ch, font_name, 1)
+    return total * font_size
+
+def wrap_by_width(line, max_width, font_name="Helvetica", font_size=12):
+    """
+    Wrap one paragraph so every line fits within max_width points.
+
+    Words longer than a whole line are split across lines.
+    """
+    words = line.split()
+    if not words:
+        return []
+
+    space = text_width(" ", font_name, font_size)
+    lines = []
+    current, current_width = [], 0.0
+    for word in words:
+        word_width = text_width(word, font_name, font_size)
+
+        # Split words that can never fit on one line, keeping the tail as the current word
+        if word_width > max_width:
+            if current:
+                lines.append(" ".join(current))
+                current, current_width = [], 0.0
+            piece, piece_width = "", 0.0
+            for ch in word:
+                char_width = text_width(ch, font_name, font_size)
+                if piece and piece_width + char_width > max_width:
+                    lines.append(piece)
+                    piece, piece_width = "", 0.0
+                piece += ch
+                piece_width += char_width
+            word, word_width = piece, piece_width
+
+        needed = word_width if not current else current_width + space + word_width
+        if needed <= max_width:
+            current.append(word)
+            current_width = needed
+        else:
+            lines.append(" ".join(current))
+            current, current_width = [word], word_width
 
-    with open("files.pdf", "wb") as out_file:
-        pdf_writer.write(out_file)
+    if current:
+        lines.append(" ".join(current))
+    return lines
 
-    print(f"Combined PDF with title pages saved to {"files.pdf"}")
+def write_text_pdf(paragraphs, output, title=None):
+    """
+    Lay out text as a PDF and write it out.
 
-def text_to_pdf(text, output_path="text_output.pdf", title=None):
-    """Convert plain text into a nicely formatted PDF."""
-    c = canvas.Canvas(output_path, pagesize=letter)
+    reportlab keeps the whole document in memory until it is saved, so this
+    does not stream: the PDF is written in one go once every page is laid out.
+
+    Args:
+        paragraphs: The text, either one string or any iterable of lines, so very
+                    long statements can be fed in without building one big string
+        output: Path to write to, or a writable binary stream
+        title: Optional title at the top of the first page
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    if isinstance(paragraphs, str):
+        paragraphs = paragraphs.splitlines()
+
+    c = canvas.Canvas(output, pagesize=letter)
     width, height = letter
     margin = 50
     line_height = 14
+    font_name, font_size = "Helvetica", 12
     y = height - margin
 
     # Optional title at the top
@@ -70,23 +191,35 @@ def text_to_pdf(text, output_path="text_output.pdf", title=None):
         c.drawCentredString(width / 2, y, title)
         y -= 30
 
-    c.setFont("Helvetica", 12)
-
-    # Wrap text to fit within page width
-    max_chars_per_line = 90
-    wrapped_text = []
-    for line in text.splitlines():
-        wrapped_text.extend(wrap(line, max_chars_per_line))
-        wrapped_text.append("")  # Blank line between paragraphs
+    # One text object per page instead of one drawString call per line
+    text = c.beginText(margin, y)
+    text.setFont(font_name, font_size)
+    text.setLeading(line_height)
+
+    for paragraph in paragraphs:
+        # Blank line between paragraphs
+        for line in wrap_by_width(paragraph, width - 2 * margin, font_name, font_size) + [""]:
+            if y < margin:  # Start a new page if space runs out
+                c.drawText(text)
+                c.showPage()
+                y = height - margin
+                text = c.beginText(margin, y)
+                text.setFont(font_name, font_size)
+                text.setLeading(line_height)
+            text.textLine(line)
+            y -= line_height
+
+    c.drawText(text)
+    c.save()
 
-    for line in wrapped_text:
-        if y < margin:  # Start a new page if space runs out
-            c.showPage()
-            c.setFont("Helvetica", 12)
-            y = height - margin
-        c.drawString(margin, y, line)
-        y -= line_height
+def render_text_pdf(text, title=None):
+    """Convert plain text into a nicely formatted PDF and return its bytes."""
+    buffer = io.BytesIO()
+    write_text_pdf(text, buffer, title=title)
+    return buffer.getvalue()
 
-    c.save()
-    print(f"Text PDF saved to {output_path}")
-    return output_path
\ No newline at end of file
+def text_to_pdf(text, output_path="text_output.pdf", title=None):
+    """Convert plain text into a nicely formatted PDF."""
+    write_text_pdf(text, output_path, title=title)
+    log("Text PDF saved to {path}", path=output_path)
+    return output_path
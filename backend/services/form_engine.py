@@ -0,0 +1,218 @@
+"""
+Form Engine
+The one place forms are filled. A FormTemplate parses a form once, from a
+path, bytes or a binary stream, and every fill clones that parsed template
+into a new writer. The source is never read or parsed again, and the clone
+shares the template's stream data instead of copying it.
+
+Values are applied page by page, each page getting only the values of the
+fields it has widgets for. pypdf matches every widget against every value it
+is given, so this turns a fill from widgets x fields name lookups into about
+widgets x fields-on-the-page.
+
+Forms read from a path are memory-mapped, so every worker process on a host
+reads the same page cache copy of the file. serve.py parses the bundled forms
+with preload_templates before forking, and the workers share those too.
+
+PDFFormFiller (services/pdf_form_handler_class.py) and fill_pdf_form
+(services/pdf_form_handler.py) are thin wrappers around this module.
+
+FORM_TEMPLATE_CACHE (default 32) is how many parsed forms a process keeps;
+the least recently used one is dropped first.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, Optional, Union
+
+from pypdf import PdfReader, PdfWriter
+
+from services.form_index import field_pages
+from services.log import log
+from services.pdf_flatten import FLATTEN_BY_DEFAULT, flatten_writer, widget_layout
+from services.pdf_optimizer import OPTIMIZE_BY_DEFAULT, optimize_writer
+
+Source = Union[str, bytes, BinaryIO]
+Output = Union[str, BinaryIO, None]
+
+# Parsed templates, keyed by absolute path or by content hash for bytes and
+# streams, least recently used first
+_templates: "OrderedDict[str, FormTemplate]" = OrderedDict()
+_templates_lock = threading.Lock()
+TEMPLATE_CACHE_SIZE = int(os.getenv("FORM_TEMPLATE_CACHE", "32"))
+
+
+class FormTemplate:
+    """A parsed form, shared by every fill of it."""
+
+    def __init__(self, source: Source, name: Optional[str] = None):
+        """
+        Args:
+            source: Path to the PDF, its bytes, or a binary stream positioned at its start
+            name: Name for logs and metrics, defaults to the file name
+        """
+        if isinstance(source, str):
+            self.name = name or os.path.basename(source)
+            # pypdf would read the whole file into a private buffer
+            with open(source, "rb") as f:
+                self.reader = PdfReader(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            data = source if isinstance(source, bytes) else source.read()
+            self.name = name or "form.pdf"
+            self.reader = PdfReader(io.BytesIO(data))
+        self.fields = self.reader.get_fields() or {}
+        # pypdf objects are not thread safe, so only one clone reads the reader at a time
+        self.lock = threading.Lock()
+        self._page_fields: Optional[List[set]] = None
+        self._layout = None
+
+    @property
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    def page_fields(self) -> List[set]:
+        """Names of the fields with a widget on each page, found once per template."""
+        if self._page_fields is None:
+            with self.lock:
+                by_page = [set() for _ in self.reader.pages]
+                for name, pages in field_pages(self.reader).items():
+                    for page in pages:
+                        by_page[page].add(name)
+                self._layout = widget_layout(self.reader)
+            self._page_fields = by_page
+        return self._page_fields
+
+    def _values_by_page(self, values: Dict[str, str], pages: List[int]) -> Dict[int, Dict[str, str]]:
+        page_fields = self.page_fields()
+        # pypdf also matches a widget's partial name. Such values are offered to every page.
+        unplaced = {name: value for name, value in values.items()
+                    if not any(name in fields for fields in page_fields)}
+        by_page = {}
+        for page in pages:
+            page_values = {name: value for name, value in values.items() if name in page_fields[page]}
+            page_values.update(unplaced)
+            if page_values:
+                by_page[page] = page_values
+        return by_page
+
+    def new_writer(self) -> PdfWriter:
+        """A private copy of the form to fill."""
+        writer = PdfWriter()
+        with self.lock:
+            writer.clone_reader_document_root(self.reader)
+        return writer
+
+    def fill(self,
+             values: Dict[str, str],
+             output: Output = None,
+             pages: Union[int, List[int], None] = None,
+             optimize: Optional[bool] = None,
+             flatten: Optional[bool] = None) -> Optional[bytes]:
+        """
+        Fill the form.
+
+        Args:
+            values: Dictionary mapping field names to values
+            output: Path or writable binary stream to write to. None returns the PDF as bytes.
+            pages: Page index (0-based), list of indexes, or None for all pages
+            optimize: Compress and deduplicate the output. Defaults to PDF_OPTIMIZE.
+            flatten: Draw the values into the pages and drop the interactive form.
+                Defaults to PDF_FLATTEN.
+
+        Returns:
+            The filled PDF as bytes when output is None, otherwise None
+        """
+        writer = self.new_writer()
+        flatten = flatten if flatten is not None else FLATTEN_BY_DEFAULT
+
+        if pages is None:
+            pages = list(range(len(writer.pages)))
+        elif not isinstance(pages, list):
+            pages = [pages]
+
+        for page, page_values in self._values_by_page(values, pages).items():
+            try:
+                # Interactive output keeps /NeedAppearances true so viewers redraw the values.
+                # Flattened output has no form left for a viewer to redraw.
+                writer.update_page_form_field_values(writer.pages[page], page_values, auto_regenerate=not flatten)
+            except Exception as e:
+                log("⚠ Could not update page {page}: {error}", level="warning", page=page + 1, error=e)
+
+        if flatten:
+            flatten_writer(writer, self._layout)
+
+        if optimize if optimize is not None else OPTIMIZE_BY_DEFAULT:
+            optimize_writer(writer)
+
+        if output is None:
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            return buffer.getvalue()
+        if isinstance(output, str):
+            with open(output, 'wb') as output_file:
+                writer.write(output_file)
+        else:
+            writer.write(output)
+        return None
+
+
+def load_template(source: Source, name: Optional[str] = None) -> FormTemplate:
+    """
+    Parse a form once per process and share it between fills.
+
+    Args:
+        source: Path to the PDF, its bytes, or a binary stream
+        name: Name for logs and metrics
+
+    Returns:
+        The shared FormTemplate
+    """
+    if isinstance(source, str):
+        key = os.path.abspath(source)
+    else:
+        if not isinstance(source, bytes):
+            source = source.read()
+        key = hashlib.sha256(source).hexdigest()
+
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            return template
+
+    # Parse outside the lock so several forms can be loaded at once
+    parsed = FormTemplate(source, name)
+    with _templates_lock:
+        template = _templates.setdefault(key, parsed)
+        _templates.move_to_end(key)
+        while len(_templates) > TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+    return template
+
+
+def preload_templates(paths: List[str]) -> List[FormTemplate]:
+    """
+    Parse forms completely: their fields, their page layout and every object
+    a fill copies. Run before forking workers, so they share the parsed forms
+    instead of each parsing its own on first use.
+
+    Args:
+        paths: Paths of the PDFs
+
+    Returns:
+        The shared FormTemplates
+    """
+    templates = []
+    for path in paths:
+        template = load_template(path)
+        if template._page_fields is None:
+            template.page_fields()
+            # Cloning once resolves and caches every object of the form in the reader
+            template.new_writer()
+        templates.append(template)
+    log("📑 Parsed {count} form templates", count=len(templates))
+    return templates
@@ -0,0 +1,234 @@
+"""
+Form Index
+Field metadata for every bundled form, built in one pass per PDF and cached
+as JSON keyed by the PDF's SHA-256. Workers start from the cache in
+milliseconds and only re-parse a form whose file changed.
+
+For each form the index has its page count and, for each field:
+    type            the raw /FT (/Tx, /Btn, /Ch, /Sig), "Unknown" for containers
+    kind            text, checkbox, radio, pushbutton, choice, signature or container
+    states          appearance states a checkbox or radio button accepts, e.g. ["/Off", "/Yes"]
+    options         /Opt export values or choices
+    label           the /TU tooltip, usually the field's human name
+    max_len, flags  /MaxLen and /Ff
+    pages           1-based pages the field's widgets are on
+    section         the field's parent in the name hierarchy, or "Page N"
+
+Set FORM_INDEX_CACHE to move the cache file (default form_index.json).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from services.log import log
+
+FORMAT_VERSION = 1
+CACHE_PATH = os.getenv("FORM_INDEX_CACHE", "form_index.json")
+
+# /Ff bits for buttons
+_RADIO = 1 << 15
+_PUSHBUTTON = 1 << 16
+
+_KINDS = {"/Tx": "text", "/Ch": "choice", "/Sig": "signature"}
+
+# abspath -> metadata of the forms loaded into this process
+_forms: Dict[str, Dict] = {}
+_forms_lock = threading.Lock()
+
+
+def file_hash(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _kind(field) -> str:
+    field_type = field.get("/FT")
+    if field_type == "/Btn":
+        flags = int(field.get("/Ff", 0))
+        if flags & _PUSHBUTTON:
+            return "pushbutton"
+        return "radio" if flags & _RADIO else "checkbox"
+    return _KINDS.get(field_type, "container")
+
+
+def _button_states(field, states) -> list:
+    states = [str(state) for state in states or []]
+    # Every checkbox and radio button can be cleared, even when /Off has no appearance
+    if field.get("/FT") == "/Btn" and states and "/Off" not in states:
+        states.append("/Off")
+    return states
+
+
+def _full_name(annotation) -> Optional[str]:
+    names = []
+    node = annotation
+    while node is not None:
+        if "/T" in node:
+            names.append(str(node["/T"]))
+        node = node.get("/Parent")
+        node = node.get_object() if node is not None else None
+    return ".".join(reversed(names)) if names else None
+
+
+def field_pages(reader) -> Dict[str, List[int]]:
+    """
+    Map each field's fully qualified name to the 0-based pages its widgets are on.
+    Widgets live on pages, so one walk over the annotations gives the map.
+    """
+    pages = {}
+    for page_index, page in enumerate(reader.pages):
+        for annotation in page.get("/Annots") or []:
+            annotation = annotation.get_object()
+            if annotation.get("/Subtype") != "/Widget":
+                continue
+            name = _full_name(annotation)
+            if name is not None and page_index not in pages.setdefault(name, []):
+                pages[name].append(page_index)
+    return pages
+
+
+def build_form_metadata(pdf_path: str, digest: Optional[str] = None) -> Dict:
+    """
+    Parse a form PDF once and collect its field metadata.
+
+    Args:
+        pdf_path: Path to the PDF
+        digest: The file's SHA-256, if already known
+
+    Returns:
+        Metadata dict as described in the module docstring
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_path)
+    raw_fields = reader.get_fields() or {}
+
+    fields = {}
+    for name, field in raw_fields.items():
+        states = field.get("/_States_")
+        options = field.get("/Opt")
+        fields[name] = {
+            "type": field.get("/FT", "Unknown"),
+            "kind": _kind(field),
+            "states": _button_states(field, states),
+            "options": [str(o[0] if isinstance(o, list) else o) for o in options] if options else [],
+            "label": str(field["/TU"]) if "/TU" in field else None,
+            "max_len": int(field["/MaxLen"]) if "/MaxLen" in field else None,
+            "flags": int(field.get("/Ff", 0)),
+            "pages": [],
+            "section": name.rsplit(".", 1)[0] if "." in name else None,
+        }
+
+    for name, pages in field_pages(reader).items():
+        if name in fields:
+            fields[name]["pages"] = [page + 1 for page in pages]
+
+    # Containers are on the pages of the fields under them
+    for name, info in list(fields.items()):
+        parent = name
+        while info["pages"] and "." in parent:
+            parent = parent.rsplit(".", 1)[0]
+            if parent in fields:
+                fields[parent]["pages"] = sorted(set(fields[parent]["pages"]) | set(info["pages"]))
+
+    sections = {}
+    for name, info in fields.items():
+        if info["section"] is None:
+            info["section"] = f"Page {info['pages'][0]}" if info["pages"] else "Form"
+        sections.setdefault(info["section"], []).append(name)
+
+    return {
+        "file": os.path.basename(pdf_path),
+        "sha256": digest or file_hash(pdf_path),
+        "pages": len(reader.pages),
+        "fields": fields,
+        "sections": sections,
+    }
+
+
+def _read_cache(path: str) -> Dict[str, Dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache.get("forms", {}) if cache.get("format_version") == FORMAT_VERSION else {}
+
+
+def _write_cache(path: str, forms: Dict[str, Dict]):
+    # Write then rename, so a worker starting at the same time never reads half a file
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"format_version": FORMAT_VERSION, "forms": forms}, f)
+    os.replace(temp_path, path)
+
+
+def load_form_index(pdf_paths: Iterable[str], cache_path: str = CACHE_PATH) -> Dict[str, Dict]:
+    """
+    Load metadata for the given forms from the cache, parsing only the PDFs
+    whose hash is not cached yet. The cache is rewritten with just these
+    forms, so entries of replaced PDFs are dropped.
+
+    Args:
+        pdf_paths: Form PDFs to index
+        cache_path: JSON cache file
+
+    Returns:
+        Dict of PDF file name -> metadata
+    """
+    pdf_paths = list(pdf_paths)
+    cached = _read_cache(cache_path)
+    digests = {path: file_hash(path) for path in pdf_paths}
+
+    missing = [path for path in pdf_paths if digests[path] not in cached]
+    stale = set(cached) - set(digests.values())
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            for metadata in pool.map(lambda p: build_form_metadata(p, digests[p]), missing):
+                cached[metadata["sha256"]] = metadata
+    if missing or stale:
+        for digest in stale:
+            del cached[digest]
+        try:
+            _write_cache(cache_path, cached)
+        except OSError as e:
+            log("⚠ Could not write the form index cache: {error}", level="warning", error=e)
+        if missing:
+            log("✓ Indexed {count} form(s)", count=len(missing))
+
+    index = {}
+    with _forms_lock:
+        for path in pdf_paths:
+            metadata = cached[digests[path]]
+            _forms[os.path.abspath(path)] = metadata
+            index[os.path.basename(path)] = metadata
+    return index
+
+
+def get_form_metadata(pdf_path: str) -> Optional[Dict]:
+    """Metadata of a form loaded by load_form_index, or None."""
+    return _forms.get(os.path.abspath(pdf_path))
+
+
+def summary() -> Dict[str, Dict]:
+    """Per-form overview: pages, field counts by kind and section sizes."""
+    with _forms_lock:
+        forms = list(_forms.values())
+    overview = {}
+    for metadata in forms:
+        kinds = {}
+        for info in metadata["fields"].values():
+            kinds[info["kind"]] = kinds.get(info["kind"], 0) + 1
+        overview[os.path.splitext(metadata["file"])[0]] = {
+            "pages": metadata["pages"],
+            "fields": kinds,
+            "sections": {name: len(names) for name, names in metadata["sections"].items()},
+        }
+    return overview
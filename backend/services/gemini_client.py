@@ -1,14 +1,17 @@
-from google import genai
-from google.genai import types
-import os
+import threading
 from dotenv import load_dotenv
-import numpy as np
+from services.llm_provider import create_provider, ProviderResponse
+from services.response_cache import embedding_cache, make_cache_key, register_file, response_cache
+from services.metrics import record_usage, span
 
 load_dotenv()
 
 EMBED_DIM = 1536
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# The provider is created on first use, so importing this module needs no
+# credentials and no network. google.genai is imported lazily too.
+provider = None
+_init_lock = threading.Lock()
 
 initial_context = '''Questions, in order:
 
@@ -283,79 +286,144 @@ Questions, in order:
 
 Remember to be empathetic and professional. Ask one question at a time and wait for responses before proceeding.'''
 
-chat = client.chats.create(
-    model="gemini-2.5-flash",
-    history=[
-        types.Content(
-            role="user",
-            parts=[
-                types.Part(text=initial_context)
-            ]
-        ),
-        types.Content(
-            role="model",
-            parts=[
-                types.Part(text="Understood! Bring in your first client.")
-            ]
-        ),
-        types.Content(
-            role="user",
-            parts=[
-                types.Part(text="Here is my first client.")
-            ]
-        ),
-        types.Content(
-            role="model",
-            parts=[
-                types.Part(text="Hi! How can I help you today?")
-            ]
-        ),
-    ]
-)
-
-form_chat = None
-
-def create_form_chat_client(report: str, template):
-    global form_chat
-    form_chat = client.chats.create(
+def _turns_to_contents(turns):
+    """Rebuild genai contents from a stored [[role, text], ...] list."""
+    from google.genai import types
+
+    return [types.Content(role=role, parts=[types.Part(text=text)]) for role, text in turns or []]
+
+def create_intake_chat(turns=None):
+    """
+    Start an intake chat.
+
+    Args:
+        turns: Earlier [role, text] turns of this conversation, to resume it
+    """
+    from google.genai import types
+
+    return get_provider().create_chat(
         model="gemini-2.5-flash",
         history=[
             types.Content(
                 role="user",
                 parts=[
-                    types.Part(text=f"Take this person's legal report. Understand it. I will ask you to do something with it: {report}")
+                    types.Part(text=initial_context)
+                ]
+            ),
+            types.Content(
+                role="model",
+                parts=[
+                    types.Part(text="Understood! Bring in your first client.")
+                ]
+            ),
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part(text="Here is my first client.")
+                ]
+            ),
+            types.Content(
+                role="model",
+                parts=[
+                    types.Part(text="Hi! How can I help you today?")
+                ]
+            ),
+            *_turns_to_contents(turns),
+        ]
+    )
+
+def create_form_chat_client(report: str, template, turns=None):
+    """
+    Start the form filling chat for a report and form template.
+
+    Args:
+        report: The confirmed report
+        template: The form's field template
+        turns: Earlier [role, text] turns of this conversation, to resume it
+
+    Returns:
+        The chat. Each session keeps its own (see services/sessions.py).
+    """
+    from google.genai import types
+    from services.prompts import FORM_CHAT_REPORT, FORM_CHAT_TEMPLATE
+
+    return get_provider().create_chat(
+        model="gemini-2.5-flash",
+        history=[
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part(text=FORM_CHAT_REPORT.render(report=report).text)
                 ],
             ),
             types.Content(
                 role="user",
                 parts=[
-                    types.Part(text=f"This is the template for the form that I am going to fill out. Go through it. If there are any keys that need more information from me in order to fill them, ask me them one by one. Once everything is finished, take the same template, populate them with the information I gave you. For any booleans that is yes, insert it as /Yes and for no, insert it as /Off Make sure to just return the json, dont attach any other words to it other than the json itself. FORMAT IT AS A JSON FILE AND RETURN THAT JSON FILE ONLY. Make sure to retain the same structure, otherwise my program will break. Then, return the same structure to me with the values populated. Here is the template: {template}")
+                    types.Part(text=FORM_CHAT_TEMPLATE.render(template=template).text)
                 ],
             ),
+            *_turns_to_contents(turns),
         ],
     )
 
-def get_form_chat():
-    return form_chat
+def get_provider():
+    """Return the shared provider, creating it on first use."""
+    global provider
+    if provider is None:
+        with _init_lock:
+            if provider is None:
+                # Gemini by default; set LLM_PROVIDER=replay to run offline (see services/llm_provider.py)
+                provider = create_provider()
+    return provider
 
-def get_client():
-    return client
+def generate(contents, model="gemini-2.5-flash", config=None, use_cache=True):
+    """
+    One-off generation outside of any chat.
 
-def get_chat():
-    return chat
+    Args:
+        contents: Prompt text or list of parts
+        model: Model name
+        config: Optional generation config
+        use_cache: Reuse the reply of an identical earlier call. Only for prompts
+                   whose answer depends on nothing but the prompt itself.
+    """
+    def call():
+        with span("gemini.generate"):
+            response = get_provider().generate(model, contents, config)
+        # Counted here so replies served from the cache are not counted again
+        record_usage(getattr(response, "usage_metadata", None))
+        return ProviderResponse(response.text, getattr(response, "usage_metadata", None))
 
-def get_embedding(text):
-    # Use the updated Gemini embedding model
-    result = client.models.embed_content(
-        model="gemini-embedding-001",
-        contents=text,
-        config=types.EmbedContentConfig(output_dimensionality=EMBED_DIM)
-    )
-    embedding_values = result.embeddings[0].values
-    # Normalize embedding for semantic similarity tasks
-    embedding_np = np.array(embedding_values)
-    normed_embedding = (embedding_np / np.linalg.norm(embedding_np)).tolist()
-    return normed_embedding
+    if not use_cache:
+        return call()
+    return response_cache.get_or_compute(make_cache_key(model, contents, config), call)
+
+def get_embedding(text, use_cache=True):
+    def embed():
+        import numpy as np
+
+        # Use the updated Gemini embedding model
+        with span("gemini.embed"):
+            embedding_values = get_provider().embed(text, "gemini-embedding-001", EMBED_DIM)
+        # Normalize embedding for semantic similarity tasks
+        embedding_np = np.array(embedding_values)
+        return (embedding_np / np.linalg.norm(embedding_np)).tolist()
+
+    if not use_cache:
+        return embed()
+    return embedding_cache.get_or_compute(make_cache_key("gemini-embedding-001", text, EMBED_DIM), embed)
+
+def upload_file(path):
+    """
+    Upload a file for use in prompts. Cached replies to prompts with the file
+    are keyed by its content, so uploading the same file again still hits.
+
+    Returns:
+        The file's URI
+    """
+    uri = get_provider().upload_file(path)
+    register_file(uri, path)
+    return uri
 
 uris = [
     "https://generativelanguage.googleapis.com/v1beta/files/o6gng2ofj179",
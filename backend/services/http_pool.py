@@ -0,0 +1,201 @@
+"""
+HTTP Pool
+One keep-alive HTTP/2 connection pool shared by the Gemini and Supabase clients,
+with a per-host concurrency cap and counters for pool saturation.
+
+Configure with environment variables:
+    HTTP_POOL_MAX_CONNECTIONS=100   total open connections
+    HTTP_POOL_MAX_KEEPALIVE=20      idle connections kept open
+    HTTP_POOL_KEEPALIVE_EXPIRY=60   seconds an idle connection is kept
+    HTTP_POOL_PER_HOST=16           concurrent requests per host, extra requests wait
+    HTTP_POOL_HTTP2=1               negotiate HTTP/2 where the server supports it
+    HTTP_POOL_TIMEOUT=120           read/write timeout in seconds
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from services.metrics import register_collector, sample
+
+
+class PoolStats:
+    """Counters for the shared pool. Read them with snapshot()."""
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.tcp_connects = 0
+        self.tls_handshakes = 0
+        self.saturated_waits = 0
+        self.wait_seconds = 0.0
+        self.in_flight_by_host = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "tcp_connects": self.tcp_connects,
+                "tls_handshakes": self.tls_handshakes,
+                "saturated_waits": self.saturated_waits,
+                "wait_seconds": round(self.wait_seconds, 4),
+                "in_flight_by_host": dict(self.in_flight_by_host),
+            }
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body wrapper that frees the host slot once the body is closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class LimitedTransport(httpx.BaseTransport):
+    """
+    httpx transport that caps concurrent requests per host and counts new
+    connections through httpcore's trace hooks.
+    """
+
+    def __init__(self, inner, per_host_limit: int, stats: PoolStats):
+        self._inner = inner
+        self._per_host_limit = per_host_limit
+        self._stats = stats
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slots_for(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self._per_host_limit)
+            return self._host_slots[host]
+
+    def _trace(self, event_name: str, info: Dict):
+        if event_name == "connection.connect_tcp.complete":
+            with self._stats._lock:
+                self._stats.tcp_connects += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._stats._lock:
+                self._stats.tls_handshakes += 1
+
+    def handle_request(self, request):
+        host = request.url.netloc.decode("ascii")
+        slots = self._slots_for(host)
+        stats = self._stats
+
+        if not slots.acquire(blocking=False):
+            start = time.perf_counter()
+            slots.acquire()
+            with stats._lock:
+                stats.saturated_waits += 1
+                stats.wait_seconds += time.perf_counter() - start
+
+        with stats._lock:
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+            stats.in_flight_by_host[host] = stats.in_flight_by_host.get(host, 0) + 1
+
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            with stats._lock:
+                stats.in_flight -= 1
+                stats.in_flight_by_host[host] -= 1
+            slots.release()
+
+        outer_trace = request.extensions.get("trace")
+
+        def trace(event_name, info):
+            self._trace(event_name, info)
+            if outer_trace is not None:
+                outer_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        try:
+            response = self._inner.handle_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    def close(self):
+        self._inner.close()
+
+
+pool_stats = PoolStats()
+
+
+def _collect_pool_stats():
+    stats = pool_stats.snapshot()
+    return [
+        *sample("http_pool_requests_total", stats["requests"], "Requests sent through the shared pool", "counter"),
+        *sample("http_pool_in_flight", stats["in_flight"], "Requests currently in flight"),
+        *sample("http_pool_tcp_connects_total", stats["tcp_connects"], "New TCP connections opened", "counter"),
+        *sample("http_pool_tls_handshakes_total", stats["tls_handshakes"], "TLS handshakes performed", "counter"),
+        *sample("http_pool_saturated_waits_total", stats["saturated_waits"], "Requests that waited for a host slot", "counter"),
+        *sample("http_pool_wait_seconds_total", stats["wait_seconds"], "Time spent waiting for a host slot", "counter"),
+    ]
+
+
+register_collector(_collect_pool_stats)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_http_client(verify=True, stats: Optional[PoolStats] = None):
+    """
+    Build an httpx.Client configured from the HTTP_POOL_* environment variables.
+
+    Args:
+        verify: Passed to httpx (a path or SSLContext to trust a test certificate)
+        stats: Counters to update, defaults to the shared pool_stats
+
+    Returns:
+        httpx.Client
+    """
+    http2 = os.getenv("HTTP_POOL_HTTP2", "1") == "1"
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "60")),
+    )
+    inner = httpx.HTTPTransport(http2=http2, limits=limits, verify=verify)
+    transport = LimitedTransport(inner, int(os.getenv("HTTP_POOL_PER_HOST", "16")), stats or pool_stats)
+    return httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(float(os.getenv("HTTP_POOL_TIMEOUT", "120")), connect=10.0),
+        follow_redirects=True,
+    )
+
+
+def get_http_client():
+    """Return the process-wide pooled client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_http_client()
+    return _client
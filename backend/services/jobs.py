@@ -0,0 +1,387 @@
+"""
+Jobs
+Background queue for slow work, such as finalising a report, so request
+handlers can return straight away. Clients follow a job through its status
+or a stream of progress events.
+
+The default backend is an in-process asyncio queue served by a pool of
+worker tasks; handlers run in threads. Another backend (a Redis or database
+queue, for example) only has to implement JobQueue.
+
+A job runs on the worker process that accepted it, but its record and
+events are also written to the session store (see services/session_store.py),
+so any worker can report its status or stream its events, which it does by
+polling the store. With SESSION_STORE=memory that only works in one process.
+Writes go through one writer thread per queue, in order, so the event loop
+never waits on the store.
+
+Configure with environment variables:
+    JOB_QUEUE=asyncio       queue backend
+    JOB_WORKERS=4           jobs run at the same time
+    JOB_QUEUE_SIZE=1000     jobs waiting before new ones are refused
+    JOB_TTL=3600            seconds a finished job's status is kept
+    JOB_POLL_INTERVAL=0.25  seconds between store reads when streaming another worker's job
+
+Usage:
+    job_queue.register("finalize_report", finalize_report)   # fn(payload, progress) -> result
+    job = job_queue.submit("finalize_report", {"session_id": "abc"})
+    async for event in job_queue.events(job.id): ...
+"""
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List, Optional
+
+from services.log import log
+from services.metrics import register_collector, sample, span
+
+if TYPE_CHECKING:
+    from services.session_store import SessionStore
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when the queue has no room for another job."""
+
+
+class Job:
+    """A unit of background work and everything that happened to it so far."""
+
+    def __init__(self, kind: str, payload: Dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.status = "queued"
+        self.events: List[Dict] = []
+        self.result = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_record(self) -> Dict:
+        """Everything about the job, for the session store."""
+        return {**self.to_dict(), "payload": self.payload, "events": self.events}
+
+    @staticmethod
+    def from_record(record: Dict) -> "Job":
+        job = Job(record["kind"], record.get("payload") or {})
+        job.id = record["job_id"]
+        job.status = record["status"]
+        job.events = record.get("events") or []
+        job.result = record.get("result")
+        job.error = record.get("error")
+        job.created = record["created"]
+        job.started = record.get("started")
+        job.finished = record.get("finished")
+        return job
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.events[-1] if self.events else None,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    """Interface every queue backend implements."""
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable] = {}
+
+    def register(self, kind: str, handler: Callable):
+        """
+        Set the function that runs jobs of a kind.
+
+        Args:
+            kind: Job kind name
+            handler: Called as handler(payload, progress) in a worker thread.
+                     progress(stage, **details) reports how far the job got.
+                     The return value becomes the job's result.
+        """
+        self._handlers[kind] = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def submit(self, kind: str, payload: Dict) -> Job:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def events(self, job_id: str) -> AsyncIterator[Dict]:
+        raise NotImplementedError
+
+    async def wait(self, job_id: str) -> Job:
+        """Wait for a job to finish."""
+        async for _ in self.events(job_id):
+            pass
+        return await asyncio.to_thread(self.get, job_id)
+
+
+class AsyncioJobQueue(JobQueue):
+    """
+    In-process queue. Jobs wait in an asyncio.Queue and a fixed number of
+    worker tasks run them in threads, so bursts queue up instead of each
+    holding a request open.
+    """
+
+    def __init__(self,
+                 workers: int = 4,
+                 max_queued: int = 1000,
+                 ttl: float = 3600,
+                 store: Optional[Callable[[], "SessionStore"]] = None,
+                 poll_interval: float = 0.25):
+        """
+        Args:
+            workers: Jobs run at the same time
+            max_queued: Jobs waiting before new ones are refused
+            ttl: Seconds a finished job's status is kept
+            store: Returns the store job records are shared through, None to keep them in this process
+            poll_interval: Seconds between store reads when following a job run by another process
+        """
+        super().__init__()
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._store = store
+        self._jobs: Dict[str, Job] = {}
+        self._listeners: Dict[str, List[asyncio.Queue]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = 0
+        self._lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self._store is not None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._writer is not None:
+            # Let the last records reach the store
+            await asyncio.to_thread(self._writer.shutdown)
+            self._writer = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def submit(self, kind: str, payload: Dict) -> Job:
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("The job queue has not been started")
+
+        self._prune()
+        job = Job(kind, payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"{self.max_queued} jobs are already waiting")
+        with self._lock:
+            self._jobs[job.id] = job
+            self._save(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job by id. Reads the store for other workers' jobs, so call it from a thread in async code."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None else self._load(job_id)
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def _save(self, job: Job):
+        """Queue a copy of the job's record for the store. Call it holding _lock, so records go out in order."""
+        if self._writer is None:
+            return
+        record = {**job.to_record(), "events": list(job.events)}
+        self._writer.submit(self._write, job.id, record)
+
+    def _write(self, job_id: str, record: Optional[Dict]):
+        try:
+            if record is None:
+                self._store().delete(self._key(job_id))
+            else:
+                self._store().put(self._key(job_id), record)
+        except Exception as e:
+            # Other workers lose sight of the job, this one still runs and reports it
+            log("⚠ Could not share job {job_id}: {error}", level="warning", job_id=job_id, error=e)
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        """A job accepted by another worker process, from the store."""
+        if self._store is None:
+            return None
+        record = self._store().get(self._key(job_id))
+        return Job.from_record(record) if record else None
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict]:
+        """
+        Yield a job's events as they happen, starting with the ones already
+        recorded, until it is done or failed.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            async for event in self._remote_events(job_id):
+                yield event
+            return
+
+        listener = asyncio.Queue()
+        with self._lock:
+            backlog = list(job.events)
+            self._listeners.setdefault(job_id, []).append(listener)
+        try:
+            for event in backlog:
+                yield event
+            if backlog and backlog[-1]["event"] in ("done", "failed"):
+                return
+            while True:
+                event = await listener.get()
+                yield event
+                if event["event"] in ("done", "failed"):
+                    return
+        finally:
+            with self._lock:
+                # _prune may have dropped the job's listeners already
+                listeners = self._listeners.get(job_id)
+                if listeners and listener in listeners:
+                    listeners.remove(listener)
+
+    async def _remote_events(self, job_id: str) -> AsyncIterator[Dict]:
+        """Follow a job run by another worker by polling its record in the store."""
+        seen = 0
+        while True:
+            job = await asyncio.to_thread(self._load, job_id)
+            if job is None:
+                return
+            for event in job.events[seen:]:
+                yield event
+                if event["event"] in ("done", "failed"):
+                    return
+            seen = len(job.events)
+            await asyncio.sleep(self.poll_interval)
+
+    def _publish(self, job: Job, event: Dict):
+        """Record an event and hand it to listeners. Safe to call from worker threads."""
+        event = {"event": event.pop("event", "progress"), "time": time.time(), **event}
+        with self._lock:
+            job.events.append(event)
+            listeners = list(self._listeners.get(job.id, []))
+            self._save(job)
+        for listener in listeners:
+            self._loop.call_soon_threadsafe(listener.put_nowait, event)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [i for i, job in self._jobs.items() if job.done and job.finished < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._listeners.pop(job_id, None)
+                if self._writer is not None:
+                    self._writer.submit(self._write, job_id, None)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._running += 1
+            try:
+                await asyncio.to_thread(self._run, job)
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        job.status = "running"
+        job.started = time.time()
+        self._publish(job, {"event": "started"})
+
+        def progress(stage: str, **details):
+            self._publish(job, {"stage": stage, **details})
+
+        try:
+            with span(f"job.{job.kind}"):
+                job.result = self._handlers[job.kind](job.payload, progress)
+            job.status = "done"
+            job.finished = time.time()
+            self._publish(job, {"event": "done", "result": job.result})
+        except Exception as e:
+            log("❌ Job {kind} {job_id} failed: {error}", level="error", kind=job.kind, job_id=job.id, error=e)
+            job.status = "failed"
+            job.error = str(e)
+            job.finished = time.time()
+            self._publish(job, {"event": "failed", "error": job.error})
+
+
+def create_job_queue() -> JobQueue:
+    """
+    Build the queue selected by the JOB_* environment variables.
+
+    Returns:
+        A JobQueue. Call start() from inside the running event loop.
+    """
+    name = os.getenv("JOB_QUEUE", "asyncio").lower()
+    if name == "asyncio":
+        def store():
+            # Imported here, the session manager is built after the job queue
+            from services.sessions import sessions
+            return sessions.store
+
+        return AsyncioJobQueue(
+            workers=int(os.getenv("JOB_WORKERS", "4")),
+            max_queued=int(os.getenv("JOB_QUEUE_SIZE", "1000")),
+            ttl=float(os.getenv("JOB_TTL", "3600")),
+            store=store,
+            poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "0.25")),
+        )
+    raise ValueError(f"Unknown JOB_QUEUE: {name}")
+
+
+job_queue = create_job_queue()
+
+
+def _collect_job_stats():
+    if not isinstance(job_queue, AsyncioJobQueue):
+        return []
+    return [
+        *sample("job_queue_depth", job_queue.depth, "Jobs waiting for a worker"),
+        *sample("job_queue_running", job_queue.running, "Jobs being run"),
+    ]
+
+
+register_collector(_collect_job_stats)
@@ -0,0 +1,385 @@
+"""
+LLM Provider
+A small interface over the model calls the backend makes, so the app can run
+against Gemini, or offline against a recorded or scripted session.
+
+Pick the provider with environment variables:
+    LLM_PROVIDER=gemini           (default) live Gemini calls
+    LLM_PROVIDER=replay           replay LLM_REPLAY_FILE without any network calls
+    LLM_RECORD_FILE=session.jsonl record every call of the chosen provider to a file
+    LLM_REPLAY_SPEED=1.0          scale recorded latencies (0 replays instantly)
+
+Every provider is wrapped in admission control, see services/admission.py.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+class ProviderResponse:
+    """Minimal stand-in for a Gemini response, exposing the same `.text`."""
+
+    def __init__(self, text: str, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class ChatSession:
+    """A multi-turn conversation with the model."""
+
+    def send_message(self, message):
+        raise NotImplementedError
+
+    def send_message_stream(self, message) -> Iterator:
+        raise NotImplementedError
+
+
+class LLMProvider:
+    """
+    Interface for everything the backend asks of a model.
+
+    Implementations: GeminiProvider, ReplayProvider and RecordingProvider.
+    """
+
+    def create_chat(self, model: str, history: Optional[list] = None) -> ChatSession:
+        raise NotImplementedError
+
+    def generate(self, model: str, contents, config=None):
+        raise NotImplementedError
+
+    def embed(self, text: str, model: str, dimensions: int) -> List[float]:
+        raise NotImplementedError
+
+    def upload_file(self, path: str) -> str:
+        raise NotImplementedError
+
+
+# --------- GEMINI ---------
+
+class GeminiProvider(LLMProvider):
+    """Live calls through the google-genai client."""
+
+    def __init__(self, api_key: Optional[str] = None):
+        from google import genai
+        from google.genai import types
+        from services.http_pool import get_http_client
+
+        # Share keep-alive connections with the Supabase client
+        self.client = genai.Client(
+            api_key=api_key or os.getenv("GEMINI_API_KEY"),
+            http_options=types.HttpOptions(httpx_client=get_http_client()),
+        )
+
+    def create_chat(self, model: str, history: Optional[list] = None):
+        # The genai chat already has send_message / send_message_stream
+        return self.client.chats.create(model=model, history=history or [])
+
+    def generate(self, model: str, contents, config=None):
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    def embed(self, text: str, model: str, dimensions: int) -> List[float]:
+        from google.genai import types
+
+        result = self.client.models.embed_content(
+            model=model,
+            contents=text,
+            config=types.EmbedContentConfig(output_dimensionality=dimensions)
+        )
+        return list(result.embeddings[0].values)
+
+    def upload_file(self, path: str) -> str:
+        return self.client.files.upload(file=path).uri
+
+
+# --------- RECORD / REPLAY ---------
+
+def _to_jsonable(value):
+    """Turn messages and history (strings, genai parts and contents) into plain JSON."""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return str(value)
+
+
+def content_hash(value) -> str:
+    """Stable hash of a message or chat history, used to match recordings."""
+    canonical = json.dumps(_to_jsonable(value), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _RecordingChat(ChatSession):
+    def __init__(self, provider: "RecordingProvider", chat, entry: Dict):
+        self._provider = provider
+        self._chat = chat
+        self._entry = entry
+
+    def send_message(self, message):
+        start = time.perf_counter()
+        response = self._chat.send_message(message)
+        self._record(message, response.text, time.perf_counter() - start)
+        return response
+
+    def send_message_stream(self, message):
+        start = time.perf_counter()
+        parts = []
+        for chunk in self._chat.send_message_stream(message):
+            parts.append(chunk.text or "")
+            yield chunk
+        self._record(message, "".join(parts), time.perf_counter() - start)
+
+    def _record(self, message, text: str, latency: float):
+        self._provider.append({"chat": self._entry["id"], "turn": {
+            "message": _to_jsonable(message),
+            "text": text,
+            "latency": round(latency, 4),
+        }})
+
+
+class RecordingProvider(LLMProvider):
+    """
+    Wraps another provider and writes every call, with its latency, to a file
+    that ReplayProvider can play back later. Each call is appended as one JSON
+    line, so recording stays cheap however long it runs (see load_recording).
+    """
+
+    def __init__(self, inner: LLMProvider, path: str):
+        self.inner = inner
+        self.path = path
+        self._chats = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8")
+
+    def append(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def create_chat(self, model: str, history: Optional[list] = None):
+        history = history or []
+        with self._lock:
+            entry = {"id": self._chats, "model": model,
+                     "history_hash": content_hash(history), "history_length": len(history)}
+            self._chats += 1
+        self.append({"chat": entry["id"], "created": entry})
+        return _RecordingChat(self, self.inner.create_chat(model, history), entry)
+
+    def generate(self, model: str, contents, config=None):
+        start = time.perf_counter()
+        response = self.inner.generate(model, contents, config)
+        self.append({"generation": {
+            "prompt_hash": content_hash([model, contents, config]),
+            "text": response.text,
+            "latency": round(time.perf_counter() - start, 4),
+        }})
+        return response
+
+    def embed(self, text: str, model: str, dimensions: int) -> List[float]:
+        start = time.perf_counter()
+        values = self.inner.embed(text, model, dimensions)
+        self.append({"embedding": {
+            "text_hash": content_hash([model, dimensions, text]),
+            "values": values,
+            "latency": round(time.perf_counter() - start, 4),
+        }})
+        return values
+
+    def upload_file(self, path: str) -> str:
+        start = time.perf_counter()
+        uri = self.inner.upload_file(path)
+        self.append({"upload": {
+            "name": os.path.basename(path),
+            "uri": uri,
+            "latency": round(time.perf_counter() - start, 4),
+        }})
+        return uri
+
+
+def load_recording(path: str) -> Dict:
+    """
+    Read a recording, either one JSON document or the JSON lines a
+    RecordingProvider writes.
+
+    Returns:
+        {"chats": [...], "generations": [...], "embeddings": [...], "uploads": [...]}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    recording = {"chats": [], "generations": [], "embeddings": [], "uploads": []}
+    chats = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if "created" in record:
+            chats[record["chat"]] = {**record["created"], "turns": []}
+            recording["chats"].append(chats[record["chat"]])
+        elif "turn" in record:
+            chats[record["chat"]]["turns"].append(record["turn"])
+        else:
+            for kind in ("generation", "embedding", "upload"):
+                if kind in record:
+                    recording[kind + "s"].append(record[kind])
+    return recording
+
+
+class _ReplayChat(ChatSession):
+    def __init__(self, provider: "ReplayProvider", turns: List[Dict], start: int = 0):
+        self._provider = provider
+        self._turns = turns
+        self._next = start
+
+    def _next_turn(self) -> Dict:
+        if not self._turns:
+            return {"text": "", "latency": 0}
+        # Loop over the recorded turns so long benchmarks never run dry
+        turn = self._turns[self._next % len(self._turns)]
+        self._next += 1
+        return turn
+
+    def send_message(self, message):
+        turn = self._next_turn()
+        self._provider.wait(turn.get("latency", 0))
+        return ProviderResponse(turn["text"])
+
+    def send_message_stream(self, message):
+        turn = self._next_turn()
+        words = turn["text"].split(" ")
+        delay = turn.get("latency", 0) / max(len(words), 1)
+        for i, word in enumerate(words):
+            self._provider.wait(delay)
+            yield ProviderResponse(word if i == 0 else " " + word)
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Deterministic offline provider.
+
+    Chats are matched to recorded chats by their starting history. A resumed
+    chat, whose history is a recorded chat's history plus the turns taken
+    since, carries on from the next recorded turn. One-off generations are
+    matched by their prompt. Both fall back to the order they were made in. Recorded latencies are slept through
+    (scaled by `speed`) so throughput benchmarks stay realistic. Embeddings that
+    were never recorded get a stable pseudo-random unit vector from the text hash.
+
+    Usage:
+        provider = ReplayProvider.from_file("session.json")
+
+        # Or script the replies directly
+        provider = ReplayProvider({"chats": [{"turns": [{"text": "Hi!"}]}],
+                                   "generations": [{"text": "CLC Unjust Dismissal"}]})
+    """
+
+    def __init__(self, recording: Dict, speed: float = 1.0):
+        self.recording = recording
+        self.speed = speed
+        self._chats_by_history = {}
+        # (history length, history hash) -> chat, for recordings that have the length
+        self._chats_by_prefix = {}
+        for chat in recording.get("chats", []):
+            self._chats_by_history.setdefault(chat.get("history_hash"), chat)
+            if "history_length" in chat:
+                self._chats_by_prefix.setdefault((chat["history_length"], chat.get("history_hash")), chat)
+        self._prefix_lengths = sorted({length for length, _ in self._chats_by_prefix}, reverse=True)
+        self._generations = {g.get("prompt_hash"): g for g in recording.get("generations", [])}
+        self._generated = 0
+        self._embeddings = {e.get("text_hash"): e for e in recording.get("embeddings", [])}
+        self._uploads = {u.get("name"): u for u in recording.get("uploads", [])}
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, speed: float = 1.0) -> "ReplayProvider":
+        return cls(load_recording(path), speed=speed)
+
+    def wait(self, seconds: float):
+        if self.speed and seconds:
+            time.sleep(seconds * self.speed)
+
+    def _match_chat(self, history: list):
+        """The recorded chat this history starts with, and how many of its turns were already taken."""
+        for length in self._prefix_lengths:
+            if length <= len(history):
+                chat = self._chats_by_prefix.get((length, content_hash(history[:length])))
+                if chat is not None:
+                    # One user and one model content per turn taken since
+                    return chat, (len(history) - length) // 2
+        return self._chats_by_history.get(content_hash(history)), 0
+
+    def create_chat(self, model: str, history: Optional[list] = None):
+        chats = self.recording.get("chats", [])
+        chat, start = self._match_chat(history or [])
+        if chat is None and chats:
+            with self._lock:
+                chat = chats[self._created % len(chats)]
+                self._created += 1
+        return _ReplayChat(self, (chat or {}).get("turns", []), start)
+
+    def generate(self, model: str, contents, config=None):
+        generations = self.recording.get("generations", [])
+        entry = self._generations.get(content_hash([model, contents, config]))
+        if entry is None and generations:
+            with self._lock:
+                entry = generations[self._generated % len(generations)]
+                self._generated += 1
+        entry = entry or {"text": "", "latency": 0}
+        self.wait(entry.get("latency", 0))
+        return ProviderResponse(entry["text"])
+
+    def embed(self, text: str, model: str, dimensions: int) -> List[float]:
+        entry = self._embeddings.get(content_hash([model, dimensions, text]))
+        if entry is not None:
+            self.wait(entry.get("latency", 0))
+            return entry["values"]
+
+        import numpy as np
+
+        seed = int(content_hash(text)[:8], 16)
+        values = np.random.default_rng(seed).standard_normal(dimensions)
+        return (values / np.linalg.norm(values)).tolist()
+
+    def upload_file(self, path: str) -> str:
+        entry = self._uploads.get(os.path.basename(path))
+        if entry is None:
+            return f"local://{os.path.basename(path)}"
+        self.wait(entry.get("latency", 0))
+        return entry["uri"]
+
+
+def create_provider() -> LLMProvider:
+    """
+    Build the provider selected by the LLM_* environment variables.
+
+    Returns:
+        An LLMProvider, wrapped in a RecordingProvider if LLM_RECORD_FILE is set,
+        and in admission control
+    """
+    from services.admission import admitted
+
+    name = os.getenv("LLM_PROVIDER", "gemini").lower()
+    if name == "replay":
+        provider = ReplayProvider.from_file(
+            os.getenv("LLM_REPLAY_FILE", "llm_session.json"),
+            speed=float(os.getenv("LLM_REPLAY_SPEED", "1.0")),
+        )
+    elif name == "gemini":
+        provider = GeminiProvider()
+    else:
+        raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+
+    record_path = os.getenv("LLM_RECORD_FILE")
+    if record_path:
+        provider = RecordingProvider(provider, record_path)
+    return admitted(provider)
@@ -0,0 +1,46 @@
+"""
+Log
+Replacement for the backend's print calls. The message is a format string
+and the values are passed separately, so nothing is formatted unless the
+line is actually written.
+
+Pick the output with LOG_MODE:
+    LOG_MODE=print   (default) plain lines on stdout, like the old prints
+    LOG_MODE=json    one JSON object per line through the "justice" logger
+    LOG_MODE=off     drop everything
+"""
+
+import json
+import logging
+import os
+
+LOG_MODE = os.getenv("LOG_MODE", "print").lower()
+
+_logger = logging.getLogger("justice")
+if LOG_MODE == "json" and not _logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+
+def log(message: str, level: str = "info", **fields):
+    """
+    Write one log line.
+
+    Args:
+        message: Format string, filled in from fields, e.g. "Loaded {count} fields"
+        level: Log level name, used by LOG_MODE=json
+        **fields: Values for the message, kept as separate keys in JSON mode
+
+    Usage:
+        log("Loaded {count} fields from {path}", count=len(fields), path=pdf_path)
+    """
+    if LOG_MODE == "off":
+        return
+    if LOG_MODE == "json":
+        record = {"level": level, "event": message, **fields}
+        _logger.log(logging.getLevelName(level.upper()), json.dumps(record, default=str))
+    else:
+        print(message.format(**fields) if fields else message)
@@ -0,0 +1,158 @@
+"""
+Metrics
+Timing spans and counters for the hot path, exposed in the Prometheus text
+format by the /metrics endpoint.
+
+Metrics live in the process that records them. With several workers (see
+serve.py) each one reports only its own requests.
+
+Usage:
+    with span("combine_pdfs"):
+        combine_pdfs(files)
+
+    record_usage(response.usage_metadata)
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from services.log import LOG_MODE, log
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_text(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, help: str, buckets: Tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count and total seconds per series, keyed by the label values."""
+        with self._lock:
+            return {
+                ",".join(str(value) for _, value in labels) or "all": {
+                    "count": series[-1], "sum_s": round(series[-2], 6)
+                }
+                for labels, series in sorted(self._series.items())
+            }
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_text(labels + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(labels + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(labels)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_label_text(labels)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Time spent in each pipeline stage")
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time spent serving each endpoint")
+LLM_TOKENS = Counter("llm_tokens_total", "Gemini tokens used, from response usage metadata")
+
+_metrics = [STAGE_SECONDS, REQUEST_SECONDS, LLM_TOKENS]
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def register(metric):
+    """Add a Counter or Histogram to the /metrics output."""
+    _metrics.append(metric)
+    return metric
+
+
+def sample(name: str, value, help: str, kind: str = "gauge") -> List[str]:
+    """Exposition lines for a single unlabelled value, for use in collectors."""
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+def register_collector(collect: Callable[[], List[str]]):
+    """Add a function returning extra exposition lines, read at scrape time."""
+    _collectors.append(collect)
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """Time a block of code into stage_duration_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        if LOG_MODE == "json":
+            log("span", stage=stage, seconds=round(seconds, 6), **fields)
+
+
+def record_usage(usage_metadata):
+    """Count the tokens reported in a Gemini response's usage metadata."""
+    if usage_metadata is None:
+        return
+    counts = {
+        "prompt": getattr(usage_metadata, "prompt_token_count", None) or 0,
+        "candidates": getattr(usage_metadata, "candidates_token_count", None) or 0,
+        "total": getattr(usage_metadata, "total_token_count", None) or 0,
+    }
+    for kind, count in counts.items():
+        if count:
+            LLM_TOKENS.inc(count, kind=kind)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    for collect in _collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
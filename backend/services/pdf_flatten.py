@@ -0,0 +1,215 @@
+"""
+PDF Flattener
+Turns a filled form into a print-ready PDF: each field's appearance is drawn
+into its page's content once, on the server, and the interactive form is
+removed. Viewers then show exactly what was filled without re-rendering
+fields on open, which browser viewers do slowly and inconsistently.
+
+Widget positions are cached per template (see widget_layout), and the
+appearance XObjects keep pointing at the form's shared /DR fonts, so each
+font is written once however many fields use it.
+
+Set PDF_FLATTEN=1 to flatten every filled form by default.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    StreamObject,
+)
+
+FLATTEN_BY_DEFAULT = os.getenv("PDF_FLATTEN", "0") == "1"
+
+# Annotation flag bits
+_HIDDEN = 1 << 1
+_NO_VIEW = 1 << 5
+
+# id(reader) -> (reader, layout). The reader is kept so the id is never reused.
+_layouts: Dict[int, Tuple[PdfReader, List[List[int]]]] = {}
+_layouts_lock = threading.Lock()
+
+
+def widget_layout(reader: PdfReader) -> List[List[int]]:
+    """
+    Positions of the visible widget annotations in each page's /Annots, found
+    once per parsed template. Cloned writers keep the same annotation order,
+    so the positions hold for every fill of the template.
+
+    Args:
+        reader: The template's reader
+
+    Returns:
+        One list of /Annots indexes per page
+    """
+    cached = _layouts.get(id(reader))
+    if cached is not None:
+        return cached[1]
+
+    layout = []
+    for page in reader.pages:
+        indexes = []
+        for i, annotation in enumerate(page.get("/Annots") or []):
+            annotation = annotation.get_object()
+            if annotation.get("/Subtype") != "/Widget":
+                continue
+            if int(annotation.get("/F", 0)) & (_HIDDEN | _NO_VIEW):
+                continue
+            indexes.append(i)
+        layout.append(indexes)
+
+    with _layouts_lock:
+        _layouts[id(reader)] = (reader, layout)
+    return layout
+
+
+def _appearance(annotation) -> Optional[StreamObject]:
+    appearances = annotation.get("/AP")
+    if appearances is None or "/N" not in appearances:
+        return None
+    normal = appearances["/N"].get_object()
+    if isinstance(normal, StreamObject):
+        return normal
+    # Checkboxes and radio buttons have one appearance per state
+    state = annotation.get("/AS")
+    if state is None or state not in normal:
+        return None
+    return normal[state].get_object()
+
+
+def _placement(annotation, appearance) -> Optional[List[float]]:
+    """The matrix that maps an appearance onto its annotation's /Rect (PDF 32000 12.5.5)."""
+    x0, y0, x1, y1 = [float(v) for v in annotation["/Rect"]]
+    bx0, by0, bx1, by1 = [float(v) for v in appearance.get("/BBox", [0, 0, x1 - x0, y1 - y0])]
+    a, b, c, d, e, f = [float(v) for v in appearance.get("/Matrix", [1, 0, 0, 1, 0, 0])]
+
+    corners = [(a * x + c * y + e, b * x + d * y + f) for x in (bx0, bx1) for y in (by0, by1)]
+    min_x, max_x = min(x for x, _ in corners), max(x for x, _ in corners)
+    min_y, max_y = min(y for _, y in corners), max(y for _, y in corners)
+    if max_x - min_x <= 0 or max_y - min_y <= 0:
+        return None
+
+    scale_x = (max(x0, x1) - min(x0, x1)) / (max_x - min_x)
+    scale_y = (max(y0, y1) - min(y0, y1)) / (max_y - min_y)
+    return [scale_x, 0, 0, scale_y, min(x0, x1) - min_x * scale_x, min(y0, y1) - min_y * scale_y]
+
+
+def _content_stream(writer: PdfWriter, data: bytes):
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return writer._add_object(stream)
+
+
+def _reference(writer: PdfWriter, appearance: StreamObject):
+    # Appearance streams may leave out /Subtype, but a page can only Do a form XObject
+    appearance[NameObject("/Subtype")] = NameObject("/Form")
+    reference = appearance.indirect_reference
+    if reference is not None and reference.pdf is writer:
+        return reference
+    return writer._add_object(appearance)
+
+
+def flatten_writer(writer: PdfWriter, layout: Optional[List[List[int]]] = None) -> PdfWriter:
+    """
+    Flatten a filled form in place, after its values are set and before it is written.
+
+    Args:
+        writer: Writer holding the filled form
+        layout: widget_layout() of the template the writer was cloned from.
+            Without it the widgets are looked up on every page.
+
+    Returns:
+        The same writer
+    """
+    for page_index, page in enumerate(writer.pages):
+        annotations = page.get("/Annots")
+        if annotations is None:
+            continue
+        annotations = annotations.get_object()
+        if layout is not None:
+            widgets = layout[page_index]
+        else:
+            widgets = [
+                i for i, annotation in enumerate(annotations)
+                if annotation.get_object().get("/Subtype") == "/Widget"
+                and not int(annotation.get_object().get("/F", 0)) & (_HIDDEN | _NO_VIEW)
+            ]
+
+        resources = page.get("/Resources")
+        resources = resources.get_object() if resources is not None else DictionaryObject()
+        page[NameObject("/Resources")] = resources
+        xobjects = resources.get("/XObject")
+        xobjects = xobjects.get_object() if xobjects is not None else DictionaryObject()
+        resources[NameObject("/XObject")] = xobjects
+
+        drawing = []
+        for i in widgets:
+            annotation = annotations[i].get_object()
+            appearance = _appearance(annotation)
+            if appearance is None:
+                continue
+            matrix = _placement(annotation, appearance)
+            if matrix is None:
+                continue
+            name = f"/Fld{page_index}_{i}"
+            xobjects[NameObject(name)] = _reference(writer, appearance)
+            drawing.append("q {} cm {} Do Q".format(" ".join(f"{v:.4f}" for v in matrix), name))
+
+        # Every widget goes, drawn or not, so none is left for a viewer to render
+        kept = ArrayObject(annotation for annotation in annotations
+                           if annotation.get_object().get("/Subtype") != "/Widget")
+        if kept:
+            page[NameObject("/Annots")] = kept
+        else:
+            del page["/Annots"]
+
+        if drawing:
+            # Wrap the page in q/Q so a graphics state it leaves behind cannot move the fields
+            contents = page.get("/Contents")
+            streams = []
+            if contents is not None:
+                contents = contents.get_object()
+                streams = list(contents) if isinstance(contents, ArrayObject) else [page.raw_get("/Contents")]
+            page[NameObject("/Contents")] = ArrayObject(
+                [_content_stream(writer, b"q\n")] + streams
+                + [_content_stream(writer, ("Q\n" + "\n".join(drawing) + "\n").encode("latin-1"))]
+            )
+
+    if "/AcroForm" in writer._root_object:
+        del writer._root_object["/AcroForm"]
+        _drop_unreachable(writer)
+    return writer
+
+
+def _drop_unreachable(writer: PdfWriter):
+    """
+    Remove objects nothing reachable refers to any more, such as the XFA
+    packets of the removed form. pypdf's own orphan removal keeps them, since
+    they still refer to each other.
+    """
+    reachable = set()
+    pending = [writer._root_object.indirect_reference]
+    if writer._info is not None:
+        pending.append(writer._info.indirect_reference)
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is not writer or obj.idnum in reachable:
+                continue
+            reachable.add(obj.idnum)
+            obj = obj.get_object()
+        if isinstance(obj, DictionaryObject):
+            pending.extend(obj.values())
+        elif isinstance(obj, ArrayObject):
+            pending.extend(obj)
+
+    for i in range(len(writer._objects)):
+        if i + 1 not in reachable:
+            writer._objects[i] = None
@@ -3,14 +3,13 @@ PDF Form Filler Script
 Fills PDF form fields with custom values
 """
 
-from pypdf import PdfReader, PdfWriter
+from services.form_engine import load_template
 
 def list_form_fields(pdf_path):
     """
     List all form fields in a PDF to see what fields are available
     """
-    reader = PdfReader(pdf_path)
-    fields = reader.get_fields()
+    fields = load_template(pdf_path).fields
     
     if not fields:
         print("❌ No form fields found in this PDF")
@@ -31,46 +30,22 @@ def fill_pdf_form(input_pdf, output_pdf, field_values, page_num=None):
     Fill PDF form fields with provided values
     
     Args:
-        input_pdf: Path to input PDF file
-        output_pdf: Path to output PDF file
+        input_pdf: Path to input PDF file, its bytes, or a binary stream
+        output_pdf: Path to output PDF file, a writable binary stream, or None to get the bytes back
         field_values: Dictionary mapping field names to values
         page_num: Page number to update (0-indexed), list of page numbers, or None for all pages
                  Examples: page_num=1, page_num=[1,3,5], page_num=None
-    """
-    reader = PdfReader(input_pdf)
-    writer = PdfWriter()
-    
-    # Clone reader to writer (this preserves form structure better)
-    writer.clone_reader_document_root(reader)
-    
-    # Determine which pages to update
-    if page_num is None:
-        # Update all pages
-        pages_to_update = list(range(len(writer.pages)))
-    elif isinstance(page_num, list):
-        # Update specific list of pages
-        pages_to_update = page_num
-    else:
-        # Update single page
-        pages_to_update = [page_num]
     
-    # Update form fields on specified pages
-    updated_count = 0
-    for idx in pages_to_update:
-        try:
-            writer.update_page_form_field_values(writer.pages[idx], field_values)
-            print(f"✓ Updated fields on page {idx + 1} (index {idx})")
-            updated_count += 1
-        except Exception as e:
-            print(f"⚠ Skipped page {idx + 1} (index {idx}): {e}")
-    
-    # Write to output file
-    with open(output_pdf, 'wb') as output_file:
-        writer.write(output_file)
+    Returns:
+        The filled PDF as bytes when output_pdf is None
+    """
+    # The parsed form is kept, so filling the same form again skips reading it
+    filled = load_template(input_pdf).fill(field_values, output_pdf, pages=page_num)
     
     print(f"\n✓ PDF form filled successfully!")
-    print(f"  Updated {updated_count} page(s)")
-    print(f"  Output saved to: {output_pdf}")
+    if isinstance(output_pdf, str):
+        print(f"  Output saved to: {output_pdf}")
+    return filled
 
 # Example usage
 if __name__ == "__main__":
@@ -3,9 +3,15 @@ PDF Form Filler Class
 A reusable class for filling PDF forms with custom values
 """
 
-from pypdf import PdfReader, PdfWriter
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, List, Optional, Union
+import io
 import json
+import os
+from services.form_engine import FormTemplate, load_template
+from services.form_index import get_form_metadata
+from services.pdf_flatten import FLATTEN_BY_DEFAULT
+from services.log import log
+from services.metrics import span
 
 class PDFFormFiller:
     """
@@ -23,6 +29,10 @@ class PDFFormFiller:
         
         # Generate filled PDF
         filler.fill_form(template, "output.pdf")
+        
+        # Or build the values up a few at a time
+        filler.update_draft({"Field Name": "Your Value"})
+        pdf_bytes = filler.render_draft()
     """
     
     def __init__(self, pdf_path: str):
@@ -34,16 +44,24 @@ class PDFFormFiller:
         """
         self.pdf_path = pdf_path
         self.fields = {}
+        self.draft = {}
+        self._template: Optional[FormTemplate] = None
+        self._draft_version = 0
+        self._rendered_drafts = {}
         self._load_fields()
     
     def _load_fields(self):
-        """Load all form fields from the PDF"""
+        """Load all form fields from the form index, or from the PDF when it is not indexed"""
         try:
-            reader = PdfReader(self.pdf_path)
-            fields = reader.get_fields()
+            metadata = get_form_metadata(self.pdf_path)
+            if metadata is not None:
+                # The PDF itself is only parsed when the form is first filled
+                fields = {name: {'/FT': info['type']} for name, info in metadata['fields'].items()}
+            else:
+                fields = self.template.fields
             
             if not fields:
-                print(f"Warning: No form fields found in {self.pdf_path}")
+                log("Warning: No form fields found in {path}", level="warning", path=self.pdf_path)
                 return
             
             # Store field information
@@ -53,13 +71,21 @@ class PDFFormFiller:
                     'type': field_type,
                     'value': ''
                 }
+            self.draft = self.get_form_template()
             
-            print(f"✓ Loaded {len(self.fields)} fields from PDF")
+            log("✓ Loaded {count} fields from PDF", count=len(self.fields))
             
         except Exception as e:
-            print(f"Error loading PDF: {e}")
+            log("Error loading PDF: {error}", level="error", error=e)
             raise
     
+    @property
+    def template(self) -> FormTemplate:
+        """The shared parsed form, loaded on first use."""
+        if self._template is None:
+            self._template = load_template(self.pdf_path)
+        return self._template
+    
     def get_form_template(self, include_metadata: bool = False) -> Dict[str, str]:
         """
         Get a dictionary template with all field names and empty values.
@@ -142,56 +168,99 @@ class PDFFormFiller:
         print(f"✓ Data imported from {json_path}")
         return data
     
+    def update_draft(self, patch: Dict[str, str]) -> List[str]:
+        """
+        Merge a partial set of field values into the server-side draft.
+        
+        Args:
+            patch: Dictionary mapping field names to their new values
+            
+        Returns:
+            List of field names that changed. Unknown fields are skipped.
+        """
+        updated = []
+        for field_name, value in patch.items():
+            if field_name not in self.fields:
+                log("⚠ Ignoring unknown field in patch: {field}", level="warning", field=field_name)
+                continue
+            value = '' if value is None else str(value)
+            if self.draft.get(field_name) != value:
+                self.draft[field_name] = value
+                updated.append(field_name)
+        
+        if updated:
+            self._draft_version += 1
+        return updated
+    
+    def get_draft(self) -> Dict[str, str]:
+        """
+        Get a copy of the values collected so far.
+        
+        Returns:
+            Dictionary with every field name and its current draft value
+        """
+        return self.draft.copy()
+    
+    def render_draft(self, flatten: Optional[bool] = None) -> bytes:
+        """
+        Render the current draft to PDF bytes.
+        
+        The last rendering is kept until the draft changes, so previewing
+        an unchanged draft again costs nothing. A failed rendering is not kept.
+        
+        Args:
+            flatten: Bake the values into the pages. Defaults to PDF_FLATTEN.
+        
+        Returns:
+            The filled PDF as bytes
+        
+        Raises:
+            RuntimeError: If the form could not be filled
+        """
+        flatten = FLATTEN_BY_DEFAULT if flatten is None else flatten
+        rendered = self._rendered_drafts.get(flatten)
+        if rendered and rendered[0] == self._draft_version:
+            return rendered[1]
+        
+        buffer = io.BytesIO()
+        if not self.fill_form(self.draft, buffer, flatten=flatten):
+            raise RuntimeError(f"Could not fill {os.path.basename(self.pdf_path)}")
+        self._rendered_drafts[flatten] = (self._draft_version, buffer.getvalue())
+        return self._rendered_drafts[flatten][1]
+    
     def fill_form(self, 
                   form_data: Dict[str, str], 
-                  output_pdf: str, 
-                  page_num: Optional[int] = None) -> bool:
+                  output_pdf: Union[str, BinaryIO], 
+                  page_num: Optional[int] = None,
+                  optimize: Optional[bool] = None,
+                  flatten: Optional[bool] = None) -> bool:
         """
         Fill the PDF form with provided data and save to a new file.
         
         Args:
             form_data: Dictionary mapping field names to values
-            output_pdf: Path where to save the filled PDF
+            output_pdf: Path where to save the filled PDF, or a writable binary stream
             page_num: Specific page number (0-indexed), list of pages, or None for all pages
+            optimize: Compress and deduplicate the output. Defaults to PDF_OPTIMIZE.
+            flatten: Draw the values into the pages and drop the interactive form,
+                for a print-ready PDF. Defaults to PDF_FLATTEN.
             
         Returns:
             True if successful, False otherwise
         """
+        with span("fill_form", form=os.path.basename(self.pdf_path)):
+            return self._fill_form(form_data, output_pdf, page_num, optimize, flatten)
+
+    def _fill_form(self, form_data, output_pdf, page_num, optimize, flatten) -> bool:
         try:
-            reader = PdfReader(self.pdf_path)
-            writer = PdfWriter()
-            
-            # Clone reader to writer
-            writer.clone_reader_document_root(reader)
-            
-            # Determine which pages to update
-            if page_num is None:
-                pages_to_update = list(range(len(writer.pages)))
-            elif isinstance(page_num, list):
-                pages_to_update = page_num
-            else:
-                pages_to_update = [page_num]
-            
-            # Update form fields on specified pages
-            updated_count = 0
-            for idx in pages_to_update:
-                try:
-                    writer.update_page_form_field_values(writer.pages[idx], form_data)
-                    updated_count += 1
-                except Exception as e:
-                    print(f"⚠ Could not update page {idx + 1}: {e}")
-            
-            # Write to output file
-            with open(output_pdf, 'wb') as output_file:
-                writer.write(output_file)
-            
-            print(f"✓ PDF filled successfully!")
-            print(f"  Updated {updated_count} page(s)")
-            print(f"  Output saved to: {output_pdf}")
+            self.template.fill(form_data, output_pdf, pages=page_num, optimize=optimize, flatten=flatten)
+            log("✓ PDF filled successfully")
+            if isinstance(output_pdf, str):
+                log("  Output saved to: {path}", path=output_pdf)
             return True
             
         except Exception as e:
-            print(f"❌ Error filling form: {e}")
+            log("❌ Error filling form: {error}", level="error", error=e)
             import traceback
             traceback.print_exc()
             return False
@@ -0,0 +1,54 @@
+"""
+PDF Optimizer
+Shrinks generated PDFs before they are sent back: compresses uncompressed
+content streams and merges identical objects (fonts, images, duplicate pages).
+
+Set PDF_OPTIMIZE=0 to write PDFs as they are.
+"""
+
+import os
+
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, StreamObject
+
+OPTIMIZE_BY_DEFAULT = os.getenv("PDF_OPTIMIZE", "1") == "1"
+COMPRESSION_LEVEL = int(os.getenv("PDF_COMPRESSION_LEVEL", "6"))
+
+
+def _has_uncompressed_content(page) -> bool:
+    contents = page.get("/Contents")
+    if contents is None:
+        return False
+    contents = contents.get_object()
+    streams = contents if isinstance(contents, ArrayObject) else [contents]
+    for stream in streams:
+        stream = stream.get_object()
+        if isinstance(stream, StreamObject) and "/Filter" not in stream:
+            return True
+    return False
+
+
+def optimize_writer(writer: PdfWriter, level: int = COMPRESSION_LEVEL) -> PdfWriter:
+    """
+    Optimize a pypdf writer in place, just before it is written.
+
+    Args:
+        writer: The writer holding the finished document
+        level: zlib level for content streams that are not compressed yet
+
+    Returns:
+        The same writer
+    """
+    for page in writer.pages:
+        # Re-encoding streams that are already compressed costs time for nothing
+        if _has_uncompressed_content(page):
+            page.compress_content_streams(level)
+
+    # pypdf needs an info dictionary to dedupe against and cloned forms have none.
+    # An empty one would itself be merged away as a duplicate, so give it a producer.
+    if writer.metadata is None:
+        writer.add_metadata({"/Producer": "pypdf"})
+
+    # Fonts repeated on title pages, the same image uploaded twice, etc.
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    return writer
@@ -0,0 +1,178 @@
+"""
+Prompts
+The prompts built from user data, compiled once at import. Rendering one
+estimates its size in tokens offline, cuts segments that are over their
+budget, and logs the size of every prompt so cost and latency can be traced
+to what went into it.
+
+Token counts are an approximation of Gemini's tokenizer (about one token per
+word or punctuation mark, and one per four characters of longer words), good
+enough for budgets and trends. The usage metadata of each response has the
+exact count (see services/metrics.py).
+
+Configure budgets with environment variables:
+    PROMPT_REPORT_TOKENS=8000     report text in form selection and the form chat
+    PROMPT_SNIPPET_TOKENS=1500    exhibit excerpts added to a chat message
+"""
+
+import os
+import re
+import string
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from services.log import log
+from services.metrics import Counter, Histogram, register
+
+REPORT_TOKENS = int(os.getenv("PROMPT_REPORT_TOKENS", "8000"))
+SNIPPET_TOKENS = int(os.getenv("PROMPT_SNIPPET_TOKENS", "1500"))
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+PROMPT_TOKENS = register(Histogram(
+    "prompt_tokens_estimated",
+    "Estimated tokens per rendered prompt",
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536),
+))
+TRUNCATIONS = register(Counter(
+    "prompt_segments_truncated_total",
+    "Prompt segments cut to fit their token budget",
+))
+
+
+def _piece_tokens(piece: str) -> int:
+    return 1 if len(piece) <= 4 else (len(piece) + 3) // 4
+
+
+@lru_cache(maxsize=256)
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count of a text. Cached, since the same large segments
+    (the avenue matrix, form templates) go into many prompts.
+    """
+    return sum(_piece_tokens(piece) for piece in _TOKEN_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """
+    Cut a text to about `budget` tokens, keeping its start and its end, where
+    reports usually put who is involved and what they want.
+
+    Returns:
+        The text, with a marker where the middle was left out
+    """
+    pieces = list(_TOKEN_PATTERN.finditer(text))
+    costs = [_piece_tokens(piece.group()) for piece in pieces]
+    total = sum(costs)
+    if total <= budget:
+        return text
+
+    head_budget = budget * 2 // 3
+    tail_budget = budget - head_budget
+
+    used, head = 0, 0
+    while head < len(pieces) and used + costs[head] <= head_budget:
+        used += costs[head]
+        head += 1
+    tail = len(pieces)
+    while tail > head and used + costs[tail - 1] <= head_budget + tail_budget:
+        tail -= 1
+        used += costs[tail]
+
+    head_end = pieces[head].start() if head < len(pieces) else len(text)
+    tail_start = pieces[tail].start() if tail < len(pieces) else len(text)
+    return (f"{text[:head_end].rstrip()}\n\n[... about {total - used} tokens left out ...]\n\n"
+            f"{text[tail_start:].lstrip()}")
+
+
+class RenderedPrompt:
+    """A prompt ready to send, with its estimated size."""
+
+    def __init__(self, name: str, text: str, tokens: int, segments: Dict[str, int], truncated: List[str]):
+        self.name = name
+        self.text = text
+        self.tokens = tokens
+        self.segments = segments
+        self.truncated = truncated
+
+    def __str__(self):
+        return self.text
+
+
+class PromptTemplate:
+    """
+    A str.format style template, parsed once.
+
+    Args:
+        name: Name for logs and metrics
+        text: Template text with {segment} placeholders. Literal braces are doubled.
+        budgets: Token budget per segment. Segments without one are only counted.
+    """
+
+    def __init__(self, name: str, text: str, budgets: Optional[Dict[str, int]] = None):
+        self.name = name
+        self.budgets = budgets or {}
+        self._parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+        self.segments = [field for _, field in self._parts if field]
+        self.fixed_tokens = sum(estimate_tokens(literal) for literal, _ in self._parts)
+
+    def render(self, **values) -> RenderedPrompt:
+        """
+        Fill in the segments, cutting any that are over budget, and log the prompt size.
+
+        Args:
+            **values: One value per segment. Non-string values are str()-ed.
+        """
+        texts, segment_tokens, truncated = {}, {}, []
+        for segment in self.segments:
+            text = str(values[segment])
+            budget = self.budgets.get(segment)
+            if budget is not None and estimate_tokens(text) > budget:
+                text = truncate_to_tokens(text, budget)
+                truncated.append(segment)
+                TRUNCATIONS.inc(prompt=self.name, segment=segment)
+            texts[segment] = text
+            segment_tokens[segment] = estimate_tokens(text)
+
+        prompt = RenderedPrompt(
+            self.name,
+            "".join(literal + (texts[field] if field else "") for literal, field in self._parts),
+            self.fixed_tokens + sum(segment_tokens.values()),
+            segment_tokens,
+            truncated,
+        )
+        PROMPT_TOKENS.observe(prompt.tokens, prompt=self.name)
+        log("🧮 Prompt {prompt}: ~{tokens} tokens", prompt=self.name, tokens=prompt.tokens,
+            fixed=self.fixed_tokens, segments=segment_tokens, truncated=truncated)
+        if truncated:
+            log("⚠ Cut {segments} to fit the {prompt} prompt budget", level="warning",
+                segments=", ".join(truncated), prompt=self.name)
+        return prompt
+
+
+FORM_SELECTION = PromptTemplate(
+    "form_selection",
+    "{forms_context}Here is the report of my situation: {report}\n\n"
+    "Based on this report, which one of these forms that i am giving you now make the most sense to fill out? Is it the {forms}? You have to choose from one of these. Only choose one. Tell me the name of the form from the ones i just specified, what the form is about, how it relates to my problem, and ask me if I would like it get filled out by you. Don't ask me if you need additional information for now, I will provide that later. If i say something like yes or continue or anything like that, then ",
+    budgets={"report": REPORT_TOKENS},
+)
+
+FORM_CHAT_REPORT = PromptTemplate(
+    "form_chat_report",
+    "Take this person's legal report. Understand it. I will ask you to do something with it: {report}",
+    budgets={"report": REPORT_TOKENS},
+)
+
+# Every field key has to reach the model, so the template is counted but never cut
+FORM_CHAT_TEMPLATE = PromptTemplate(
+    "form_chat_template",
+    "This is the template for the form that I am going to fill out. Go through it. If there are any keys that need more information from me in order to fill them, ask me them one by one. Every time you reply, first fill in whatever you can from the report and from my answers so far, then ask the next question. Put the values you just filled in at the end of your reply as a small json object of only the keys that changed, between the markers START_PATCH and END_PATCH, for example START_PATCH {{\"key\": \"value\"}} END_PATCH. Only use keys from the template, and never send the whole template. For any booleans that is yes, insert it as /Yes and for no, insert it as /Off. Once you have no more questions, reply with FORM_COMPLETE followed by the last patch, if any. Here is the template: {template}",
+)
+
+EXHIBIT_SNIPPETS = PromptTemplate(
+    "exhibit_snippets",
+    "Relevant excerpts from the evidence I uploaded, use them instead of asking me for details they already answer:\n\n"
+    "{snippets}\n\n"
+    "My message: {message}",
+    budgets={"snippets": SNIPPET_TOKENS},
+)
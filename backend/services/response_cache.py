@@ -0,0 +1,141 @@
+"""
+Response Cache
+In-memory caches for model calls that are pure functions of their inputs:
+response_cache for generations such as form selection for a given report,
+and embedding_cache for embeddings of a given text. They are separate so a
+burst of embeddings cannot push out the far more expensive generations.
+
+Configure with environment variables (a size of 0 turns that cache off):
+    RESPONSE_CACHE_SIZE=256     generations kept
+    EMBEDDING_CACHE_SIZE=256    embeddings kept
+    RESPONSE_CACHE_TTL=3600     seconds an entry of either is kept
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from services.llm_provider import _to_jsonable, content_hash
+from services.metrics import register_collector, sample
+
+# Uploaded file URI -> sha256 of the file's content
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def register_file(uri: str, path: str):
+    """Key file parts with this URI by the content of the file at path, so re-uploads hit the cache."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    with _file_hashes_lock:
+        _file_hashes[uri] = hasher.hexdigest()
+
+
+def _by_content(value):
+    if isinstance(value, dict):
+        uri = value.get("file_uri")
+        if uri is not None and uri in _file_hashes:
+            value = {**value, "file_uri": None, "file_sha256": _file_hashes[uri]}
+        return {key: _by_content(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_by_content(item) for item in value]
+    return value
+
+
+def make_cache_key(model: str, contents, config=None) -> str:
+    """
+    Canonical hash of a model call.
+
+    Args:
+        model: Model name
+        contents: Prompt text or parts. File parts uploaded through
+                  register_file() are keyed by the file's content, others by
+                  their URI.
+        config: Generation config, if any
+
+    Returns:
+        Hex digest identifying the call
+    """
+    return content_hash(_by_content(_to_jsonable([model, contents, config])))
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache with a time-to-live on each entry.
+
+    Usage:
+        cache = ResponseCache(max_entries=256, ttl=3600)
+        value = cache.get_or_compute(key, lambda: expensive_call())
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """
+        Look up a key.
+
+        Returns:
+            The cached value, or None if it is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Return the cached value for key, calling compute() and storing its result on a miss.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+embedding_cache = ResponseCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+
+register_collector(lambda: [
+    *sample("response_cache_hits_total", response_cache.hits, "Generations answered from the cache", "counter"),
+    *sample("response_cache_misses_total", response_cache.misses, "Generations that went to the provider", "counter"),
+    *sample("response_cache_entries", len(response_cache), "Generations currently cached"),
+    *sample("embedding_cache_hits_total", embedding_cache.hits, "Embeddings answered from the cache", "counter"),
+    *sample("embedding_cache_misses_total", embedding_cache.misses, "Embeddings that went to the provider", "counter"),
+    *sample("embedding_cache_entries", len(embedding_cache), "Embeddings currently cached"),
+])
@@ -0,0 +1,276 @@
+"""
+Session Store
+Durable key-value storage for interview sessions, so any worker can pick up
+any session and a restart loses nothing. Session state is stored as JSON and
+generated PDFs as separate blobs.
+
+Sessions carry a "version" that put_if_version() checks and writes in one
+step, so when two workers save the same session only the first one wins.
+
+Pick the backend with SESSION_STORE:
+    SESSION_STORE=sqlite    (default) local file at SESSION_DB_PATH, default sessions.db
+    SESSION_STORE=redis     Redis or any Redis-compatible server at SESSION_REDIS_URL
+    SESSION_STORE=memory    in-process fake, for tests and benchmarks
+SESSION_TTL (seconds, default 7 days) expires idle sessions, with their blobs,
+where the backend supports it. SQLite deletes expired rows at most once per
+PURGE_INTERVAL on write; Redis expires keys itself.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Seconds between sweeps of expired rows in SQLiteSessionStore
+PURGE_INTERVAL = 3600
+
+
+class SessionStore:
+    """Interface every store implements."""
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, data: Dict):
+        raise NotImplementedError
+
+    def put_if_version(self, session_id: str, data: Dict, version: int) -> bool:
+        """
+        Store data, which carries its new "version", only if the stored
+        version is still `version` (0 for a session that is not stored).
+
+        Returns:
+            False if someone else saved the session first
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def get_blob(self, session_id: str, name: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def put_blob(self, session_id: str, name: str, data: bytes):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process fake. Sessions are kept as JSON text like the real stores, so
+    anything that does not survive serialisation fails here too.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            text = self._sessions.get(session_id)
+        return json.loads(text) if text is not None else None
+
+    def put(self, session_id: str, data: Dict):
+        text = json.dumps(data)
+        with self._lock:
+            self._sessions[session_id] = text
+
+    def put_if_version(self, session_id: str, data: Dict, version: int) -> bool:
+        text = json.dumps(data)
+        with self._lock:
+            stored = self._sessions.get(session_id)
+            if (json.loads(stored).get("version", 0) if stored is not None else 0) != version:
+                return False
+            self._sessions[session_id] = text
+            return True
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            for key in [key for key in self._blobs if key[0] == session_id]:
+                del self._blobs[key]
+
+    def get_blob(self, session_id: str, name: str) -> Optional[bytes]:
+        with self._lock:
+            return self._blobs.get((session_id, name))
+
+    def put_blob(self, session_id: str, name: str, data: bytes):
+        with self._lock:
+            self._blobs[(session_id, name)] = bytes(data)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Single-file store for local development and single-host deployments."""
+
+    def __init__(self, path: str = "sessions.db", ttl: Optional[float] = None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets several worker processes on the host read while one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(sessions)")]
+        if "version" not in columns:
+            # Databases from before versioned saves keep the version inside the JSON
+            self._db.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("UPDATE sessions SET version = COALESCE(json_extract(data, '$.version'), 0)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (session_id TEXT, name TEXT, data BLOB NOT NULL, "
+            "updated REAL NOT NULL DEFAULT 0, PRIMARY KEY (session_id, name))"
+        )
+        if "updated" not in [row[1] for row in self._db.execute("PRAGMA table_info(blobs)")]:
+            self._db.execute("ALTER TABLE blobs ADD COLUMN updated REAL NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        self._last_purge = 0.0
+        self._db.commit()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT data, updated FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return json.loads(row[0])
+
+    def purge_expired(self):
+        """
+        Delete sessions (and job records) idle for longer than the TTL, their
+        blobs, and blobs of sessions that no longer exist. Call it holding _lock.
+        """
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        self._db.execute("DELETE FROM blobs WHERE session_id IN (SELECT id FROM sessions WHERE updated < ?)", (cutoff,))
+        self._db.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,))
+        # A new session's blobs can be written before its first save, so only old ones count as orphans
+        self._db.execute(
+            "DELETE FROM blobs WHERE updated < ? AND session_id NOT IN (SELECT id FROM sessions)", (cutoff,)
+        )
+        self._last_purge = time.time()
+
+    def _purge_if_due(self):
+        if self.ttl and time.time() - self._last_purge > PURGE_INTERVAL:
+            self.purge_expired()
+
+    def put(self, session_id: str, data: Dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated, version) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(data), time.time(), data.get("version", 0)),
+            )
+            self._purge_if_due()
+            self._db.commit()
+
+    def put_if_version(self, session_id: str, data: Dict, version: int) -> bool:
+        now = time.time()
+        # An expired row reads as no session, so it can be replaced from version 0
+        expired_before = now - self.ttl if self.ttl and version == 0 else -1
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE sessions SET data = ?, updated = ?, version = ? "
+                "WHERE id = ? AND (version = ? OR updated < ?)",
+                (json.dumps(data), now, data["version"], session_id, version, expired_before),
+            )
+            if cursor.rowcount == 0 and version == 0:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO sessions (id, data, updated, version) VALUES (?, ?, ?, ?)",
+                    (session_id, json.dumps(data), now, data["version"]),
+                )
+            saved = cursor.rowcount == 1
+            self._purge_if_due()
+            self._db.commit()
+            return saved
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.execute("DELETE FROM blobs WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+    def get_blob(self, session_id: str, name: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM blobs WHERE session_id = ? AND name = ?", (session_id, name)
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def put_blob(self, session_id: str, name: str, data: bytes):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (session_id, name, data, updated) VALUES (?, ?, ?, ?)",
+                (session_id, name, sqlite3.Binary(data), time.time()),
+            )
+            self._db.commit()
+
+
+class RedisSessionStore(SessionStore):
+    """Shared store for running workers on several hosts. Needs the redis package."""
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl: Optional[float] = None):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("SESSION_STORE=redis needs the redis package: pip install redis") from e
+
+        self.ttl = int(ttl) if ttl else None
+        self._redis = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def _key(self, session_id: str, name: Optional[str] = None) -> str:
+        return f"session:{session_id}" if name is None else f"session:{session_id}:blob:{name}"
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        text = self._redis.get(self._key(session_id))
+        return json.loads(text) if text is not None else None
+
+    def put(self, session_id: str, data: Dict):
+        self._redis.set(self._key(session_id), json.dumps(data), ex=self.ttl)
+
+    def put_if_version(self, session_id: str, data: Dict, version: int) -> bool:
+        key = self._key(session_id)
+        with self._redis.pipeline() as pipe:
+            try:
+                # The transaction fails if the key changes between the read and the write
+                pipe.watch(key)
+                text = pipe.get(key)
+                if (json.loads(text).get("version", 0) if text is not None else 0) != version:
+                    return False
+                pipe.multi()
+                pipe.set(key, json.dumps(data), ex=self.ttl)
+                pipe.execute()
+                return True
+            except self._watch_error:
+                return False
+
+    def delete(self, session_id: str):
+        keys = [self._key(session_id), *self._redis.scan_iter(self._key(session_id, "*"))]
+        self._redis.delete(*keys)
+
+    def get_blob(self, session_id: str, name: str) -> Optional[bytes]:
+        return self._redis.get(self._key(session_id, name))
+
+    def put_blob(self, session_id: str, name: str, data: bytes):
+        self._redis.set(self._key(session_id, name), data, ex=self.ttl)
+
+
+def create_session_store() -> SessionStore:
+    """
+    Build the store selected by the SESSION_* environment variables.
+
+    Returns:
+        A SessionStore
+    """
+    name = os.getenv("SESSION_STORE", "sqlite").lower()
+    ttl = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600))) or None
+    if name == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.db"), ttl=ttl)
+    if name == "redis":
+        return RedisSessionStore(os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0"), ttl=ttl)
+    if name == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_STORE: {name}")
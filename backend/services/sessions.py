@@ -0,0 +1,314 @@
+"""
+Sessions
+Per-user interview state: the intake and form chats, the chosen form and its
+draft, uploaded exhibits and generated PDFs. State is saved to the session
+store after every request and rebuilt on whichever worker serves the next one.
+
+Chats are stored as compact [role, text] turn lists and only turned back into
+model chats when the session next sends a message. A worker keeps the live
+objects of recent sessions, and drops them as soon as another worker has
+saved a newer version. A save fails with SessionConflictError if another
+worker saved the session since it was loaded.
+
+Usage:
+    with sessions.open(session_id) as session:
+        reply = session.send_intake(message)
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from services.session_store import SessionStore, create_session_store
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+DEFAULT_SESSION = "default"
+
+
+class SessionConflictError(Exception):
+    """Another worker saved the session after this request loaded it."""
+
+
+class Session:
+    """One user's interview. Serialisable state plus lazily rebuilt live objects."""
+
+    def __init__(self, session_id: str, store: SessionStore, data: Optional[Dict] = None):
+        data = data or {}
+        self.id = session_id
+        self.version = data.get("version", 0)
+        self.chat_with_file = data.get("chat_with_file", False)
+        self.intake_turns: List[List[str]] = data.get("intake_turns", [])
+        self.form_turns: List[List[str]] = data.get("form_turns", [])
+        self.report: Optional[str] = data.get("report")
+        self.form_name: Optional[str] = data.get("form_name")
+        self.form_draft: Dict[str, str] = data.get("form_draft", {})
+        self.uploaded_files: List[str] = data.get("uploaded_files", [])
+        self.artifact_names: List[str] = data.get("artifact_names", [])
+        self.artifact_ids: Dict[str, str] = data.get("artifact_ids", {})
+
+        self._store = store
+        self._chat = None
+        self._form_chat = None
+        self._filler = None
+        self._retrieval = None
+        self._exhibit_index = None
+
+    def to_dict(self) -> Dict:
+        if self._filler is not None:
+            self.form_draft = self._filler.get_draft()
+        return {
+            "version": self.version,
+            "chat_with_file": self.chat_with_file,
+            "intake_turns": self.intake_turns,
+            "form_turns": self.form_turns,
+            "report": self.report,
+            "form_name": self.form_name,
+            "form_draft": self.form_draft,
+            "uploaded_files": self.uploaded_files,
+            "artifact_names": self.artifact_names,
+            "artifact_ids": self.artifact_ids,
+        }
+
+    # --------- CHATS ---------
+
+    def _send(self, chat, turns: List[List[str]], message: str, prompt: Optional[str]):
+        response = chat.send_message(prompt or message)
+        turns.append(["user", message])
+        turns.append(["model", response.text or ""])
+        return response
+
+    def send_intake(self, message: str, prompt: Optional[str] = None):
+        """
+        Send a message on the intake chat, resuming it from the stored turns if needed.
+
+        Args:
+            message: The user's message, which is what the history keeps
+            prompt: Text to send for this turn only instead of the message,
+                such as the message with exhibit snippets in front of it
+        """
+        if self._chat is None:
+            from services.gemini_client import create_intake_chat
+            self._chat = create_intake_chat(self.intake_turns)
+        response = self._send(self._chat, self.intake_turns, message, prompt)
+        if prompt is not None:
+            # The live chat has the prompt in its history, so rebuild it from the turns
+            self._chat = None
+        return response
+
+    def send_form(self, message: str, prompt: Optional[str] = None):
+        """Send a message on the form filling chat, like send_intake()."""
+        if self._form_chat is None:
+            from services.gemini_client import create_form_chat_client
+            self._form_chat = create_form_chat_client(self.report, self.filler.get_form_template(), self.form_turns)
+        response = self._send(self._form_chat, self.form_turns, message, prompt)
+        if prompt is not None:
+            self._form_chat = None
+        return response
+
+    def start_form(self, report: str, form_name: str):
+        """Choose the form for this session and open a fresh form chat for it."""
+        from services.gemini_client import create_form_chat_client
+        from services.pdf_form_handler_class import PDFFormFiller
+
+        self.report = report
+        self.form_name = form_name
+        self.form_turns = []
+        self._filler = PDFFormFiller(f"{form_name}.pdf")
+        self.form_draft = self._filler.get_draft()
+        self._form_chat = create_form_chat_client(report, self._filler.get_form_template())
+
+    # --------- FORM ---------
+
+    @property
+    def filler(self):
+        """The form filler for the chosen form, with the saved draft restored, or None."""
+        if self._filler is None and self.form_name:
+            from services.pdf_form_handler_class import PDFFormFiller
+
+            self._filler = PDFFormFiller(f"{self.form_name}.pdf")
+            self._filler.update_draft(self.form_draft)
+        return self._filler
+
+    @property
+    def retrieval(self):
+        """This session's retrieval cache. Kept with the live session, never persisted."""
+        if self._retrieval is None:
+            from services.supabase_client import RetrievalCache
+            self._retrieval = RetrievalCache()
+        return self._retrieval
+
+    @property
+    def exhibit_index(self):
+        """Indexed text of this session's uploads, loaded from the store on first use."""
+        if self._exhibit_index is None:
+            from services.exhibit_index import ExhibitIndex
+
+            data = self._store.get_blob(self.id, "exhibit_index")
+            self._exhibit_index = ExhibitIndex.from_bytes(data) if data else ExhibitIndex()
+        return self._exhibit_index
+
+    def add_exhibit_chunks(self, chunks):
+        """Add chunks from exhibit_index.index_file() and persist the index."""
+        self.exhibit_index.add(chunks)
+        self._store.put_blob(self.id, "exhibit_index", self._exhibit_index.to_bytes())
+
+    # --------- ARTIFACTS ---------
+
+    def put_artifact(self, name: str, data: bytes):
+        """Keep a generated PDF in the store and on disk for downloads. Only its id stays in memory."""
+        from services import artifacts
+
+        self._store.put_blob(self.id, name, data)
+        if name not in self.artifact_names:
+            self.artifact_names.append(name)
+
+        new_id = artifacts.artifact_id(data)
+        old_id = self.artifact_ids.get(name)
+        artifacts.write_artifact(self.id, name, data)
+        self.artifact_ids[name] = new_id
+        if old_id and old_id != new_id and old_id not in self.artifact_ids.values():
+            artifacts.remove_artifact(self.id, old_id)
+
+    def get_artifact(self, name: str) -> Optional[bytes]:
+        """An artifact's bytes, from its file on this host or else from the store."""
+        if name not in self.artifact_names:
+            return None
+        artifact = self.artifact_file(name)
+        if artifact is None:
+            return None
+        with open(artifact["path"], "rb") as f:
+            return f.read()
+
+    def artifact_file(self, name: str) -> Optional[Dict]:
+        """
+        An artifact as a file on this host, written from the store if this
+        worker has not seen it yet.
+
+        Returns:
+            Dict with "filename", "artifact_id", "path" and "size", or None
+        """
+        from services import artifacts
+
+        if name not in self.artifact_names:
+            return None
+        path = None
+        if name in self.artifact_ids:
+            path = artifacts.find_artifact(self.id, self.artifact_ids[name])
+        if path is None:
+            data = self._store.get_blob(self.id, name)
+            if data is None:
+                return None
+            path = artifacts.write_artifact(self.id, name, data)
+            self.artifact_ids[name] = artifacts.artifact_id(data)
+        return {
+            "filename": name,
+            "artifact_id": self.artifact_ids[name],
+            "path": path,
+            "size": os.path.getsize(path),
+        }
+
+
+class SessionManager:
+    """
+    Loads and saves sessions, keeping recently used ones live in this worker.
+
+    Args:
+        store: Where sessions are persisted
+        cache_size: Live sessions kept in this process
+    """
+
+    def __init__(self, store: Optional[SessionStore] = None, cache_size: int = 256):
+        self._store = store
+        self._cache_size = cache_size
+        self._live = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> SessionStore:
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = create_session_store()
+        return self._store
+
+    def load(self, session_id: str) -> Session:
+        data = self.store.get(session_id)
+        with self._lock:
+            live = self._live.get(session_id)
+            # Another worker saved a newer version, so our chat objects are stale
+            if live is not None and data is not None and live.version == data.get("version", 0):
+                self._live.move_to_end(session_id)
+                return live
+        return Session(session_id, self.store, data)
+
+    def save(self, session: Session):
+        """
+        Raises:
+            SessionConflictError: If another worker saved the session first
+        """
+        data = session.to_dict()
+        data["version"] = session.version + 1
+        if not self.store.put_if_version(session.id, data, session.version):
+            with self._lock:
+                self._live.pop(session.id, None)
+            raise SessionConflictError(f"Session {session.id} was saved by another request")
+        session.version += 1
+        with self._lock:
+            self._live[session.id] = session
+            self._live.move_to_end(session.id)
+            while len(self._live) > self._cache_size:
+                self._live.popitem(last=False)
+
+    @contextmanager
+    def open(self, session_id: str, save: bool = True):
+        """
+        Load a session for one request and save it afterwards. Requests for the
+        same session are served one at a time within this worker.
+        """
+        # [lock, requests using it], dropped once no request is using it
+        with self._lock:
+            entry = self._locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                session = self.load(session_id)
+                yield session
+                if save:
+                    self.save(session)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    def update(self, session_id: str, change: Callable[[Session], None], attempts: int = 3):
+        """
+        Apply a change to a session and save it, loading the session again and
+        re-applying the change if another worker saved it in between. The
+        change has to be safe to apply more than once.
+        """
+        for attempt in range(attempts):
+            try:
+                with self.open(session_id) as session:
+                    change(session)
+                return
+            except SessionConflictError:
+                if attempt == attempts - 1:
+                    raise
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._live.pop(session_id, None)
+        self.store.delete(session_id)
+
+
+def valid_session_id(session_id: str) -> bool:
+    return bool(SESSION_ID_PATTERN.match(session_id or ""))
+
+
+sessions = SessionManager()
@@ -1,32 +1,142 @@
-from supabase import create_client
+import hashlib
 import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
 from dotenv import load_dotenv
 from services.gemini_client import get_embedding
-from google.genai import types
-import numpy as np
+from services.corpus_snapshot import load_snapshot
+from services.metrics import Counter, register, span
 
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Queries at least this similar to the previous one reuse its results
+REUSE_THRESHOLD = float(os.getenv("RETRIEVAL_REUSE_THRESHOLD", "0.98"))
+
+RETRIEVAL_LOOKUPS = register(Counter("retrieval_lookups_total", "search_similar calls by how they were answered"))
+
+# Created on first use so the app can start without credentials
+supabase = None
+_init_lock = threading.Lock()
+
+def get_supabase():
+    """Return the shared Supabase client, creating it on first use."""
+    global supabase
+    if supabase is None:
+        with _init_lock:
+            if supabase is None:
+                from supabase import create_client, ClientOptions
+                from services.http_pool import get_http_client
+
+                # Share keep-alive connections with the Gemini client
+                options = ClientOptions(httpx_client=get_http_client())
+                supabase = create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
+    return supabase
 
 
 # def get_users():
 #     response = supabase.table("users").select("*").execute()
 #     return response.data
 
-def search_similar(user_response: str):
+class RetrievalCache:
+    """
+    One session's recent retrieval queries: their embeddings and top-k results,
+    keyed by a hash of the query text.
+
+    Args:
+        max_entries: Queries remembered, oldest dropped first
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._last = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def text_hash(text: str, match_count: int) -> str:
+        return hashlib.sha256(f"{match_count}:{text.strip()}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def last(self):
+        """The (embedding, results, match_count) of the previous query, or None."""
+        return self._last
+
+    def set(self, key: str, embedding: List[float], results: list, match_count: int):
+        with self._lock:
+            self._entries[key] = (embedding, results, match_count)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._last = (embedding, results, match_count)
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    import numpy as np
+
+    a, b = np.asarray(a), np.asarray(b)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def search_similar(user_response: str, cache: Optional[RetrievalCache] = None, match_count: int = 5):
+    """
+    Find the law chunks closest to a text.
+
+    Args:
+        user_response: Text to search with, usually the report
+        cache: The session's RetrievalCache. Repeating a query answers from it, and a
+               query nearly identical to the previous one (cosine similarity of at
+               least RETRIEVAL_REUSE_THRESHOLD) reuses its results without an RPC.
+        match_count: Number of chunks to return
+
+    Returns:
+        List of matching rows
+    """
+    key = None
+    if cache is not None:
+        key = RetrievalCache.text_hash(user_response, match_count)
+        entry = cache.get(key)
+        if entry is not None:
+            RETRIEVAL_LOOKUPS.inc(result="hit")
+            return entry[1]
+
     query_embedding = get_embedding(user_response)
 
-    embedding_str = str(query_embedding)
+    if cache is not None:
+        previous = cache.last()
+        if previous is not None and previous[2] == match_count \
+                and _cosine(query_embedding, previous[0]) >= REUSE_THRESHOLD:
+            RETRIEVAL_LOOKUPS.inc(result="near_duplicate")
+            cache.set(key, query_embedding, previous[1], match_count)
+            return previous[1]
+
+    snapshot = load_snapshot()
+    if snapshot is not None:
+        # RETRIEVAL_SNAPSHOT is set: search the local copy, no network at all
+        with span("snapshot.search"):
+            results = snapshot.search(query_embedding, match_count)
+    else:
+        embedding_str = str(query_embedding)
 
-    response = supabase.rpc(
-        "match_documents",
-        {"query_embedding": embedding_str, "match_count": 5}
-    ).execute()
-    # print(response)
+        with span("supabase.match_documents"):
+            response = get_supabase().rpc(
+                "match_documents",
+                {"query_embedding": embedding_str, "match_count": match_count}
+            ).execute()
+        # print(response)
+        results = response.data
 
-    return response.data
\ No newline at end of file
+    RETRIEVAL_LOOKUPS.inc(result="miss")
+    if cache is not None:
+        cache.set(key, query_embedding, results, match_count)
+    return results
\ No newline at end of file
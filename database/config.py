@@ -1,8 +1,13 @@
 import os
-from supabase import create_client
-from google import genai
+import sys
+from supabase import create_client, ClientOptions
 from dotenv import load_dotenv
 
+# Share the backend's model providers and HTTP pool, so ingestion can also run against a replay
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from services.llm_provider import create_provider
+from services.http_pool import get_http_client
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -11,8 +16,8 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Configure clients
-client = genai.Client()
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Configure clients (LLM_PROVIDER=replay for offline runs)
+provider = create_provider()
+supabase = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=get_http_client()))
 
 
@@ -1,6 +1,22 @@
+"""
+Embed the statute PDFs in pdfs/ into the bc_laws table.
+
+Usage (from database/):
+    python ingest.py                 # embed new and changed chunks, delete stale rows
+    python ingest.py --dry-run       # only print what would change
+    python ingest.py --prune         # also delete the rows of PDFs that were removed
+
+What is in the table is kept in ingest_manifest.json (see manifest.py), so
+unchanged PDFs are skipped by hash, and a changed one only has its new
+chunks embedded. A PDF missing from the manifest is matched against the
+rows the table already has for it.
+"""
+
+import argparse
 import os
 from PyPDF2 import PdfReader
-from config import supabase, client
+from config import supabase, provider
+from manifest import DEFAULT_MANIFEST, IngestManifest, chunk_hash, file_hash
 import numpy as np
 from google.genai import types
 import numpy as np
@@ -9,8 +25,11 @@ import time
 
 # --------- SETTINGS ---------
 PDF_DIR = "pdfs"
+TABLE = "bc_laws"
 CHUNK_SIZE = 1000
+EMBED_MODEL = "gemini-embedding-001"
 EMBED_DIM = 1536    # embedding dimension
+EMBEDS_PER_MINUTE = 90
 
 # --------- HELPERS ---------
 def extract_text_from_pdf(file_path):
@@ -56,42 +75,164 @@ def safe_get_embedding(chunk, retries=3):
 
 def get_embedding(text):
     # Use the updated Gemini embedding model
-    result = client.models.embed_content(
-        model="gemini-embedding-001",
-        contents=text,
-        config=types.EmbedContentConfig(output_dimensionality=EMBED_DIM)
-    )
-    embedding_values = result.embeddings[0].values
+    embedding_values = provider.embed(text, EMBED_MODEL, EMBED_DIM)
     # Normalize embedding for semantic similarity tasks
     embedding_np = np.array(embedding_values)
     normed_embedding = (embedding_np / np.linalg.norm(embedding_np)).tolist()
     return normed_embedding
 
 def insert_into_supabase(content, embedding, title):
-    supabase.table("bc_laws").insert({
+    supabase.table(TABLE).insert({
         "title": title,
         "content": content,
         "embedding": embedding
     }).execute()
 
+def insert_batch(rows):
+    """Insert rows in one request and return their ids, in the same order."""
+    inserted = supabase.table(TABLE).insert(rows).execute().data
+    return [row["id"] for row in inserted]
+
+def delete_rows(ids, batch_size=500):
+    for start in range(0, len(ids), batch_size):
+        supabase.table(TABLE).delete().in_("id", ids[start:start + batch_size]).execute()
+
+def stored_chunks(title, page_size=1000):
+    """(id, content) of the rows already in the table for a file, in id order."""
+    rows, start = [], 0
+    while True:
+        page = (
+            supabase.table(TABLE)
+            .select("id,content")
+            .eq("title", title)
+            .order("id")
+            .range(start, start + page_size - 1)
+            .execute()
+            .data
+        )
+        rows.extend((row["id"], row["content"]) for row in page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
 # --------- MAIN PIPELINE ---------
-def process_pdfs():
-    for filename in os.listdir(PDF_DIR):
-        if filename.endswith(".pdf"):
-            path = os.path.join(PDF_DIR, filename)
-            print(f"📄 Processing {filename}...")
-
-            text = extract_text_from_pdf(path)
-            chunks = chunk_text(text)
-
-            for i, chunk in enumerate(chunks[730:], start=730):
-                embedding = get_embedding(chunk)
-                insert_into_supabase(chunk, embedding, filename)
-                print(f"✅ Inserted chunk {i+1}/{len(chunks)}")
-
-                if (i + 1) % 90 == 0:
-                    print("⏳ Hit 90 embeddings — waiting 60 seconds to avoid rate limit...")
-                    time.sleep(60)
+class RateLimiter:
+    """Waits a minute after every EMBEDS_PER_MINUTE embeddings."""
+
+    def __init__(self):
+        self.count = 0
+
+    def embedded(self):
+        self.count += 1
+        if self.count % EMBEDS_PER_MINUTE == 0:
+            print(f"⏳ Hit {EMBEDS_PER_MINUTE} embeddings — waiting 60 seconds to avoid rate limit...")
+            time.sleep(60)
+
+def ingest_file(manifest, filename, path, sha256, limiter, dry_run=False, batch_size=50):
+    """
+    Bring the rows of one PDF up to date: reuse the rows of chunks that did
+    not change, embed and insert the new ones, and delete the rest.
+
+    Returns:
+        (chunks reused, chunks inserted, rows deleted)
+    """
+    entry = manifest.files.get(filename)
+    if entry is not None:
+        previous = [(chunk["id"], chunk["hash"]) for chunk in entry["chunks"]]
+    else:
+        # Not in the manifest yet: match against whatever the table already has for it
+        previous = [(row_id, chunk_hash(content, EMBED_MODEL, EMBED_DIM))
+                    for row_id, content in stored_chunks(filename)]
+    available = {}
+    for row_id, digest in previous:
+        available.setdefault(digest, []).append(row_id)
+
+    chunks = chunk_text(extract_text_from_pdf(path), CHUNK_SIZE)
+    hashes = [chunk_hash(chunk, EMBED_MODEL, EMBED_DIM) for chunk in chunks]
+    ids = [available[digest].pop(0) if available.get(digest) else None for digest in hashes]
+    stale = [row_id for row_ids in available.values() for row_id in row_ids]
+    missing = [i for i, row_id in enumerate(ids) if row_id is None]
+
+    if dry_run:
+        return len(chunks) - len(missing), len(missing), len(stale)
+
+    def save(sha256=None):
+        # Until the file is done, list every row that belongs to it, so a rerun can reuse or delete them
+        if sha256 is None:
+            done = [{"hash": hashes[i], "id": row_id} for i, row_id in enumerate(ids) if row_id is not None]
+            leftover = [{"hash": "", "id": row_id} for row_id in stale]
+            manifest.set_file(filename, None, done + leftover)
+        else:
+            manifest.set_file(filename, sha256, [{"hash": digest, "id": row_id} for digest, row_id in zip(hashes, ids)])
+        manifest.save()
+
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        rows = []
+        for i in batch:
+            rows.append({"title": filename, "content": chunks[i], "embedding": safe_get_embedding(chunks[i])})
+            limiter.embedded()
+        for i, row_id in zip(batch, insert_batch(rows)):
+            ids[i] = row_id
+        save()
+        print(f"✅ Inserted chunks {start + 1}-{start + len(batch)} of {len(missing)} new in {filename}")
+
+    if stale:
+        delete_rows(stale)
+        print(f"🗑️ Deleted {len(stale)} stale rows of {filename}")
+    save(sha256)
+    return len(chunks) - len(missing), len(missing), len(stale)
+
+def process_pdfs(pdf_dir=PDF_DIR, manifest_path=DEFAULT_MANIFEST, prune=False, dry_run=False):
+    """
+    Ingest the PDFs in a directory, doing only the work their changes need.
+    Unchanged files are skipped by hash without being read, so rerunning on
+    an unchanged directory makes no API calls.
+
+    Args:
+        pdf_dir: Directory of statute PDFs
+        manifest_path: Where the state of the table is kept
+        prune: Also delete the rows of files that are no longer in the directory
+        dry_run: Only print what would change
+    """
+    start = time.perf_counter()
+    manifest = IngestManifest(manifest_path, EMBED_MODEL, EMBED_DIM, CHUNK_SIZE)
+    limiter = RateLimiter()
+    totals = {"skipped": 0, "reused": 0, "inserted": 0, "deleted": 0}
+
+    filenames = sorted(filename for filename in os.listdir(pdf_dir) if filename.endswith(".pdf"))
+    for filename in filenames:
+        path = os.path.join(pdf_dir, filename)
+        sha256 = file_hash(path)
+        if manifest.is_current(filename, sha256):
+            totals["skipped"] += 1
+            continue
+
+        print(f"📄 Processing {filename}...")
+        reused, inserted, deleted = ingest_file(manifest, filename, path, sha256, limiter, dry_run)
+        print(f"{'🔎 Would change' if dry_run else '✅ Updated'} {filename}: "
+              f"{reused} unchanged, {inserted} new, {deleted} stale")
+        totals["reused"] += reused
+        totals["inserted"] += inserted
+        totals["deleted"] += deleted
+
+    removed = [name for name in manifest.files if name not in filenames]
+    for filename in removed:
+        row_ids = [chunk["id"] for chunk in manifest.files[filename]["chunks"]]
+        if not prune:
+            print(f"⚠️ {filename} is no longer in {pdf_dir}, its {len(row_ids)} rows are kept (use --prune to delete them)")
+            continue
+        print(f"🗑️ {'Would delete' if dry_run else 'Deleting'} {len(row_ids)} rows of removed file {filename}")
+        totals["deleted"] += len(row_ids)
+        if not dry_run:
+            delete_rows(row_ids)
+            manifest.remove_file(filename)
+            manifest.save()
+
+    print(f"{'Dry run' if dry_run else 'Done'} in {time.perf_counter() - start:.1f}s: "
+          f"{totals['skipped']} files unchanged, {totals['reused']} chunks reused, "
+          f"{totals['inserted']} embedded, {totals['deleted']} rows deleted")
+    return totals
     
 def search_similar(query):
     query_embedding = safe_get_embedding(query)
@@ -107,6 +248,11 @@ def search_similar(query):
     return response.data
 
 if __name__ == "__main__":
-    #process_pdfs()
-    print("All PDFs processed and stored in Supabase!")
+    parser = argparse.ArgumentParser(description=f"Embed the statute PDFs into the {TABLE} table, re-doing only what changed")
+    parser.add_argument("--pdf-dir", default=PDF_DIR, help="directory of statute PDFs")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="state of the table, kept between runs")
+    parser.add_argument("--prune", action="store_true", help="delete the rows of PDFs no longer in the directory")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would change")
+    args = parser.parse_args()
+    process_pdfs(args.pdf_dir, args.manifest, args.prune, args.dry_run)
     #search_similar("Sam, a retail worker, discovers schedules consistently exceed 8 hours/day without overtime pay. Sam needs a clear pathway to document hours, understand entitlements, and pursue a low-friction remedy.")
\ No newline at end of file
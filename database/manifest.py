@@ -0,0 +1,111 @@
+"""
+Ingestion manifest: what is stored in the bc_laws table for each statute PDF.
+
+    {
+      "version": 1,
+      "embedding": {"model": "gemini-embedding-001", "dimensions": 1536},
+      "chunk_size": 1000,
+      "files": {
+        "<file name>": {
+          "sha256": "<hash of the PDF>",
+          "chunks": [{"hash": "<hash of the chunk>", "id": <row id>}, ...]
+        }
+      }
+    }
+
+Chunks are listed in document order. A file whose sha256 is null was cut off
+part way through ingestion; its chunks are still all rows that belong to it.
+
+ingest.py diffs the PDFs against this file, and snapshot.py reads chunk
+positions from it.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST = "ingest_manifest.json"
+
+
+def file_hash(path, block_size=1 << 20):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def chunk_hash(content, model, dimensions):
+    """Hash of a chunk and how it is embedded, so changing the model re-embeds everything."""
+    return hashlib.sha256(f"{model}:{dimensions}:{content}".encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    def __init__(self, path=DEFAULT_MANIFEST, model=None, dimensions=None, chunk_size=None):
+        self.path = path
+        self.data = {
+            "version": MANIFEST_VERSION,
+            "embedding": {"model": model, "dimensions": dimensions},
+            "chunk_size": chunk_size,
+            "files": {},
+        }
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"{path} is manifest version {stored.get('version')}, expected {MANIFEST_VERSION}")
+            self.data["files"] = stored.get("files", {})
+            # Different settings make every file out of date, while its rows
+            # stay listed so they can be replaced
+            if stored.get("embedding") != self.data["embedding"] or stored.get("chunk_size") != chunk_size:
+                for entry in self.files.values():
+                    entry["sha256"] = None
+
+    @classmethod
+    def read(cls, path=DEFAULT_MANIFEST):
+        """
+        Load a manifest with the settings it was written with, so no entry is
+        marked out of date. For reading it, not for ingesting against it.
+        """
+        with open(path, encoding="utf-8") as f:
+            stored = json.load(f)
+        embedding = stored.get("embedding") or {}
+        return cls(path, embedding.get("model"), embedding.get("dimensions"), stored.get("chunk_size"))
+
+    @property
+    def files(self):
+        return self.data["files"]
+
+    def is_current(self, name, sha256):
+        """Whether a file was fully ingested from exactly this content with the current settings."""
+        entry = self.files.get(name)
+        return entry is not None and entry["sha256"] == sha256
+
+    def set_file(self, name, sha256, chunks):
+        """
+        Args:
+            name: File name, also the row title
+            sha256: Hash of the PDF, None while it is still being ingested
+            chunks: List of {"hash", "id"} in document order
+        """
+        self.files[name] = {"sha256": sha256, "chunks": chunks}
+
+    def remove_file(self, name):
+        self.files.pop(name, None)
+
+    def chunk_positions(self):
+        """{row id: (file name, chunk index)} of every fully ingested file."""
+        return {
+            chunk["id"]: (name, index)
+            for name, entry in self.files.items() if entry["sha256"]
+            for index, chunk in enumerate(entry["chunks"])
+        }
+
+    def save(self):
+        # Write then rename, so an interrupted run never leaves half a manifest
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,145 @@
+"""
+Snapshot export/import for the bc_laws table.
+
+Usage (from database/):
+    python snapshot.py export                      # writes snapshots/bc_laws-<version>/
+    python snapshot.py export --out /data/snapshots
+    python snapshot.py verify snapshots/bc_laws-<version>
+    python snapshot.py import snapshots/bc_laws-<version>
+
+Point the backend at a snapshot with RETRIEVAL_SNAPSHOT=<snapshot dir> to
+search it locally instead of calling Supabase.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from services.corpus_snapshot import CorpusSnapshot, write_snapshot
+from manifest import DEFAULT_MANIFEST, IngestManifest
+
+TABLE = "bc_laws"
+
+
+def _parse_embedding(value):
+    # pgvector columns come back from PostgREST as a "[0.1,0.2,...]" string
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def fetch_rows(page_size=1000):
+    """Read every row of the table, in id order, a page at a time."""
+    from config import supabase
+
+    start = 0
+    while True:
+        page = (
+            supabase.table(TABLE)
+            .select("id,title,content,embedding")
+            .order("id")
+            .range(start, start + page_size - 1)
+            .execute()
+            .data
+        )
+        yield from page
+        if len(page) < page_size:
+            return
+        start += page_size
+
+
+def export_snapshot(out_dir, page_size=1000, manifest_path=DEFAULT_MANIFEST):
+    import numpy as np
+
+    # Re-ingested chunks are appended, so take positions from the ingestion manifest when there is one
+    positions = IngestManifest.read(manifest_path).chunk_positions() if os.path.exists(manifest_path) else {}
+    rows, embeddings = [], []
+    chunk_counts = {}
+    for row in fetch_rows(page_size):
+        # Otherwise chunks were inserted in document order, so id order gives their position
+        chunk_index = chunk_counts.get(row["title"], 0)
+        chunk_counts[row["title"]] = chunk_index + 1
+        if row["id"] in positions:
+            chunk_index = positions[row["id"]][1]
+        rows.append({
+            "id": row["id"],
+            "title": row["title"],
+            "chunk_index": chunk_index,
+            "content": row["content"],
+        })
+        embeddings.append(_parse_embedding(row["embedding"]))
+        if len(rows) % page_size == 0:
+            print(f"📥 Read {len(rows)} rows...")
+
+    path = write_snapshot(rows, np.asarray(embeddings, dtype=np.float32), out_dir, table=TABLE)
+    if positions:
+        check_positions(path, positions)
+    print(f"✅ Exported {len(rows)} rows from {len(chunk_counts)} documents to {path}")
+    return path
+
+
+def check_positions(path, positions):
+    """Check that the written snapshot puts every chunk the manifest knows where the manifest does."""
+    written = {row["id"]: (row["title"], row["chunk_index"]) for row in CorpusSnapshot(path).to_rows()}
+    found = [row_id for row_id in positions if row_id in written]
+    if not found:
+        print("⚠️ No row of the table is in the ingestion manifest, chunk positions follow id order")
+    wrong = [row_id for row_id in found if written[row_id] != tuple(positions[row_id])]
+    if wrong:
+        raise ValueError(f"{len(wrong)} rows of {path} are not at their manifest position, e.g. id {wrong[0]}")
+
+
+def import_snapshot(path, batch_size=500):
+    from config import supabase
+
+    snapshot = CorpusSnapshot(path, verify=True)
+    rows = snapshot.to_rows()
+    for start in range(0, len(rows), batch_size):
+        batch = [
+            {
+                "title": row["title"],
+                "content": row["content"],
+                "embedding": snapshot.embeddings[start + i].tolist(),
+            }
+            for i, row in enumerate(rows[start:start + batch_size])
+        ]
+        supabase.table(TABLE).insert(batch).execute()
+        print(f"✅ Inserted rows {start + 1}-{start + len(batch)} of {len(rows)}")
+    print(f"Imported snapshot {snapshot.version} into {TABLE}")
+
+
+def verify_snapshot(path):
+    start = time.perf_counter()
+    snapshot = CorpusSnapshot(path, verify=True)
+    print(f"✅ Snapshot {snapshot.version}: {len(snapshot)} rows, "
+          f"{snapshot.manifest['dimensions']} dimensions, verified in {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Export, verify and import {TABLE} snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export", help=f"write the {TABLE} table to a snapshot")
+    export_cmd.add_argument("--out", default="snapshots", help="directory to put the snapshot in")
+    export_cmd.add_argument("--page-size", type=int, default=1000, help="rows read per request")
+    export_cmd.add_argument("--manifest", default=DEFAULT_MANIFEST, help="ingestion manifest to take chunk positions from")
+
+    verify_cmd = commands.add_parser("verify", help="check a snapshot against its manifest")
+    verify_cmd.add_argument("path")
+
+    import_cmd = commands.add_parser("import", help=f"insert a snapshot's rows into the {TABLE} table")
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--batch-size", type=int, default=500, help="rows inserted per request")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_snapshot(args.out, args.page_size, args.manifest)
+    elif args.command == "verify":
+        verify_snapshot(args.path)
+    else:
+        import_snapshot(args.path, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import { Send, Scale, FileText, AlertCircle, Paperclip, X } from 'lucide-react';
 
 export default function App() {
   const messageIdRef = useRef(1);
+  // Identifies this conversation to the backend, so any server worker can continue it
+  const sessionIdRef = useRef(crypto.randomUUID());
   const [messages, setMessages] = useState([
     {
       id: messageIdRef.current++,
@@ -50,6 +52,7 @@ export default function App() {
         attachedFiles.forEach(file => {
           formData.append('file', file);
         });
+        formData.append('session_id', sessionIdRef.current);
 
         const uploadResponse = await fetch('http://localhost:8000/upload', {
           method: 'POST',
@@ -100,7 +103,8 @@ export default function App() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ message: userInput })
+        // PDFs come back as download links rather than base64 inside the reply
+        body: JSON.stringify({ message: userInput, session_id: sessionIdRef.current, artifacts: 'url' })
       });
 
       if (!response.ok) throw new Error('Network response was not ok');
@@ -109,13 +113,7 @@ export default function App() {
       console.log(data)
       let pdfUrls
       if (data.pdfs) {
-        pdfUrls = data.pdfs.map(pdf => {
-            const blob = new Blob(
-            [Uint8Array.from(atob(pdf.pdf_base64), c => c.charCodeAt(0))],
-            { type: "application/pdf" }
-            );
-            return { url: URL.createObjectURL(blob), filename: pdf.filename };
-        });
+        pdfUrls = data.pdfs.map(pdf => ({ url: `http://localhost:8000${pdf.url}`, filename: pdf.filename }));
       }
 
       const botResponse = {
@@ -148,6 +146,23 @@ export default function App() {
     }
   };
 
+  // Follows a background job's progress events until it finishes
+  const waitForJob = (jobId) => new Promise((resolve, reject) => {
+    const events = new EventSource(`http://localhost:8000/jobs/${jobId}/events`);
+    events.addEventListener('done', (e) => {
+      events.close();
+      resolve(JSON.parse(e.data).result);
+    });
+    events.addEventListener('failed', (e) => {
+      events.close();
+      reject(new Error(JSON.parse(e.data).error));
+    });
+    events.onerror = () => {
+      events.close();
+      reject(new Error('Lost connection to the job'));
+    };
+  });
+
   const handleConfirmReport = async (messageId, confirmed) => {
     try {
       // Mark the original message as confirmed
@@ -182,12 +197,14 @@ export default function App() {
               headers: {
                 'Content-Type': 'application/json',
               },
-              body: JSON.stringify({ message: latestMessage })
+              body: JSON.stringify({ message: latestMessage, session_id: sessionIdRef.current })
             });
       
             if (!response.ok) throw new Error('Network response was not ok');
       
-            const data = await response.json();
+            const job = await response.json();
+            // The report is finalised in the background, wait for the job's result
+            const data = await waitForJob(job.job_id);
             console.log(data)
       
             const botResponse = {